@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark against local fake WooCommerce and Anthropic servers
+Runs the real catalog scan, classification and push code at several catalog
+sizes and reports products/sec, latency percentiles and request counts per stage
+
+Nothing leaves the machine: both APIs are served by fake_woocommerce.py and
+fake_anthropic.py on localhost, with configurable latency and error rates.
+Settings that main.py reads at import time (concurrency, rate limits) are
+set from the command line before it is imported.
+
+Usage:
+    python benchmark.py --sizes 1000,10000,100000
+    python benchmark.py --sizes 500 --claude-latency 0.8 --claude-error-rate 0.02 --json results.json
+    python benchmark.py --sizes 500 --claude-rpm 1200 --adaptive --concurrency 32
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the classification pipeline against local fake APIs')
+    parser.add_argument('--sizes', default='1000,10000', help='Comma-separated catalog sizes to run')
+    parser.add_argument('--families', type=int, default=0,
+                        help='Group products into this many families of near-copies (0 = all distinct)')
+    parser.add_argument('--woo-latency', type=float, default=0.02, help='Seconds added to every WooCommerce response')
+    parser.add_argument('--woo-error-rate', type=float, default=0.0, help='Share of WooCommerce requests answered with 429')
+    parser.add_argument('--woo-rps', type=float, default=0, help='WooCommerce requests per second (0 = unlimited)')
+    parser.add_argument('--claude-latency', type=float, default=0.05, help='Mean seconds per Claude reply')
+    parser.add_argument('--claude-error-rate', type=float, default=0.0, help='Share of Claude requests answered with 429/529')
+    parser.add_argument('--claude-rpm', type=float, default=0,
+                        help='Requests per minute the fake Claude API allows, with rate-limit headers (0 = unlimited)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel Claude calls (MAX_CONCURRENCY)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Let rate-limit feedback set concurrency and pacing (ADAPTIVE_CONCURRENCY)')
+    parser.add_argument('--requests-per-minute', type=float, default=100000, help='Claude rate limit (REQUESTS_PER_MINUTE)')
+    parser.add_argument('--rate-limit-delay', type=float, default=0.0,
+                        help='Pause between sequential calls (RATE_LIMIT_DELAY, used with --concurrency 1)')
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+    parser.add_argument('--verbose', action='store_true', help='Keep per-product log lines')
+    return parser.parse_args()
+
+
+def configure_environment(args, anthropic_port: int):
+    """Point main.py at the fake APIs; must run before main is imported"""
+    os.environ.update({
+        'ANTHROPIC_BASE_URL': f"http://127.0.0.1:{anthropic_port}",
+        'ANTHROPIC_API_KEY': 'sk-bench',
+        'MAX_CONCURRENCY': str(args.concurrency),
+        'ADAPTIVE_CONCURRENCY': 'true' if args.adaptive else 'false',
+        'REQUESTS_PER_MINUTE': str(args.requests_per_minute),
+        'RATE_LIMIT_DELAY': str(args.rate_limit_delay),
+        'WOO_REQUESTS_PER_SECOND': str(args.woo_rps),
+        'WOO_BACKOFF': '0.1',
+    })
+    os.environ.setdefault('METRICS_DIR', '')  # Stage timings are reported below instead
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {'p50_ms': round(float(p50) * 1000, 1), 'p95_ms': round(float(p95) * 1000, 1)}
+
+
+def start(server) -> threading.Thread:
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+class Stage:
+    """Times one stage and collects the request counts and latencies it caused"""
+
+    def __init__(self, name: str, products: int, woo_server, claude_server, woo_latencies: List[float]):
+        self.name = name
+        self.products = products
+        self.servers = {'woo': woo_server.state, 'claude': claude_server.state}
+        self.woo_latencies = woo_latencies
+
+    def __enter__(self):
+        self.requests_before = {key: sum(state.requests.values()) for key, state in self.servers.items()}
+        self.latencies_before = len(self.woo_latencies)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.requests = {key: sum(state.requests.values()) - self.requests_before[key]
+                         for key, state in self.servers.items()}
+        self.latencies = self.woo_latencies[self.latencies_before:]
+
+    def result(self, **extra) -> Dict:
+        return {
+            'stage': self.name,
+            'products': self.products,
+            'seconds': round(self.seconds, 2),
+            'products_per_sec': round(self.products / self.seconds, 1) if self.seconds else None,
+            'woo_requests': self.requests['woo'],
+            'claude_requests': self.requests['claude'],
+            'woo_latency': percentiles(self.latencies),
+            **extra
+        }
+
+
+def run_size(size: int, args, claude_port: int) -> List[Dict]:
+    """Scan, classify and push a fresh synthetic catalog of `size` products"""
+    import fake_anthropic
+    import fake_woocommerce
+    from main import WooCommerceHTSMatcher, WooConfig
+    from metrics import metrics
+
+    woo_server = fake_woocommerce.make_server(0, size, args.woo_latency, args.woo_error_rate, args.families)
+    claude_server = fake_anthropic.make_server(claude_port, 0, args.claude_latency, args.claude_error_rate,
+                                               rpm=args.claude_rpm)
+    start(woo_server)
+    start(claude_server)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        config = WooConfig(f"http://127.0.0.1:{woo_server.server_address[1]}", 'ck_bench', 'cs_bench', 'sk-bench')
+        matcher = WooCommerceHTSMatcher(config, db_path)
+
+        woo_latencies = []
+        matcher.woo.session.hooks['response'].append(
+            lambda response, *a, **kw: woo_latencies.append(response.elapsed.total_seconds())
+        )
+
+        def stage(name: str, products: int) -> Stage:
+            return Stage(name, products, woo_server, claude_server, woo_latencies)
+
+        with stage('fetch', size) as fetch:
+            products = matcher.fetch_all_products()
+
+        with stage('classify', len(products)) as classify:
+            matcher.process_products(products)
+            matcher.flush_writes()
+        stage_times = metrics.summary()['stages']
+
+        with sqlite3.connect(db_path) as db:
+            claude_latencies = [row[0] for row in db.execute(
+                'SELECT latency FROM processing_log WHERE api_calls > 0 AND latency IS NOT NULL')]
+            fallbacks = db.execute("SELECT COUNT(*) FROM product_matches WHERE hts_code = '9999.99.9999'").fetchone()[0]
+            approved = db.execute("SELECT COUNT(*) FROM product_matches WHERE status = 'approved'").fetchone()[0]
+
+        with stage('push', approved) as push:
+            matcher.bulk_update_approved(dry_run=False)
+
+        matcher.hts_db.close()
+
+    woo_server.shutdown()
+    claude_server.shutdown()
+    woo_server.server_close()
+    claude_server.server_close()
+
+    return [
+        fetch.result(size=size),
+        classify.result(size=size, claude_latency=percentiles(claude_latencies), fallbacks=fallbacks,
+                        stages=stage_times),
+        push.result(size=size, pushed=len(woo_server.state.updates)),
+    ]
+
+
+def print_results(results: List[Dict]):
+    print(f"\n{'size':>8} {'stage':<9} {'products':>9} {'seconds':>9} {'prod/s':>9} "
+          f"{'woo req':>8} {'claude req':>10} {'woo p50/p95 ms':>16} {'claude p50/p95 ms':>18}")
+    for r in results:
+        woo = r['woo_latency']
+        claude = r.get('claude_latency') or {}
+        woo_ms = f"{woo['p50_ms']}/{woo['p95_ms']}" if woo['p50_ms'] is not None else '-'
+        claude_ms = f"{claude['p50_ms']}/{claude['p95_ms']}" if claude.get('p50_ms') is not None else '-'
+        print(f"{r['size']:>8} {r['stage']:<9} {r['products']:>9} {r['seconds']:>9} "
+              f"{r['products_per_sec'] or '-':>9} {r['woo_requests']:>8} {r['claude_requests']:>10} "
+              f"{woo_ms:>16} {claude_ms:>18}")
+        for name, s in sorted((r.get('stages') or {}).items(), key=lambda item: -item[1]['total_seconds']):
+            print(f"{'':>8}   {name:<14} {s['count']:>7} × {s['mean_ms']:>8.2f}ms "
+                  f"(p50 {s['p50_ms']:.2f}ms, p95 {s['p95_ms']:.2f}ms) = {s['total_seconds']:.2f}s")
+        if r.get('fallbacks'):
+            print(f"{'':>8} {'':<9} {r['fallbacks']} products fell back to 9999.99.9999 after API errors")
+
+
+def main():
+    args = parse_args()
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    # One fixed port for the fake Anthropic API, since the SDK reads the base URL from the environment
+    import fake_anthropic
+    probe = fake_anthropic.make_server(0)
+    claude_port = probe.server_address[1]
+    probe.server_close()
+    configure_environment(args, claude_port)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, force=True)
+    import main as pipeline  # noqa: F401 - imported after the environment is set
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    for size in sizes:
+        print(f"Benchmarking {size} products...")
+        results.extend(run_size(size, args, claude_port))
+
+    print_results(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
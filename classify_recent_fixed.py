@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 """
-Quick classifier for RECENT products only (checks first 3 pages)
+Quick classifier for RECENT products only (new or edited since the last sync)
 Fixed version that only pushes NEW classifications
+
+Pass --full to rescan the whole catalog instead of only modified products.
 """
 
 from main import WooCommerceHTSMatcher, WooConfig
 import logging
+import sys
 
 # Import configuration
 try:
@@ -50,23 +53,21 @@ def main():
     before_summary = matcher.get_match_summary()
     print(f"Current database: {before_summary['total']} products already classified")
     
-    print("\nChecking first 3 pages for new products (newest first)...")
+    print("\nChecking for products added or edited since the last sync...")
     
-    # Fetch ONLY from first 3 pages with the new max_pages parameter
-    unprocessed_products = matcher.fetch_all_products(
-        skip_processed=True,
-        max_pages=3  # Only check first 3 pages
+    # Only products modified after the stored high-water mark are fetched,
+    # and only those whose classification inputs changed are returned
+    unprocessed_products, high_water_mark = matcher.fetch_changed_products(
+        full_scan='--full' in sys.argv
     )
     
     if not unprocessed_products:
-        print("\n✓ No new products found in recent pages!")
+        matcher.commit_sync(high_water_mark)
+        print("\n✓ No new or changed products since the last sync!")
         print("All recent products already have HTS codes.")
         return
     
-    # Track the product IDs we're about to process
-    new_product_ids = [p['id'] for p in unprocessed_products]
-    
-    print(f"\n✓ Found {len(unprocessed_products)} new products to classify")
+    print(f"\n✓ Found {len(unprocessed_products)} new or changed products to classify")
     
     # Show the products
     print("\nProducts to classify:")
@@ -75,11 +76,10 @@ def main():
         if product.get('sku'):
             print(f"      SKU: {product['sku']}")
     
-    # Quick estimate
+    # Quick estimate from recently logged API usage
     if len(unprocessed_products) > 0:
-        est_cost = len(unprocessed_products) * 0.003  # Rough estimate
-        est_time = len(unprocessed_products) * 1.5 / 60  # Minutes
-        print(f"\nEstimated: ~${est_cost:.2f} / ~{est_time:.1f} minutes")
+        cost_est = matcher.get_processing_cost_estimate(len(unprocessed_products))
+        print(f"\nEstimated: ~${cost_est['estimated_cost_usd']:.2f} / ~{cost_est['estimated_time_minutes']:.1f} minutes")
     
     # Confirm
     confirm = input(f"\nProcess these {len(unprocessed_products)} products? (y/n): ")
@@ -91,44 +91,38 @@ def main():
     print("\nProcessing...")
     results = matcher.process_products(unprocessed_products)
     
-    # Get AFTER stats
-    after_summary = matcher.get_match_summary()
+    # Only advance the high-water mark once the products are saved
+    matcher.commit_sync(high_water_mark)
     
-    # Calculate what's NEW
-    newly_classified = after_summary['total'] - before_summary['total']
-    newly_approved = after_summary['approved'] - before_summary['approved']
-    newly_pending = (after_summary['pending'] + after_summary['needs_manual']) - (before_summary['pending'] + before_summary['needs_manual'])
+    # Count what THIS run classified (edited products were already in the database,
+    # so before/after totals would undercount them)
+    approved = [r for r in results if r['status'] == 'approved']
+    needs_review = len(results) - len(approved)
     
     print(f"\n✓ Classification complete!")
-    print(f"  NEW products classified: {newly_classified}")
-    print(f"  NEW auto-approved: {newly_approved}")
-    print(f"  NEW needing review: {newly_pending}")
+    print(f"  NEW/changed products classified: {len(results)}")
+    print(f"  NEW auto-approved: {len(approved)}")
+    print(f"  NEW needing review: {needs_review}")
     
     # Push ONLY the new products to WooCommerce
-    if newly_approved > 0:
-        print(f"\nReady to push {newly_approved} NEWLY approved codes to WooCommerce")
-        print("(This will only update the products just classified, not all 4885)")
-        push = input(f"\nPush these {newly_approved} NEW codes to WooCommerce? (y/n): ")
+    if approved:
+        print(f"\nReady to push {len(approved)} NEWLY approved codes to WooCommerce")
+        print(f"(This will only update the products just classified, not all {before_summary['total']})")
+        push = input(f"\nPush these {len(approved)} NEW codes to WooCommerce? (y/n): ")
         
         if push.lower() == 'y':
             # Update only the newly processed products
-            success_count = 0
-            for product_id in new_product_ids:
-                cursor = matcher.hts_db.cursor()
-                cursor.execute("""
-                    SELECT hts_code, confidence 
-                    FROM product_matches 
-                    WHERE product_id = ? AND status = 'approved'
-                """, (product_id,))
-                result = cursor.fetchone()
-                
-                if result:
-                    hts_code, confidence = result
-                    if matcher.update_product_hts(product_id, hts_code, confidence):
-                        success_count += 1
-                        print(f"  ✓ Updated product {product_id}")
+            codes = [(r['product_id'], r['hts_code'], r['confidence']) for r in approved]
+            
+            # Push in batches of up to 100 products per request
+            succeeded, failed = matcher.push_hts_codes(codes)
+            for product_id, _, _ in codes:
+                if product_id in succeeded:
+                    print(f"  ✓ Updated product {product_id}")
+                else:
+                    print(f"  ✗ Failed to update product {product_id}: {failed.get(product_id, 'unknown error')}")
             
-            print(f"\n✓ Successfully pushed {success_count} new products to WooCommerce")
+            print(f"\n✓ Successfully pushed {len(succeeded)} new products to WooCommerce")
     else:
         print("\nNo new products were auto-approved (may need manual review)")
 
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Non-interactive command line for classifying, pushing, exporting and syncing
+Safe for cron: nothing prompts, no TTY is needed, and the exit status is 1
+when any product fails to push
+
+Startup only loads the standard library and the local database modules.
+main.py (the Anthropic SDK, numpy) is imported by the commands that classify
+and requests by the commands that talk to WooCommerce, so a push with
+nothing to do finishes in tens of milliseconds. `startup` checks the import
+time against CLI_IMPORT_BUDGET_MS.
+
+Usage:
+    python cli.py classify --limit 50 --push   # classify unprocessed products
+    python cli.py sync --push                  # products added or edited since the last sync
+    python cli.py push --hours 2               # approved codes from the last 2 hours
+    python cli.py export --output matches.csv
+    python cli.py summary --json
+    python cli.py startup                      # measure import time
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from db_writer import connect
+from matches import approved_matches, export_matches, match_summary
+from schema import migrate
+
+logger = logging.getLogger(__name__)
+
+CLI_IMPORT_BUDGET_MS = float(os.getenv('CLI_IMPORT_BUDGET_MS', 50))  # Import time allowed on top of interpreter startup
+
+# Must never be imported just to parse arguments or read the database
+HEAVY_MODULES = ('pandas', 'numpy', 'anthropic', 'requests', 'main')
+
+
+def load_settings() -> Dict:
+    """Credentials and database path from config.py, else .env / environment variables"""
+    try:
+        import config
+        return {
+            'SITE_URL': config.SITE_URL,
+            'WOO_CONSUMER_KEY': config.WOO_CONSUMER_KEY,
+            'WOO_CONSUMER_SECRET': config.WOO_CONSUMER_SECRET,
+            'DATABASE_PATH': config.DATABASE_PATH
+        }
+    except ImportError:
+        from dotenv import load_dotenv
+        load_dotenv()
+        return {
+            'SITE_URL': os.getenv('SITE_URL'),
+            'WOO_CONSUMER_KEY': os.getenv('WOO_CONSUMER_KEY'),
+            'WOO_CONSUMER_SECRET': os.getenv('WOO_CONSUMER_SECRET'),
+            'DATABASE_PATH': os.getenv('DATABASE_PATH', 'hts_codes.db')
+        }
+
+
+def open_db(settings: Dict) -> sqlite3.Connection:
+    # WAL and a busy timeout, so reads don't fail while worker processes write;
+    # upgrade older schemas so timestamps compare correctly
+    db = connect(settings['DATABASE_PATH'])
+    migrate(db)
+    return db
+
+
+def make_matcher():
+    from main import (WooCommerceHTSMatcher, WooConfig, SITE_URL, WOO_CONSUMER_KEY, WOO_CONSUMER_SECRET,
+                      ANTHROPIC_API_KEY, DATABASE_PATH)
+    config = WooConfig(SITE_URL, WOO_CONSUMER_KEY, WOO_CONSUMER_SECRET, ANTHROPIC_API_KEY)
+    return WooCommerceHTSMatcher(config, hts_db_path=DATABASE_PATH)
+
+
+def report_results(matcher, results: List[Dict], push: bool) -> int:
+    """Print what a classification run did and optionally push its approved codes; returns failed pushes"""
+    approved = [r for r in results if r['status'] == 'approved']
+    print(f"Classified {len(results)} products: {len(approved)} auto-approved, "
+          f"{len(results) - len(approved)} need review")
+    if not push or not approved:
+        return 0
+
+    # Only the products this run classified are pushed
+    succeeded, failed = matcher.push_hts_codes([(r['product_id'], r['hts_code'], r['confidence']) for r in approved])
+    print(f"Pushed {len(succeeded)} of {len(approved)} approved codes to WooCommerce")
+    for product_id, error in failed.items():
+        print(f"  ✗ Product {product_id}: {error}")
+    return len(failed)
+
+
+def cmd_classify(args) -> int:
+    matcher = make_matcher()
+    products = matcher.get_products_without_hts(limit=args.limit)
+    if not products:
+        print("No products without HTS codes")
+        return 0
+
+    print(f"Classifying {len(products)} products without HTS codes")
+    results = matcher.process_products(products, concurrency=args.concurrency)
+    matcher.flush_writes()
+    return 1 if report_results(matcher, results, args.push) else 0
+
+
+def cmd_sync(args) -> int:
+    matcher = make_matcher()
+    products, high_water_mark = matcher.fetch_changed_products(full_scan=args.full)
+    if products:
+        print(f"Classifying {len(products)} new or changed products")
+        results = matcher.process_products(products, concurrency=args.concurrency)
+    else:
+        results = []
+        print("No new or changed products since the last sync")
+
+    # Only advance the high-water mark once the products are saved
+    matcher.commit_sync(high_water_mark)
+    return 1 if results and report_results(matcher, results, args.push) else 0
+
+
+def cmd_push(args) -> int:
+    settings = load_settings()
+    db = open_db(settings)
+    since = None if args.all else datetime.now() - timedelta(hours=args.hours)
+    rows = approved_matches(db, since)
+    db.close()
+
+    period = "" if args.all else f" from the last {args.hours:g} hours"
+    if not rows:
+        print(f"No approved codes{period} to push")
+        return 0
+    if args.dry_run:
+        print(f"Would push {len(rows)} approved codes{period}:")
+        for product_id, name, hts_code, confidence, _ in rows:
+            print(f"  {product_id}: {(name or '')[:50]} → {hts_code} ({confidence:.0%})")
+        return 0
+
+    # requests is only needed once there is something to send
+    from woo_client import WooClient, hts_meta_data
+    woo = WooClient(settings['SITE_URL'], settings['WOO_CONSUMER_KEY'], settings['WOO_CONSUMER_SECRET'])
+    succeeded, failed = woo.batch_update_products([
+        {'id': product_id, 'meta_data': hts_meta_data(hts_code, confidence)}
+        for product_id, _, hts_code, confidence, _ in rows
+    ])
+
+    print(f"Pushed {len(succeeded)} of {len(rows)} approved codes{period}")
+    for product_id, error in failed.items():
+        print(f"  ✗ Product {product_id}: {error}")
+    return 1 if failed else 0
+
+
+def cmd_export(args) -> int:
+    filename = args.output or f"hts_matches_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    db = open_db(load_settings())
+    count = export_matches(db, filename)
+    db.close()
+    print(f"Exported {count} matches to {filename}")
+    return 0
+
+
+def cmd_summary(args) -> int:
+    db = open_db(load_settings())
+    summary = match_summary(db)
+    db.close()
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+    print(f"Total classified: {summary['total']}")
+    print(f"  Approved: {summary['approved']}")
+    print(f"  Pending review: {summary['pending']}")
+    print(f"  Needs manual: {summary['needs_manual']}")
+    print(f"  Rejected: {summary['rejected']}")
+    print(f"Average confidence: {summary['avg_confidence']:.1%}")
+    print(f"Unique HTS codes: {summary['unique_codes']}")
+    print(f"API calls (last 24h): {summary['api_calls_24h']}")
+    return 0
+
+
+def measure_startup(runs: int = 5) -> Tuple[float, List[str]]:
+    """Milliseconds `import cli` adds to interpreter startup (best of `runs`), and heavy modules it loaded"""
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = f"import sys, cli; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+
+    def best(code: str) -> Tuple[float, str]:
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True,
+                                    text=True, check=True).stdout
+            timings.append(time.perf_counter() - start)
+        return min(timings), output.strip()
+
+    baseline, _ = best('pass')
+    elapsed, loaded = best(probe)
+    return max(0.0, elapsed - baseline) * 1000, [m for m in loaded.split(',') if m]
+
+
+def cmd_startup(args) -> int:
+    import_ms, loaded = measure_startup(args.runs)
+    print(f"Import time: {import_ms:.1f}ms over interpreter startup (budget {CLI_IMPORT_BUDGET_MS:g}ms)")
+    if loaded:
+        print(f"✗ Heavy modules loaded at startup: {', '.join(loaded)}")
+    return 1 if loaded or import_ms > CLI_IMPORT_BUDGET_MS else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='HTS code matcher (non-interactive)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    classify = commands.add_parser('classify', help='Classify products that have no HTS code yet')
+    classify.add_argument('--limit', type=int, help='Products to fetch (default: all)')
+    classify.add_argument('--push', action='store_true', help='Push auto-approved codes from this run')
+    classify.add_argument('--concurrency', type=int, help='Claude calls in flight (default: MAX_CONCURRENCY)')
+    classify.set_defaults(func=cmd_classify)
+
+    sync = commands.add_parser('sync', help='Classify products added or edited since the last sync')
+    sync.add_argument('--full', action='store_true', help='Rescan the whole catalog')
+    sync.add_argument('--push', action='store_true', help='Push auto-approved codes from this run')
+    sync.add_argument('--concurrency', type=int, help='Claude calls in flight (default: MAX_CONCURRENCY)')
+    sync.set_defaults(func=cmd_sync)
+
+    push = commands.add_parser('push', help='Push approved codes from the local database to WooCommerce')
+    window = push.add_mutually_exclusive_group()
+    window.add_argument('--hours', type=float, default=24, help='Codes approved in the last N hours (default 24)')
+    window.add_argument('--all', action='store_true', help='Every approved code')
+    push.add_argument('--dry-run', action='store_true', help='List the codes without pushing')
+    push.set_defaults(func=cmd_push)
+
+    export = commands.add_parser('export', help='Export all matches to CSV')
+    export.add_argument('--output', help='CSV file (default: hts_matches_<timestamp>.csv)')
+    export.set_defaults(func=cmd_export)
+
+    summary = commands.add_parser('summary', help='Show match counts')
+    summary.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    summary.set_defaults(func=cmd_summary)
+
+    startup = commands.add_parser('startup', help='Check import time against CLI_IMPORT_BUDGET_MS')
+    startup.add_argument('--runs', type=int, default=5, help='Timed runs (the best one counts)')
+    startup.set_defaults(func=cmd_startup)
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+SQLite connection tuning and a write-behind buffer for per-product inserts
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from typing import List, Sequence, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# SQLite settings
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')       # WAL lets readers work during writes
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')      # NORMAL skips the fsync on every WAL commit
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))  # Page cache size (64 MB)
+DB_FLUSH_ROWS = int(os.getenv('DB_FLUSH_ROWS', 200))                # Buffered rows that trigger a flush
+DB_FLUSH_SECONDS = float(os.getenv('DB_FLUSH_SECONDS', 5))          # Max age of a buffered row before a flush
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 30))   # Seconds to wait for another process's write lock
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open a SQLite database with the journal, sync, cache and busy-timeout settings applied"""
+    # Worker processes share the database; wait for their write locks instead of failing
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT)
+
+    journal_mode = conn.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}").fetchone()[0]
+    if journal_mode.lower() != SQLITE_JOURNAL_MODE.lower():
+        # In-memory databases and some network filesystems can't use WAL
+        logger.warning(f"SQLite journal_mode {SQLITE_JOURNAL_MODE} unavailable, using {journal_mode}")
+
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class WriteBuffer:
+    """Collects INSERT/UPDATE statements and writes them in one transaction
+
+    Rows are flushed when DB_FLUSH_ROWS are pending or the oldest pending row
+    is DB_FLUSH_SECONDS old (checked on each add, so loops that can sit idle
+    must call flush() themselves), and whenever flush() or close() is called.
+    Rows are written in the order they were added (consecutive rows for the
+    same statement go through one executemany), so INSERT OR REPLACE still
+    lets the newest row win and an UPDATE sees the rows inserted before it.
+    Not thread-safe: use it from the thread that owns the connection.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, max_rows: int = None, max_seconds: float = None):
+        self.conn = conn
+        self.max_rows = max_rows or DB_FLUSH_ROWS
+        self.max_seconds = DB_FLUSH_SECONDS if max_seconds is None else max_seconds
+
+        self._pending: List[Tuple[str, List[Sequence]]] = []  # Runs of rows for one statement, in order
+        self._pending_rows = 0
+        self._oldest = None
+
+        # Totals for the session
+        self.rows_written = 0
+        self.flushes = 0
+
+    def __len__(self) -> int:
+        return self._pending_rows
+
+    def add(self, sql: str, params: Sequence):
+        """Queue one row, flushing if the buffer is full or old enough"""
+        if self._pending and self._pending[-1][0] == sql:
+            self._pending[-1][1].append(params)
+        else:
+            self._pending.append((sql, [params]))
+        self._pending_rows += 1
+        if self._oldest is None:
+            self._oldest = time.time()
+
+        if self._pending_rows >= self.max_rows or time.time() - self._oldest >= self.max_seconds:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every pending row in a single transaction
+
+        Returns the number of rows written. On error the transaction is rolled
+        back and the rows stay buffered so a later flush can retry them.
+        """
+        if not self._pending_rows:
+            return 0
+
+        with metrics.span('db_write'), self.conn:
+            for sql, rows in self._pending:
+                self.conn.executemany(sql, rows)
+
+        written = self._pending_rows
+        self._pending = []
+        self._pending_rows = 0
+        self._oldest = None
+
+        self.rows_written += written
+        self.flushes += 1
+        logger.debug(f"Flushed {written} buffered rows to SQLite")
+        return written
+
+    def close(self):
+        """Write any pending rows; call on every exit path so buffered rows aren't lost"""
+        self.flush()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Duplicate detection for product catalogs
+Groups products that should share one HTS classification (same SKU, identical
+text, or near-identical text via MinHash/LSH) so only one per group is sent to Claude
+"""
+
+import hashlib
+import re
+from typing import Dict, List
+
+# 61-bit Mersenne prime for the MinHash permutations
+_PRIME = (1 << 61) - 1
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def product_text(features: Dict) -> str:
+    """Normalized text used for fingerprinting a product"""
+    parts = [
+        features.get('name', ''),
+        features.get('description', '') or features.get('short_description', ''),
+        ' '.join(features.get('categories', [])),
+        features.get('attributes', '')
+    ]
+    return normalize_text(' '.join(p for p in parts if p))
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Word n-gram shingles of a normalized text"""
+    words = text.split()
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures with universal hash permutations"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        self.params = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(f"{seed}:{i}".encode(), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], 'big') % (_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], 'big') % _PRIME
+            self.params.append((a, b))
+
+    def signature(self, shingle_set: set) -> List[int]:
+        if not shingle_set:
+            return [_PRIME] * self.num_perm
+        values = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'big')
+                  for s in shingle_set]
+        return [min((a * v + b) % _PRIME for v in values) for a, b in self.params]
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        """Estimated Jaccard similarity of two signatures"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class ProductDeduplicator:
+    """Group duplicate products by SKU, exact text hash and MinHash LSH
+
+    Usage:
+        groups = ProductDeduplicator(threshold=0.9).group(features_list)
+
+    Returns a list of groups, each a list of indexes into features_list in
+    input order; the first index of each group is its representative.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+
+    def group(self, features_list: List[Dict]) -> List[List[int]]:
+        parent = list(range(len(features_list)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i, j):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                # Keep the earliest product as the root/representative
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        by_sku = {}
+        by_hash = {}
+        buckets = {}
+        signatures = []
+
+        for i, features in enumerate(features_list):
+            sku = (features.get('sku') or '').strip()
+            if sku:
+                union(i, by_sku.setdefault(sku, i))
+
+            text = product_text(features)
+            if not text:
+                signatures.append(None)
+                continue
+
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            union(i, by_hash.setdefault(digest, i))
+
+            signature = self.hasher.signature(shingles(text))
+            signatures.append(signature)
+
+            # Locality-sensitive hashing: products sharing any band are candidates
+            for band in range(self.bands):
+                key = (band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+                for j in buckets.setdefault(key, []):
+                    if find(i) != find(j) and MinHasher.similarity(signature, signatures[j]) >= self.threshold:
+                        union(i, j)
+                buckets[key].append(i)
+
+        groups = {}
+        for i in range(len(features_list)):
+            groups.setdefault(find(i), []).append(i)
+        return list(groups.values())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted text extraction from WooCommerce product HTML
+Strips markup incrementally and stops as soon as a product has enough text,
+so page-builder descriptions of several hundred KB cost no more than short ones
+
+Text is entity-decoded, page-builder shortcodes and store boilerplate
+(shipping, returns, "add to cart" blurbs) are dropped, sentences repeated
+within or across the description fields are kept once, and the result is
+trimmed to a token budget.
+"""
+
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Set, Tuple
+
+# Extraction settings
+EXTRACT_TOKEN_BUDGET = int(os.getenv('EXTRACT_TOKEN_BUDGET', 300))  # Description + short description tokens per product
+
+CHUNK_SIZE = 8192        # HTML characters fed to the parser at a time
+CHARS_PER_TOKEN_MAX = 8  # Stop parsing once this many characters per budget token are collected
+
+# Elements whose text is never product copy
+_SKIPPED_TAGS = {'script', 'style', 'noscript', 'svg', 'template', 'iframe', 'form', 'button', 'select'}
+# Elements that end a sentence-like block
+_BLOCK_TAGS = {'p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'td', 'th', 'table', 'section', 'article',
+               'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'dd', 'dt'}
+
+# WordPress shortcodes such as [vc_row el_class="x"] or [/et_pb_section]
+_SHORTCODE = re.compile(r'\[/?[a-zA-Z_][\w-]*(?:\s[^\]]*)?\]')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(])')
+
+# Store-wide copy that says nothing about what the product is. Only sentences
+# that open with one of these phrases are dropped, so product facts that
+# mention shipping or returns ("Shipping weight: 2 kg") are kept.
+_BOILERPLATE = re.compile(
+    r'^\W*(?:(?:we offer|enjoy|get|\d+%?(?:[- ]day)?)\s+)?'
+    r'(?:free shipping|ships? (?:with)?in \d|shipping (?:policy|info|time)|return policy|returns? (?:are|within)|'
+    r'money[- ]back|satisfaction guarantee|add to (?:cart|bag|wishlist)|click here|contact us|'
+    r'customer service|follow us|sign up for|subscribe\b|all rights reserved|copyright|'
+    r'please allow|colou?rs? may (?:vary|differ)|due to (?:monitor|screen))',
+    re.IGNORECASE
+)
+
+_TOKEN_PIECE = re.compile(r'[A-Za-z]+|\d+|[^\sA-Za-z\d]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate Claude tokens from word pieces rather than raw character count
+
+    Common words are one token and long words one per six letters, numbers
+    one per three digits, and each punctuation mark or non-Latin character
+    one token. This tracks the tokenizer closely for catalog copy, where
+    SKUs, measurements and symbols make a fixed characters-per-token ratio
+    badly undercount.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECE.findall(text):
+        if piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif piece[0].isascii() and piece[0].isalpha():
+            tokens += 1 + (len(piece) - 1) // 6
+        else:
+            tokens += 1
+    return tokens
+
+
+class _TextCollector(HTMLParser):
+    """HTML parser that keeps visible text as a list of blocks"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)  # Decodes &amp;, &nbsp;, &#8217; ...
+        self.blocks: List[str] = []
+        self.chars = 0
+        self._current: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.end_block()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self.end_block()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self.end_block()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def end_block(self):
+        text = re.sub(r'\s+', ' ', _SHORTCODE.sub(' ', ''.join(self._current))).strip()
+        self._current = []
+        if text:
+            self.blocks.append(text)
+            self.chars += len(text)
+
+
+def html_blocks(html: str, max_chars: int = None) -> List[str]:
+    """Visible text blocks of an HTML fragment, in order
+
+    The HTML is parsed in CHUNK_SIZE pieces and parsing stops once
+    max_chars of text have been collected.
+    """
+    parser = _TextCollector()
+    for start in range(0, len(html or ''), CHUNK_SIZE):
+        parser.feed(html[start:start + CHUNK_SIZE])
+        if max_chars and parser.chars >= max_chars:
+            break
+    else:
+        parser.close()
+    parser.end_block()
+    return parser.blocks
+
+
+def _sentence_key(sentence: str) -> str:
+    return re.sub(r'[^\w]+', ' ', sentence.lower()).strip()
+
+
+def budget_text(html: str, budget: int, seen: Set[str]) -> Tuple[str, int]:
+    """Clean text of an HTML field within a token budget
+
+    Boilerplate sentences and sentences already in `seen` are dropped; kept
+    sentences are added to `seen`. The last sentence is cut at a word
+    boundary if it would overrun the budget.
+
+    Returns:
+        (text, tokens used)
+    """
+    if budget <= 0 or not html:
+        return '', 0
+
+    kept = []
+    used = 0
+    for block in html_blocks(html, max_chars=budget * CHARS_PER_TOKEN_MAX):
+        for sentence in _SENTENCE_END.split(block):
+            key = _sentence_key(sentence)
+            if not key or key in seen or _BOILERPLATE.search(sentence):
+                continue
+            seen.add(key)
+
+            cost = estimate_tokens(sentence)
+            if used + cost <= budget:
+                kept.append(sentence)
+                used += cost
+                continue
+
+            # Fill what's left of the budget with the start of this sentence
+            words = []
+            for word in sentence.split():
+                word_cost = estimate_tokens(word)
+                if used + word_cost > budget:
+                    break
+                words.append(word)
+                used += word_cost
+            if words:
+                kept.append(' '.join(words))
+            return ' '.join(kept), used
+    return ' '.join(kept), used
+
+
+def description_texts(product: Dict, budget: int = None) -> Tuple[str, str]:
+    """Budgeted (description, short_description) text for a WooCommerce product
+
+    The description (the text Claude sees) gets the budget first; the short
+    description keeps only sentences the description doesn't already contain,
+    within whatever budget is left.
+    """
+    budget = EXTRACT_TOKEN_BUDGET if budget is None else budget
+    seen = set()
+    description, used = budget_text(product.get('description') or '', budget, seen)
+    short_description, _ = budget_text(product.get('short_description') or '', budget - used, seen)
+    return description, short_description
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Anthropic Messages and Message Batches endpoints
+Lets you exercise the batch classification path without spending API credits
+
+Latency, 429/529 errors, a requests-per-minute quota (with the real API's
+anthropic-ratelimit-* and retry-after headers) and the shape of the reply
+text can be configured to measure or regression-test the classification
+paths (see benchmark.py).
+
+Usage:
+    python fake_anthropic.py [--port 8765] [--batch-delay 5] [--latency 0.8] [--error-rate 0.02] [--rpm 600]
+    ANTHROPIC_BASE_URL=http://localhost:8765 python main.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_classification(prompt: str) -> dict:
+    """Build a deterministic, well-formed classification for a prompt"""
+    name_match = re.search(r'^Name: (.*)$', prompt, re.MULTILINE)
+    name = name_match.group(1) if name_match else 'Unknown'
+
+    digest = int(hashlib.sha256(name.encode()).hexdigest(), 16)
+    code = f"{digest % 9000 + 1000:04d}.{digest // 10**4 % 100:02d}.{digest // 10**6 % 10000:04d}"
+
+    return {
+        'hts_code': code,
+        'hts_description': f"Fake classification for {name[:40]}",
+        'confidence': 0.5 + (digest % 50) / 100,
+        'reasoning': 'Generated by fake_anthropic.py',
+        'material': 'unknown',
+        'alternative_codes': None
+    }
+
+
+CACHE_MIN_TOKENS = 1024  # Smallest prompt prefix the API caches
+
+# System prompt blocks marked with cache_control that have been "cached" so far
+_cached_prefixes = set()
+_cached_prefixes_lock = threading.Lock()
+
+
+def fake_cache_usage(params: dict) -> dict:
+    """Emulate prompt caching: the first request with a cached system block writes it, later ones read it"""
+    system = params.get('system')
+    if not isinstance(system, list):
+        return {'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+
+    cached_text = ''.join(block.get('text', '') for block in system if block.get('cache_control'))
+    digest = hashlib.sha256(cached_text.encode()).hexdigest()
+    with _cached_prefixes_lock:
+        hit = digest in _cached_prefixes
+        _cached_prefixes.add(digest)
+
+    tokens = len(cached_text) // 4
+    if tokens < CACHE_MIN_TOKENS:
+        # Shorter prefixes are never cached
+        return {'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+    return {
+        'cache_creation_input_tokens': 0 if hit else tokens,
+        'cache_read_input_tokens': tokens if hit else 0
+    }
+
+
+# Reply text shapes: plain JSON, JSON wrapped in prose, or unparseable text
+RESPONSE_SHAPES = ('json', 'prose', 'invalid')
+
+
+def fake_message(params: dict, shape: str = 'json') -> dict:
+    """Build a Messages API response for request params"""
+    prompt = ''
+    for message in params.get('messages', []):
+        content = message.get('content', '')
+        if isinstance(content, list):
+            content = ''.join(block.get('text', '') for block in content)
+        prompt += content
+
+    # Multi-product prompts list each product under a "PRODUCT n (product_id: id):" header
+    sections = re.split(r'^PRODUCT \d+ \(product_id: (\d+)\):$', prompt, flags=re.MULTILINE)
+    if len(sections) > 1:
+        answer = [{'product_id': int(product_id), **fake_classification(section)}
+                  for product_id, section in zip(sections[1::2], sections[2::2])]
+    else:
+        answer = fake_classification(prompt)
+
+    text = json.dumps(answer, indent=2)
+    if shape == 'prose':
+        text = f"Based on the product details, here is the classification:\n\n{text}\n\nLet me know if you need more."
+    elif shape == 'invalid':
+        text = "I'm not able to classify this product with the information given."
+    return {
+        'id': f"msg_{uuid.uuid4().hex[:24]}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': params.get('model', 'fake-model'),
+        'content': [{'type': 'text', 'text': text}],
+        'stop_reason': 'end_turn',
+        'stop_sequence': None,
+        'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4, **fake_cache_usage(params)}
+    }
+
+
+class FakeAnthropicState:
+    """In-memory batch store and request counters shared by all request handlers"""
+
+    def __init__(self, batch_delay: float, latency: float = 0.0, error_rate: float = 0.0, shape: str = 'json',
+                 rpm: float = 0):
+        self.batch_delay = batch_delay
+        self.latency = latency
+        self.error_rate = error_rate
+        self.shape = shape
+        self.rpm = rpm
+        self.quota = float(rpm)
+        self.quota_updated = time.monotonic()
+        self.batches = {}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] += 1
+
+    def take_quota(self) -> tuple:
+        """Spend one request of the per-minute quota (refilled continuously, like the real API)
+
+        Returns:
+            (allowed, rate-limit headers)
+        """
+        if not self.rpm:
+            return True, {}
+        with self.lock:
+            now = time.monotonic()
+            per_second = self.rpm / 60.0
+            self.quota = min(self.rpm, self.quota + (now - self.quota_updated) * per_second)
+            self.quota_updated = now
+            allowed = self.quota >= 1
+            if allowed:
+                self.quota -= 1
+            remaining = self.quota
+
+        reset = datetime.now(timezone.utc) + timedelta(seconds=(self.rpm - remaining) / per_second)
+        headers = {
+            'anthropic-ratelimit-requests-limit': str(int(self.rpm)),
+            'anthropic-ratelimit-requests-remaining': str(int(remaining)),
+            'anthropic-ratelimit-requests-reset': reset.isoformat(timespec='seconds').replace('+00:00', 'Z')
+        }
+        if not allowed:
+            headers['retry-after'] = str(math.ceil((1 - remaining) / per_second))
+        return allowed, headers
+
+    def create_batch(self, requests: list) -> dict:
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.batches[batch_id] = {'requests': requests, 'created': time.time()}
+        return batch_id
+
+    def batch_object(self, batch_id: str, base_url: str) -> dict:
+        batch = self.batches[batch_id]
+        created = datetime.fromtimestamp(batch['created'], timezone.utc)
+        ended = time.time() - batch['created'] >= self.batch_delay
+        total = len(batch['requests'])
+
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {
+                'processing': 0 if ended else total,
+                'succeeded': total if ended else 0,
+                'errored': 0,
+                'canceled': 0,
+                'expired': 0
+            },
+            'created_at': created.isoformat(),
+            'expires_at': (created + timedelta(days=1)).isoformat(),
+            'ended_at': datetime.now(timezone.utc).isoformat() if ended else None,
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    state: FakeAnthropicState = None
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet
+
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        self.state.count(f"POST {path}")
+
+        if path == '/v1/messages':
+            params = self.read_json()
+            allowed, headers = self.state.take_quota()
+            if not allowed:
+                self.send_json(429, {'type': 'error', 'error': {'type': 'rate_limit_error',
+                                                                'message': 'Requests per minute exceeded'}}, headers)
+                return
+            if self.state.latency:
+                # Roughly exponential around the configured mean, like real model latency
+                time.sleep(random.expovariate(1 / self.state.latency))
+            if self.state.error_rate and random.random() < self.state.error_rate:
+                if random.random() < 0.5:
+                    self.send_json(429, {'type': 'error', 'error': {'type': 'rate_limit_error',
+                                                                    'message': 'Rate limited'}},
+                                   {'retry-after': '1', **headers})
+                else:
+                    self.send_json(529, {'type': 'error', 'error': {'type': 'overloaded_error',
+                                                                    'message': 'Overloaded'}})
+                return
+            self.send_json(200, fake_message(params, self.state.shape), headers)
+        elif path == '/v1/messages/batches':
+            batch_id = self.state.create_batch(self.read_json().get('requests', []))
+            self.send_json(200, self.state.batch_object(batch_id, self.base_url()))
+        else:
+            self.send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': path}})
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        match = re.fullmatch(r'/v1/messages/batches/([\w-]+)(/results)?', path)
+
+        if not match or match.group(1) not in self.state.batches:
+            self.send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': path}})
+            return
+
+        batch_id = match.group(1)
+        if not match.group(2):
+            self.send_json(200, self.state.batch_object(batch_id, self.base_url()))
+            return
+
+        # JSONL results, one line per request
+        lines = []
+        for request in self.state.batches[batch_id]['requests']:
+            lines.append(json.dumps({
+                'custom_id': request['custom_id'],
+                'result': {'type': 'succeeded', 'message': fake_message(request['params'], self.state.shape)}
+            }))
+        body = ('\n'.join(lines) + '\n').encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-jsonl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(port: int = 8765, batch_delay: float = 5.0, latency: float = 0.0, error_rate: float = 0.0,
+                shape: str = 'json', rpm: float = 0) -> ThreadingHTTPServer:
+    """Create (but don't start) a fake Anthropic server
+
+    Args:
+        latency: Mean seconds before a Messages reply
+        error_rate: Share of Messages requests answered with 429 or 529
+        shape: Reply text shape, one of RESPONSE_SHAPES
+        rpm: Messages requests allowed per minute (0 = unlimited)
+    """
+    state = FakeAnthropicState(batch_delay, latency, error_rate, shape, rpm)
+    handler = type('Handler', (FakeAnthropicHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.state = state
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Anthropic API for local testing')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--batch-delay', type=float, default=5.0,
+                        help='Seconds before a submitted batch reports as ended')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean seconds before a Messages reply')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Share of Messages requests answered with 429/529')
+    parser.add_argument('--shape', choices=RESPONSE_SHAPES, default='json', help='Shape of the reply text')
+    parser.add_argument('--rpm', type=float, default=0, help='Messages requests allowed per minute (0 = unlimited)')
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.batch_delay, args.latency, args.error_rate, args.shape, args.rpm)
+    print(f"Fake Anthropic API listening on http://127.0.0.1:{args.port}")
+    print(f"Run with: ANTHROPIC_BASE_URL=http://127.0.0.1:{args.port} python main.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+
+if __name__ == "__main__":
+    main()
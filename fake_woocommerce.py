@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the WooCommerce v3 products and categories endpoints
+Serves a synthetic catalog of any size so catalog scans and pushes can be
+measured without touching a live store
+
+Products are generated on the fly from their ID, so a 100k-product catalog
+costs no memory until its products are updated. Pagination headers, the
+batch endpoint, artificial latency and random 429 responses are emulated.
+
+Usage:
+    python fake_woocommerce.py [--port 8766] [--products 10000] [--latency 0.05] [--error-rate 0.01]
+    SITE_URL=http://127.0.0.1:8766 python main.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/wp-json/wc/v3'
+
+_CATEGORIES = ['Wigs', 'Hair Extensions', 'Fireplaces', 'Fireplace Accessories', 'Cotton T-Shirts',
+               'Knit Sweaters', 'Kitchen Knives', 'Cookware', 'LED Lighting', 'Phone Cases',
+               'Yoga Mats', 'Water Bottles', 'Backpacks', 'Candles', 'Ceramic Mugs', 'Gift Cards']
+_MATERIALS = ['synthetic fiber', 'human hair', 'cast iron', 'stainless steel', 'cotton', 'wool',
+              'polyester', 'silicone', 'aluminum', 'glass', 'ceramic', 'soy wax', 'nylon', 'bamboo']
+_ADJECTIVES = ['Classic', 'Deluxe', 'Premium', 'Compact', 'Large', 'Slim', 'Vintage', 'Modern']
+_COLORS = ['Black', 'White', 'Red', 'Blue', 'Natural', 'Silver', 'Brown', 'Green']
+
+
+def fake_product(product_id: int, families: int = 0) -> dict:
+    """Deterministic synthetic product; products in the same family are near-copies"""
+    family = product_id % families if families else product_id
+    rng = random.Random(family)
+    category_index = rng.randrange(len(_CATEGORIES))
+    category = _CATEGORIES[category_index]
+    material = rng.choice(_MATERIALS)
+    color = random.Random(product_id).choice(_COLORS)
+    name = f"{rng.choice(_ADJECTIVES)} {material.title()} {category.rstrip('s')} {family % 1000}"
+
+    paragraphs = ''.join(
+        f"<p>This {category.lower()[:-1]} is made of {material} and finished by hand. "
+        f"Model {family} &amp; accessories sold separately.</p>"
+        for _ in range(rng.randint(1, 6))
+    )
+    modified = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=product_id)
+
+    return {
+        'id': product_id,
+        'name': f"{name} - {color}",
+        'sku': f"SKU-{product_id:06d}",
+        'status': 'publish',
+        'description': f"[vc_row][vc_column]<div class=\"wpb_wrapper\">{paragraphs}</div>[/vc_column][/vc_row]",
+        'short_description': f"<p>{name} in {color.lower()}.</p>",
+        'categories': [{'id': category_index + 1, 'name': category, 'slug': category.lower().replace(' ', '-')}],
+        'tags': [{'id': 100 + category_index, 'name': material, 'slug': material.replace(' ', '-')}],
+        'attributes': [
+            {'id': 1, 'name': 'Material', 'position': 0, 'visible': True, 'variation': False, 'options': [material]},
+            {'id': 2, 'name': 'Color', 'position': 1, 'visible': True, 'variation': True, 'options': [color]},
+        ],
+        'price': f"{10 + family % 90}.99",
+        'weight': f"{0.1 + (family % 20) / 10:.1f}",
+        'dimensions': {'length': '10', 'width': '5', 'height': '2'},
+        'date_created_gmt': modified.strftime('%Y-%m-%dT%H:%M:%S'),
+        'date_modified_gmt': modified.strftime('%Y-%m-%dT%H:%M:%S'),
+        'images': [{'id': product_id, 'src': f"https://example.com/images/{product_id}.jpg"}],
+        'meta_data': [],
+    }
+
+
+class FakeWooState:
+    """Synthetic catalog, applied updates and request counters shared by all handlers"""
+
+    def __init__(self, num_products: int, latency: float = 0.0, error_rate: float = 0.0, families: int = 0):
+        self.num_products = num_products
+        self.latency = latency
+        self.error_rate = error_rate
+        self.families = families
+        self.updates = {}  # product ID -> meta_data pushed by clients
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def product(self, product_id: int) -> dict:
+        product = fake_product(product_id, self.families)
+        with self.lock:
+            if product_id in self.updates:
+                product['meta_data'] = self.updates[product_id]
+        return product
+
+    def update(self, product_id: int, data: dict) -> dict:
+        if not 1 <= product_id <= self.num_products:
+            return {'id': product_id, 'error': {'code': 'woocommerce_rest_product_invalid_id',
+                                                'message': 'Invalid ID.', 'data': {'status': 400}}}
+        with self.lock:
+            self.updates[product_id] = data.get('meta_data', [])
+        return self.product(product_id)
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] += 1
+
+
+def project(item: dict, fields: str) -> dict:
+    """Apply a _fields parameter"""
+    if not fields:
+        return item
+    return {key: item[key] for key in fields.split(',') if key in item}
+
+
+class FakeWooHandler(BaseHTTPRequestHandler):
+    state: FakeWooState = None
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet
+
+    def send_json(self, status: int, payload, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def route(self, method: str):
+        """Common latency, throttling and accounting, then the endpoint path"""
+        url = urlparse(self.path)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else None
+        endpoint = f"{method} " + re.sub(r'/\d+', '/{id}', path or url.path)
+        self.state.count(endpoint)
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if path is None:
+            self.send_json(404, {'code': 'rest_no_route', 'message': 'No route was found.'})
+            return None, None
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            self.send_json(429, {'code': 'too_many_requests', 'message': 'Slow down.'}, {'Retry-After': '1'})
+            return None, None
+        return path, {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    def do_GET(self):
+        path, params = self.route('GET')
+        if path is None:
+            return
+
+        if path == '/system_status':
+            self.send_json(200, {'environment': {'version': 'fake'}})
+        elif path == '/products':
+            self.list_products(params)
+        elif path == '/products/categories':
+            self.list_categories(params)
+        elif re.fullmatch(r'/products/\d+', path):
+            product_id = int(path.rsplit('/', 1)[1])
+            if 1 <= product_id <= self.state.num_products:
+                self.send_json(200, project(self.state.product(product_id), params.get('_fields')))
+            else:
+                self.send_json(404, {'code': 'woocommerce_rest_product_invalid_id', 'message': 'Invalid ID.'})
+        else:
+            self.send_json(404, {'code': 'rest_no_route', 'message': 'No route was found.'})
+
+    def list_products(self, params: dict):
+        per_page = min(int(params.get('per_page', 10)), 100)
+        page = int(params.get('page', 1))
+        total = self.state.num_products
+
+        ids = range(1, total + 1)
+        if params.get('orderby', 'date') == 'date' and params.get('order', 'desc') == 'desc':
+            ids = range(total, 0, -1)  # IDs follow creation order
+        if params.get('category'):
+            ids = [i for i in ids if self.state.product(i)['categories'][0]['id'] == int(params['category'])]
+        if params.get('modified_after'):
+            ids = [i for i in ids if self.state.product(i)['date_modified_gmt'] > params['modified_after']]
+
+        count = len(ids)
+        page_ids = ids[(page - 1) * per_page:page * per_page]
+        products = [project(self.state.product(i), params.get('_fields')) for i in page_ids]
+        self.send_json(200, products, {
+            'X-WP-Total': str(count),
+            'X-WP-TotalPages': str(max(1, (count + per_page - 1) // per_page))
+        })
+
+    def list_categories(self, params: dict):
+        per_page = min(int(params.get('per_page', 10)), 100)
+        page = int(params.get('page', 1))
+        per_category = self.state.num_products // len(_CATEGORIES)
+        categories = [{'id': i + 1, 'name': name, 'parent': 0, 'count': per_category}
+                      for i, name in enumerate(_CATEGORIES)]
+        page_items = categories[(page - 1) * per_page:page * per_page]
+        self.send_json(200, [project(c, params.get('_fields')) for c in page_items], {
+            'X-WP-Total': str(len(categories)),
+            'X-WP-TotalPages': str(max(1, (len(categories) + per_page - 1) // per_page))
+        })
+
+    def do_PUT(self):
+        path, params = self.route('PUT')
+        if path is None:
+            return
+        match = re.fullmatch(r'/products/(\d+)', path)
+        if not match:
+            self.send_json(404, {'code': 'rest_no_route', 'message': 'No route was found.'})
+            return
+        result = self.state.update(int(match.group(1)), self.read_json())
+        self.send_json(400 if 'error' in result else 200, result)
+
+    def do_POST(self):
+        path, params = self.route('POST')
+        if path is None:
+            return
+        if path != '/products/batch':
+            self.send_json(404, {'code': 'rest_no_route', 'message': 'No route was found.'})
+            return
+
+        updates = self.read_json().get('update', [])
+        if len(updates) > 100:
+            self.send_json(413, {'code': 'rest_batch_max_items', 'message': 'Too many items (max 100).'})
+            return
+        self.send_json(200, {'update': [self.state.update(int(item.get('id', 0)), item) for item in updates]})
+
+
+def make_server(port: int = 8766, num_products: int = 1000, latency: float = 0.0,
+                error_rate: float = 0.0, families: int = 0) -> ThreadingHTTPServer:
+    """Create (but don't start) a fake WooCommerce server
+
+    Args:
+        families: Group products into this many families of near-copies (0 = all distinct)
+    """
+    state = FakeWooState(num_products, latency, error_rate, families)
+    handler = type('Handler', (FakeWooHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.state = state
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake WooCommerce REST API for local testing')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--products', type=int, default=1000, help='Synthetic catalog size')
+    parser.add_argument('--families', type=int, default=0, help='Families of near-copy products (0 = none)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.products, args.latency, args.error_rate, args.families)
+    print(f"Fake WooCommerce API with {args.products} products listening on http://127.0.0.1:{args.port}")
+    print(f"Run with: SITE_URL=http://127.0.0.1:{args.port} python main.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+
+if __name__ == "__main__":
+    main()
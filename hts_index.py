@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Offline index of the US Harmonized Tariff Schedule
+Shortlists plausible 10-digit codes for a product with BM25 retrieval, so
+Claude chooses among real subheadings instead of recalling codes from memory
+
+The index is built once from a USITC export (CSV or JSON, from
+https://hts.usitc.gov → Export) and saved as NumPy arrays that are
+memory-mapped on load, so startup stays fast and nothing needs the network.
+
+Usage:
+    python hts_index.py build [data/hts_schedule.csv]
+    python hts_index.py search "cotton knit t-shirt"
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Index settings
+HTS_SCHEDULE_PATH = os.getenv('HTS_SCHEDULE_PATH', 'data/hts_schedule.csv')  # USITC CSV or JSON export
+HTS_INDEX_DIR = os.getenv('HTS_INDEX_DIR', 'data/hts_index')                 # Precomputed index files
+HTS_CANDIDATES = int(os.getenv('HTS_CANDIDATES', 8))                         # Codes suggested per product
+
+INDEX_FORMAT = 1  # Bump when the on-disk layout changes
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_STOPWORDS = {
+    'a', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'into', 'is',
+    'it', 'its', 'not', 'of', 'on', 'or', 'other', 'than', 'that', 'the', 'their', 'this',
+    'to', 'with', 'whether', 'which', 'nesoi', 'thereof', 'etc'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords dropped and plurals folded"""
+    tokens = []
+    for word in re.findall(r'[a-z][a-z0-9]+', text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def format_code(hts_number: str) -> Optional[str]:
+    """Normalize a schedule number to ####.##.####, or None if it isn't a 10-digit line"""
+    digits = re.sub(r'\D', '', hts_number or '')
+    if len(digits) != 10:
+        return None
+    return f"{digits[:4]}.{digits[4:6]}.{digits[6:]}"
+
+
+def read_schedule(path: str) -> List[Tuple[int, str, str]]:
+    """Read (indent, hts number, description) rows from a USITC CSV or JSON export"""
+    rows = []
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            for item in json.load(f):
+                rows.append((int(item.get('indent') or 0), item.get('htsno') or '', item.get('description') or ''))
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            for item in csv.DictReader(f):
+                rows.append((int(item.get('Indent') or 0), item.get('HTS Number') or '', item.get('Description') or ''))
+    return rows
+
+
+def schedule_documents(rows: List[Tuple[int, str, str]]) -> List[Tuple[str, str]]:
+    """Turn schedule rows into (code, description) documents for 10-digit lines
+
+    USITC descriptions lean on their parents ("Other:", "Men's or boys'"),
+    so each line's text includes the descriptions of the rows it is indented under.
+    """
+    documents = []
+    path = []
+    for indent, hts_number, description in rows:
+        description = re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', '', description)).strip()
+        del path[indent:]
+        path.append(description)
+
+        code = format_code(hts_number)
+        if code:
+            documents.append((code, ' > '.join(part.rstrip(':') for part in path if part)))
+    return documents
+
+
+def build_index(schedule_path: str = None, index_dir: str = None) -> int:
+    """Build and save the BM25 index for a schedule export
+
+    Returns:
+        Number of 10-digit lines indexed
+    """
+    schedule_path = schedule_path or HTS_SCHEDULE_PATH
+    index_dir = index_dir or HTS_INDEX_DIR
+
+    documents = schedule_documents(read_schedule(schedule_path))
+    if not documents:
+        raise ValueError(f"No 10-digit HTS lines found in {schedule_path}")
+
+    # Term frequencies per document
+    doc_terms = []
+    vocabulary = {}
+    for _, text in documents:
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        doc_terms.append(counts)
+        for token in counts:
+            vocabulary.setdefault(token, []).append(len(doc_terms) - 1)
+
+    lengths = np.array([sum(counts.values()) for counts in doc_terms], dtype=np.float32)
+    avg_length = float(lengths.mean()) or 1.0
+    total = len(documents)
+
+    # Postings hold final BM25 term weights, so a query is only a sum of slices
+    terms = {}
+    postings_docs = []
+    postings_weights = []
+    for token in sorted(vocabulary):
+        doc_ids = vocabulary[token]
+        idf = np.log(1 + (total - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+        tf = np.array([doc_terms[d][token] for d in doc_ids], dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / avg_length)
+        terms[token] = [len(postings_docs), len(doc_ids)]
+        postings_docs.extend(doc_ids)
+        postings_weights.extend((idf * tf * (BM25_K1 + 1) / (tf + norm)).tolist())
+
+    descriptions = [text.encode('utf-8') for _, text in documents]
+    offsets = np.zeros(total + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(d) for d in descriptions])
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, 'codes.npy'), np.array([code for code, _ in documents], dtype='S12'))
+    np.save(os.path.join(index_dir, 'postings_docs.npy'), np.array(postings_docs, dtype=np.int32))
+    np.save(os.path.join(index_dir, 'postings_weights.npy'), np.array(postings_weights, dtype=np.float32))
+    np.save(os.path.join(index_dir, 'description_offsets.npy'), offsets)
+    np.save(os.path.join(index_dir, 'descriptions.npy'), np.frombuffer(b''.join(descriptions), dtype=np.uint8))
+    with open(os.path.join(index_dir, 'terms.json'), 'w', encoding='utf-8') as f:
+        json.dump(terms, f, separators=(',', ':'))
+
+    # Written last: an index without metadata is treated as missing
+    stat = os.stat(schedule_path)
+    with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'format': INDEX_FORMAT,
+            'source': os.path.abspath(schedule_path),
+            'source_size': stat.st_size,
+            'source_mtime': stat.st_mtime,
+            'documents': total,
+            'terms': len(terms)
+        }, f, indent=2)
+
+    logger.info(f"Indexed {total} HTS lines ({len(terms)} terms) from {schedule_path} into {index_dir}")
+    return total
+
+
+class HTSIndex:
+    """Memory-mapped BM25 index over 10-digit HTS lines"""
+
+    def __init__(self, index_dir: str = None):
+        self.index_dir = index_dir or HTS_INDEX_DIR
+        with open(os.path.join(self.index_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != INDEX_FORMAT:
+            raise ValueError(f"HTS index in {self.index_dir} has an old format; rebuild it")
+
+        with open(os.path.join(self.index_dir, 'terms.json'), encoding='utf-8') as f:
+            self.terms = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(self.index_dir, name), mmap_mode='r')
+
+        self.codes = load('codes.npy')
+        self.postings_docs = load('postings_docs.npy')
+        self.postings_weights = load('postings_weights.npy')
+        self.description_offsets = load('description_offsets.npy')
+        self.descriptions = load('descriptions.npy')
+
+        # Codes are in schedule order, which is numeric order
+        self._sorted = bool(len(self.codes) < 2 or (self.codes[1:] >= self.codes[:-1]).all())
+
+    @property
+    def version(self) -> str:
+        """Short identifier of the schedule revision this index was built from"""
+        return f"{self.meta['documents']}-{int(self.meta['source_mtime'])}"
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def description(self, doc: int) -> str:
+        start, end = self.description_offsets[doc], self.description_offsets[doc + 1]
+        return bytes(self.descriptions[start:end]).decode('utf-8')
+
+    def contains(self, code: str) -> bool:
+        """Whether a code (any punctuation) is a 10-digit line of the indexed schedule"""
+        code = format_code(code)
+        if code is None:
+            return False
+        key = code.encode('ascii')
+        if self._sorted:
+            pos = int(np.searchsorted(self.codes, key))
+            return pos < len(self.codes) and self.codes[pos] == key
+        return bool((self.codes == key).any())
+
+    def search(self, text: str, k: int = None) -> List[Dict]:
+        """Top-k schedule lines for free text
+
+        Returns:
+            [{'hts_code', 'description', 'score'}] best first
+        """
+        k = k or HTS_CANDIDATES
+        scores = np.zeros(len(self.codes), dtype=np.float32)
+        for token in set(tokenize(text)):
+            posting = self.terms.get(token)
+            if posting is None:
+                continue
+            start, count = posting
+            scores[self.postings_docs[start:start + count]] += self.postings_weights[start:start + count]
+
+        matched = int(np.count_nonzero(scores))
+        if not matched:
+            return []
+        k = min(k, matched)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {'hts_code': self.codes[doc].decode('ascii'), 'description': self.description(doc),
+             'score': float(scores[doc])}
+            for doc in top
+        ]
+
+
+def product_query(features: Dict) -> str:
+    """Text used to look up candidate codes for extracted product features"""
+    parts = [
+        features.get('name', ''),
+        ' '.join(features.get('categories', [])),
+        ' '.join(features.get('tags', [])),
+        features.get('material', ''),
+        features.get('attributes', '')
+    ]
+    return ' '.join(p for p in parts if p)
+
+
+def load_index(index_dir: str = None, schedule_path: str = None) -> Optional[HTSIndex]:
+    """Load the HTS index, building or rebuilding it from the schedule export when needed
+
+    Returns None when neither an index nor a schedule export is available.
+    """
+    index_dir = index_dir or HTS_INDEX_DIR
+    schedule_path = schedule_path or HTS_SCHEDULE_PATH
+    meta_path = os.path.join(index_dir, 'meta.json')
+
+    stale = not os.path.exists(meta_path)
+    if not stale and os.path.exists(schedule_path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        stat = os.stat(schedule_path)
+        stale = (meta.get('format') != INDEX_FORMAT or meta.get('source_size') != stat.st_size
+                 or meta.get('source_mtime') != stat.st_mtime)
+
+    if stale:
+        if not os.path.exists(schedule_path):
+            return None
+        logger.info(f"Building HTS index from {schedule_path}...")
+        build_index(schedule_path, index_dir)
+
+    return HTSIndex(index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline HTS schedule index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build the index from a USITC CSV/JSON export')
+    build.add_argument('schedule', nargs='?', default=HTS_SCHEDULE_PATH)
+    build.add_argument('--index-dir', default=HTS_INDEX_DIR)
+
+    search = subparsers.add_parser('search', help='Show candidate codes for a product description')
+    search.add_argument('text')
+    search.add_argument('-k', type=int, default=HTS_CANDIDATES)
+    search.add_argument('--index-dir', default=HTS_INDEX_DIR)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.command == 'build':
+        total = build_index(args.schedule, args.index_dir)
+        print(f"✓ Indexed {total} HTS lines into {args.index_dir}")
+    else:
+        index = HTSIndex(args.index_dir)
+        for candidate in index.search(args.text, args.k):
+            print(f"{candidate['hts_code']}  {candidate['score']:6.2f}  {candidate['description'][:100]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Nearest-neighbour classification over already-approved matches
+New products that closely resemble a group of approved products sharing one
+HTS code get that code locally instead of a Claude call
+
+Approved products are turned into sparse, L2-normalized hashed feature
+vectors (name words and bigrams, categories, attributes, attribute material) held in
+growable NumPy arrays, so rows can be added as matches are saved without
+refitting a vocabulary. Queries are answered in batches with cosine similarity.
+"""
+
+import logging
+import os
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Nearest-neighbour settings
+KNN_CLASSIFY = os.getenv('KNN_CLASSIFY', 'false').lower() in ('1', 'true', 'yes')
+KNN_NEIGHBOURS = int(os.getenv('KNN_NEIGHBOURS', 5))             # Neighbours consulted per product
+KNN_SIMILARITY = float(os.getenv('KNN_SIMILARITY', 0.85))        # Minimum cosine similarity of a neighbour
+KNN_MIN_NEIGHBOURS = int(os.getenv('KNN_MIN_NEIGHBOURS', 2))     # Similar neighbours needed before voting
+KNN_AGREEMENT = float(os.getenv('KNN_AGREEMENT', 0.8))           # Similarity-weighted share the top code needs
+
+DIMENSIONS = 1 << 20  # Hashed feature space
+QUERY_CHUNK = 64      # Queries scored together
+
+# Relative weight of each field in a product vector
+FIELD_WEIGHTS = {'name': 1.0, 'bigram': 0.7, 'category': 1.0, 'attribute': 0.8, 'material': 0.8}
+
+MATERIAL_ATTRIBUTE = re.compile(r'material|fabric|composition|fibre|fiber', re.IGNORECASE)
+
+
+def words(text: str) -> List[str]:
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+
+def product_tokens(name: str, categories: Iterable[str], attributes: str = '',
+                   material: str = '') -> Dict[str, float]:
+    """Weighted tokens for a product, prefixed by field so fields don't collide"""
+    tokens = {}
+
+    def add(token: str, field: str):
+        tokens[token] = tokens.get(token, 0.0) + FIELD_WEIGHTS[field]
+
+    name_words = words(name)
+    for word in name_words:
+        add(f"n:{word}", 'name')
+    for first, second in zip(name_words, name_words[1:]):
+        add(f"b:{first}_{second}", 'bigram')
+    for category in categories:
+        if category:
+            add(f"c:{' '.join(words(category))}", 'category')
+    for word in words(attributes):
+        add(f"a:{word}", 'attribute')
+    for word in words(material):
+        add(f"m:{word}", 'material')
+    return tokens
+
+
+def attribute_material(attributes: str) -> str:
+    """Material named in a product's attributes ('Material: cotton, Color: red' -> 'cotton')"""
+    values = []
+    for pair in (attributes or '').split(', '):
+        name, _, value = pair.partition(': ')
+        if value and MATERIAL_ATTRIBUTE.search(name):
+            values.append(value)
+    return ' '.join(values)
+
+
+def vectorize(tokens: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Hash weighted tokens into a sparse unit vector (sorted column indices, values)"""
+    columns = {}
+    for token, weight in tokens.items():
+        column = zlib.crc32(token.encode('utf-8')) % DIMENSIONS
+        columns[column] = columns.get(column, 0.0) + weight
+    if not columns:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+    indices = np.fromiter(sorted(columns), dtype=np.int32, count=len(columns))
+    values = np.array([columns[c] for c in indices.tolist()], dtype=np.float32)
+    # Sublinear term frequency so repeated words don't dominate
+    values = np.where(values > 1.0, 1.0 + np.log(np.maximum(values, 1.0)), values).astype(np.float32)
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+def product_vector(name: str, categories: Iterable[str], attributes: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Vector for a product, with its material read from the attributes
+
+    Indexed products and queries are vectorized the same way (Claude's
+    material answer is only known for indexed products), so a product that
+    is already indexed matches itself at similarity 1.0.
+    """
+    return vectorize(product_tokens(name, categories, attributes, attribute_material(attributes)))
+
+
+def features_vector(features: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Vector for extracted product features (see extract_product_features)"""
+    return product_vector(features.get('name', ''), features.get('categories', []), features.get('attributes', ''))
+
+
+class NeighbourIndex:
+    """Incremental cosine-similarity index over approved product matches
+
+    Rows are stored in coordinate form (row, column, value) in arrays that
+    double when full. Re-adding a product replaces its row; replaced rows are
+    masked out and compacted away once they make up half the index.
+
+    Usage:
+        index = NeighbourIndex()
+        index.add(product_id, name, categories, attributes, label)
+        matches = index.classify(features_list)
+    """
+
+    def __init__(self):
+        self._rows = np.zeros(1024, dtype=np.int32)
+        self._cols = np.zeros(1024, dtype=np.int32)
+        self._vals = np.zeros(1024, dtype=np.float32)
+        self._nnz = 0
+
+        self._product_ids: List[int] = []
+        self._labels: List[Dict] = []
+        self._active = np.zeros(256, dtype=bool)
+        self._row_of: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def add(self, product_id: int, name: str, categories: Iterable[str], attributes: str, label: Dict):
+        """Add or replace one approved product
+
+        Args:
+            label: The product's classification (hts_code, hts_description,
+                confidence, material)
+        """
+        self.remove(product_id)
+        indices, values = product_vector(name, categories, attributes)
+        if not len(indices):
+            return
+
+        row = len(self._product_ids)
+        if row >= len(self._active):
+            self._active = np.concatenate([self._active, np.zeros(len(self._active), dtype=bool)])
+        end = self._nnz + len(indices)
+        if end > len(self._cols):
+            size = max(end, 2 * len(self._cols))
+            self._rows = np.resize(self._rows, size)
+            self._cols = np.resize(self._cols, size)
+            self._vals = np.resize(self._vals, size)
+
+        self._rows[self._nnz:end] = row
+        self._cols[self._nnz:end] = indices
+        self._vals[self._nnz:end] = values
+        self._nnz = end
+
+        self._product_ids.append(product_id)
+        self._labels.append(label)
+        self._active[row] = True
+        self._row_of[product_id] = row
+
+    def remove(self, product_id: int):
+        """Drop a product (e.g. after it was reclassified or un-approved)"""
+        row = self._row_of.pop(product_id, None)
+        if row is None:
+            return
+        self._active[row] = False
+        if len(self._product_ids) > 1024 and len(self._row_of) < len(self._product_ids) // 2:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the arrays without removed rows"""
+        keep_rows = np.flatnonzero(self._active[:len(self._product_ids)])
+        new_row = np.full(len(self._product_ids), -1, dtype=np.int32)
+        new_row[keep_rows] = np.arange(len(keep_rows), dtype=np.int32)
+
+        rows = new_row[self._rows[:self._nnz]]
+        keep = rows >= 0
+        self._rows = rows[keep]
+        self._cols = self._cols[:self._nnz][keep]
+        self._vals = self._vals[:self._nnz][keep]
+        self._nnz = len(self._rows)
+
+        self._product_ids = [self._product_ids[r] for r in keep_rows]
+        self._labels = [self._labels[r] for r in keep_rows]
+        self._active = np.ones(max(len(keep_rows), 256), dtype=bool)
+        self._active[len(keep_rows):] = False
+        self._row_of = {pid: row for row, pid in enumerate(self._product_ids)}
+
+    def query(self, vectors: List[Tuple[np.ndarray, np.ndarray]], k: int = None,
+              exclude: List[Optional[int]] = None) -> List[List[Tuple[int, float]]]:
+        """Top-k (row, similarity) neighbours for each query vector, best first
+
+        Args:
+            exclude: Per-query product ID left out of its own results, so a
+                product being reprocessed isn't its own neighbour
+        """
+        k = k or KNN_NEIGHBOURS
+        exclude = exclude or [None] * len(vectors)
+        total_rows = len(self._product_ids)
+        if not total_rows or not self._nnz:
+            return [[] for _ in vectors]
+
+        rows = self._rows[:self._nnz]
+        cols = self._cols[:self._nnz]
+        vals = self._vals[:self._nnz]
+        active = self._active[:total_rows]
+
+        results = []
+        for start in range(0, len(vectors), QUERY_CHUNK):
+            chunk = vectors[start:start + QUERY_CHUNK]
+            nonempty = [indices for indices, _ in chunk if len(indices)]
+            if not nonempty:
+                results.extend([] for _ in chunk)
+                continue
+
+            # Only index entries in a column some query uses can contribute
+            columns = np.unique(np.concatenate(nonempty))
+            positions = np.minimum(np.searchsorted(columns, cols), len(columns) - 1)
+            hit = columns[positions] == cols
+            hit_rows, hit_positions, hit_vals = rows[hit], positions[hit], vals[hit]
+
+            for offset, (indices, values) in enumerate(chunk):
+                if not len(indices):
+                    results.append([])
+                    continue
+                dense = np.zeros(len(columns), dtype=np.float32)
+                dense[np.searchsorted(columns, indices)] = values
+                scores = np.bincount(hit_rows, weights=hit_vals * dense[hit_positions], minlength=total_rows)
+                scores[~active] = 0.0
+                own = self._row_of.get(exclude[start + offset])
+                if own is not None:
+                    scores[own] = 0.0
+
+                top_k = min(k, total_rows)
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+                top = top[np.argsort(-scores[top])]
+                results.append([(int(row), float(scores[row])) for row in top if scores[row] > 0])
+        return results
+
+    def classify(self, features_list: List[Dict], k: int = None, similarity: float = None,
+                 min_neighbours: int = None, agreement: float = None) -> List[Optional[Dict]]:
+        """Assign codes to products whose close neighbours agree on one code
+
+        A product gets a match only when at least `min_neighbours` of its top
+        `k` neighbours have cosine similarity >= `similarity` and the
+        similarity-weighted share of the most common code among them is
+        >= `agreement`. Other products get None and go to Claude.
+
+        Returns:
+            One match dict (source 'knn') or None per product, in input order
+        """
+        similarity = KNN_SIMILARITY if similarity is None else similarity
+        min_neighbours = min_neighbours or KNN_MIN_NEIGHBOURS
+        agreement = KNN_AGREEMENT if agreement is None else agreement
+
+        neighbours = self.query([features_vector(f) for f in features_list], k,
+                                exclude=[f.get('id') for f in features_list])
+
+        matches = []
+        for found in neighbours:
+            close = [(row, score) for row, score in found if score >= similarity]
+            if len(close) < max(1, min_neighbours):
+                matches.append(None)
+                continue
+
+            votes = {}
+            for row, score in close:
+                code = self._labels[row]['hts_code']
+                votes[code] = votes.get(code, 0.0) + score
+            code = max(votes, key=votes.get)
+            share = votes[code] / sum(votes.values())
+            if share < agreement:
+                matches.append(None)
+                continue
+
+            agreeing = [(row, score) for row, score in close if self._labels[row]['hts_code'] == code]
+            nearest = self._labels[agreeing[0][0]]
+            confidence = sum(score * (self._labels[row].get('confidence') or 0.0) for row, score in agreeing) \
+                / sum(score for _, score in agreeing)
+            others = sorted(c for c in votes if c != code)
+
+            matches.append({
+                'hts_code': code,
+                'hts_description': nearest.get('hts_description', ''),
+                'confidence': round(confidence * share, 4),
+                'reasoning': (f"Assigned locally from {len(agreeing)} similar approved products "
+                              f"(products {', '.join(str(self._product_ids[row]) for row, _ in agreeing)}; "
+                              f"best similarity {agreeing[0][1]:.2f}, agreement {share:.0%})"),
+                'material': nearest.get('material', ''),
+                'alternative_codes': others or None,
+                'source': 'knn'
+            })
+        return matches
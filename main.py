@@ -6,17 +6,36 @@ Connects to your WooCommerce store and uses Claude to intelligently assign HTS c
 
 import requests
 import json
-import sqlite3
-import pandas as pd
-from typing import List, Dict, Optional, Set
+from typing import TYPE_CHECKING, List, Dict, Iterator, Optional, Set, Tuple
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 import os
 from dataclasses import dataclass
-from requests.auth import HTTPBasicAuth
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from anthropic import Anthropic
+import hashlib
+import random
+import atexit
+import threading
+import uuid
+import argparse
+from rate_limiter import AdaptiveLimiter, TokenBucket
+from woo_client import WooClient, WOO_FETCH_WORKERS, hts_meta_data
+from dedup import ProductDeduplicator
+from db_writer import WriteBuffer, connect as connect_db
+from schema import migrate, db_timestamp, from_db_timestamp
+from pipeline import ClassificationPipeline
+from hts_index import HTS_CANDIDATES, load_index, product_query
+from knn import KNN_CLASSIFY, NeighbourIndex
+from extract import description_texts, estimate_tokens
+from metrics import Progress, instrument_run, metrics
+from matches import export_matches, match_summary
+
+# pandas and the Anthropic SDK take most of this module's import time, so they are
+# imported where they are used; scripts that only read the database start quickly
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Disable SSL warnings for local development with .local domains
 import urllib3
@@ -51,6 +70,57 @@ except ImportError:
     RATE_LIMIT_DELAY = float(os.getenv('RATE_LIMIT_DELAY', 1.0))
     print("✓ Loaded configuration from .env file")
 
+# Concurrency settings (optional - defaults keep the original sequential behaviour)
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', 1))          # Parallel Claude calls
+REQUESTS_PER_MINUTE = float(os.getenv('REQUESTS_PER_MINUTE', 50))  # Token bucket rate for concurrent mode
+ADAPTIVE_CONCURRENCY = os.getenv('ADAPTIVE_CONCURRENCY', 'false').lower() in ('1', 'true', 'yes')  # Size concurrency/rate from rate-limit headers
+CLAUDE_MAX_RETRIES = int(os.getenv('CLAUDE_MAX_RETRIES', 8))     # Retries of rate-limited/overloaded calls before falling back
+
+# Responses worth retrying: rate limited, overloaded or a transient server error
+CLAUDE_RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+
+# Fixed pacing (REQUESTS_PER_MINUTE, RATE_LIMIT_DELAY) steps aside when the adaptive controller sets the pace
+PACED_REQUESTS_PER_MINUTE = 0 if ADAPTIVE_CONCURRENCY else REQUESTS_PER_MINUTE
+
+# Message Batches settings (bulk mode for menu options 4 and 13)
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', 60))  # Seconds between batch status checks
+MAX_BATCH_REQUESTS = 100000  # Anthropic limit per Message Batch
+
+# Classification cache settings (reuse results for unchanged products)
+CACHE_TTL_DAYS = int(os.getenv('CACHE_TTL_DAYS', 180))          # Entries unused for this long are evicted
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 100000))  # Least recently used entries beyond this are evicted
+
+# Duplicate detection (classify one product per group of SKU/text duplicates)
+DEDUP_PRODUCTS = os.getenv('DEDUP_PRODUCTS', 'false').lower() in ('1', 'true', 'yes')
+DEDUP_SIMILARITY = float(os.getenv('DEDUP_SIMILARITY', 0.9))  # Estimated Jaccard similarity for near-duplicates
+
+# Multi-product prompts (classify several cache misses per Claude call)
+PACK_PRODUCTS = os.getenv('PACK_PRODUCTS', 'false').lower() in ('1', 'true', 'yes')
+PACK_TOKEN_BUDGET = int(os.getenv('PACK_TOKEN_BUDGET', 4000))  # Product text + expected answer tokens per call
+PACK_MAX_PRODUCTS = int(os.getenv('PACK_MAX_PRODUCTS', 20))    # Hard cap on products per call
+PACK_OUTPUT_TOKENS = 250  # Expected answer tokens per product, counted against the budget
+
+# Cost/time estimates from processing_log history (prices in USD per million tokens; check current rates)
+MODEL_PRICES = {'input_tokens': 3.00, 'output_tokens': 15.00, 'cache_write_tokens': 3.75, 'cache_read_tokens': 0.30}
+ESTIMATE_HISTORY_DAYS = int(os.getenv('ESTIMATE_HISTORY_DAYS', 30))  # Recent API calls the estimator learns from
+ESTIMATE_MIN_SAMPLES = 20  # Calls a category needs before it gets its own estimate
+
+# WooCommerce product fields each stage reads, requested with _fields so catalog
+# pages skip images, variations, meta_data and the rest. Declare a field here
+# before reading it from a fetched product. (Pushes only write meta_data.)
+PRODUCT_FIELDS = {
+    'classify': ('id', 'sku', 'name', 'description', 'short_description', 'categories',
+                 'tags', 'attributes', 'price', 'weight', 'dimensions'),
+    'filter': ('id', 'date_modified_gmt'),  # skip-processed checks and incremental sync
+}
+# Keys kept from nested objects in a product record
+NESTED_PRODUCT_FIELDS = {
+    'categories': ('id', 'name'),
+    'tags': ('id', 'name'),
+    'attributes': ('name', 'options', 'visible'),
+}
+CATEGORY_FIELDS = 'id,name,parent,count'
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -63,21 +133,43 @@ class WooConfig:
     consumer_secret: str
     anthropic_api_key: str
 
+def product_fields(*purposes: str) -> str:
+    """Build a _fields value covering the given PRODUCT_FIELDS purposes"""
+    fields = []
+    for purpose in purposes:
+        for field in PRODUCT_FIELDS[purpose]:
+            if field not in fields:
+                fields.append(field)
+    return ','.join(fields)
+
+def lean_product(product: Dict, fields: str) -> Dict:
+    """Reduce a product to the projected fields
+
+    Stores or plugins that ignore _fields still send full products; this
+    keeps memory flat either way by dropping everything not requested.
+    """
+    lean = {}
+    for field in fields.split(','):
+        if field not in product:
+            continue
+        value = product[field]
+        if field in NESTED_PRODUCT_FIELDS and isinstance(value, list):
+            keys = NESTED_PRODUCT_FIELDS[field]
+            value = [{k: item[k] for k in keys if k in item} for item in value]
+        lean[field] = value
+    return lean
+
 class CategoryManager:
     """Manage WooCommerce categories for selective processing"""
     
-    def __init__(self, config):
+    def __init__(self, config, woo: Optional[WooClient] = None):
         self.config = config
-        self.api_url = f"{config.url}/wp-json/wc/v3"
-        
-        # Determine auth method
-        if config.consumer_key.startswith('ck_'):
-            self.auth = HTTPBasicAuth(config.consumer_key, config.consumer_secret)
-        else:
-            self.auth = HTTPBasicAuth(config.consumer_key, config.consumer_secret.replace(' ', ''))
         
-        # Check if local development
-        self.verify_ssl = not ('.local' in config.url or 'localhost' in config.url)
+        # Shared pooled client (auth, SSL and retries are handled there)
+        self.woo = woo or WooClient.from_config(config)
+        self.api_url = self.woo.api_url
+        self.auth = self.woo.auth
+        self.verify_ssl = self.woo.verify_ssl
         
         self.categories = []
         self.selected_category_ids = set()
@@ -85,24 +177,20 @@ class CategoryManager:
     def fetch_all_categories(self) -> List[Dict]:
         """Fetch all product categories from WooCommerce"""
         categories = []
-        page = 1
         per_page = 100
         
         print("Fetching product categories...")
         
-        while True:
-            response = requests.get(
-                f"{self.api_url}/products/categories",
-                auth=self.auth,
-                verify=self.verify_ssl,
-                params={
-                    'page': page,
-                    'per_page': per_page,
-                    'orderby': 'name',
-                    'order': 'asc'
-                }
-            )
-            
+        # Pages after the first are fetched in parallel but arrive in order
+        for page, response in self.woo.iter_pages(
+            "/products/categories",
+            params={
+                'per_page': per_page,
+                'orderby': 'name',
+                'order': 'asc',
+                '_fields': CATEGORY_FIELDS
+            }
+        ):
             if response.status_code != 200:
                 print(f"Error fetching categories: {response.status_code}")
                 break
@@ -110,15 +198,8 @@ class CategoryManager:
             batch = response.json()
             if not batch:
                 break
-                
-            categories.extend(batch)
             
-            # Check if there are more pages
-            total_pages = int(response.headers.get('X-WP-TotalPages', 1))
-            if page >= total_pages:
-                break
-                
-            page += 1
+            categories.extend(batch)
         
         self.categories = categories
         print(f"Found {len(categories)} categories")
@@ -220,54 +301,58 @@ class CategoryManager:
         
         return self.selected_category_ids
     
+    def fetch_category_products(self, cat_id: int) -> List[List[Dict]]:
+        """Fetch every page of published products in one category"""
+        fields = product_fields('classify', 'filter')
+        pages = []
+        for page, response in self.woo.iter_pages(
+            "/products",
+            params={
+                'category': cat_id,
+                'per_page': 100,
+                'status': 'publish',
+                '_fields': fields
+            }
+        ):
+            if response.status_code != 200:
+                print(f"Error fetching products: {response.status_code}")
+                break
+            
+            products = [lean_product(p, fields) for p in response.json()]
+            if not products:
+                break
+            pages.append(products)
+        return pages
+    
     def fetch_products_by_categories(self, category_ids: Set[int], limit: int = None) -> List[Dict]:
-        """Fetch products from specific categories"""
+        """Fetch products from specific categories
+
+        Categories are fetched in parallel, a window of WOO_FETCH_WORKERS at a
+        time, and merged in category order so duplicates and the limit are
+        handled exactly as in a sequential walk.
+        """
         all_products = []
         products_seen = set()
+        category_ids = list(category_ids)
         
-        for cat_id in category_ids:
-            cat_name = next((c['name'] for c in self.categories if c['id'] == cat_id), f"Category {cat_id}")
-            print(f"\nFetching products from: {cat_name}")
-            
-            page = 1
-            while True:
-                response = requests.get(
-                    f"{self.api_url}/products",
-                    auth=self.auth,
-                    verify=self.verify_ssl,
-                    params={
-                        'category': cat_id,
-                        'page': page,
-                        'per_page': 100,
-                        'status': 'publish'
-                    }
-                )
-                
-                if response.status_code != 200:
-                    print(f"Error fetching products: {response.status_code}")
-                    break
-                
-                products = response.json()
-                if not products:
-                    break
-                
-                # Avoid duplicates (products can be in multiple categories)
-                for product in products:
-                    if product['id'] not in products_seen:
-                        products_seen.add(product['id'])
-                        all_products.append(product)
-                        
-                        if limit and len(all_products) >= limit:
-                            print(f"Reached limit of {limit} products")
-                            return all_products[:limit]
+        with ThreadPoolExecutor(max_workers=WOO_FETCH_WORKERS) as executor:
+            for start in range(0, len(category_ids), WOO_FETCH_WORKERS):
+                window = category_ids[start:start + WOO_FETCH_WORKERS]
                 
-                # Check for more pages
-                total_pages = int(response.headers.get('X-WP-TotalPages', 1))
-                if page >= total_pages:
-                    break
+                for cat_id, pages in zip(window, executor.map(self.fetch_category_products, window)):
+                    cat_name = next((c['name'] for c in self.categories if c['id'] == cat_id), f"Category {cat_id}")
+                    print(f"\nFetched products from: {cat_name} ({len(pages)} pages)")
                     
-                page += 1
-                print(f"  Page {page}/{total_pages}...")
+                    for products in pages:
+                        # Avoid duplicates (products can be in multiple categories)
+                        for product in products:
+                            if product['id'] not in products_seen:
+                                products_seen.add(product['id'])
+                                all_products.append(product)
+                                
+                                if limit and len(all_products) >= limit:
+                                    print(f"Reached limit of {limit} products")
+                                    return all_products[:limit]
         
         print(f"\nTotal unique products found: {len(all_products)}")
         return all_products
@@ -300,43 +385,29 @@ class CategoryManager:
 def test_woocommerce_connection(config: WooConfig):
     """Test if WooCommerce API connection works"""
     
-    api_url = f"{config.url}/wp-json/wc/v3"
+    woo = WooClient.from_config(config)
     
     # Determine auth method
     if config.consumer_key.startswith('ck_'):
-        auth = HTTPBasicAuth(config.consumer_key, config.consumer_secret)
         print("Using WooCommerce REST API authentication")
     else:
-        # WordPress Application Password - remove spaces just in case
-        auth = HTTPBasicAuth(config.consumer_key, config.consumer_secret.replace(' ', ''))
+        # WordPress Application Password - spaces are removed by the client
         print("Using WordPress Application Password authentication")
     
     # Check if using local development
-    is_local = '.local' in config.url or 'localhost' in config.url
-    verify_ssl = not is_local
-    
-    if is_local:
+    if woo.is_local:
         print("Local development detected - SSL verification disabled")
     
     # Test the connection
     try:
         # Try to fetch store info
-        response = requests.get(
-            f"{api_url}/system_status", 
-            auth=auth,
-            verify=verify_ssl
-        )
+        response = woo.get("/system_status")
         
         if response.status_code == 200:
             print("✅ Successfully connected to WooCommerce!")
             
             # Try to fetch a few products
-            response = requests.get(
-                f"{api_url}/products", 
-                auth=auth,
-                verify=verify_ssl,
-                params={'per_page': 1}
-            )
+            response = woo.get("/products", params={'per_page': 1})
             
             if response.status_code == 200:
                 products = response.json()
@@ -374,27 +445,14 @@ def test_woocommerce_connection(config: WooConfig):
         print(f"❌ Error: {e}")
         return False
 
-class HTSMatcher:
-    """Claude-powered HTS code matcher"""
-    
-    def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
-        self.model = "claude-3-7-sonnet-20250219"  # Using Claude 3.7 Sonnet
-        
-    def match_product(self, product_info: Dict) -> Dict:
-        """Use Claude to match a product to its HTS code"""
-        
-        # Build the prompt with product information
-        prompt = f"""You are an expert in Harmonized Tariff Schedule (HTS) classification for US imports. 
+# Static classification instructions (the original prompt's wording), sent as a
+# system prompt marked for prompt caching. Anthropic only caches prompts of at
+# least 1,024 tokens (2,048 for Haiku models); this block is shorter, so the
+# cache_control marker takes effect once the instructions grow past that.
+# Any edit here needs a HTSMatcher.PROMPT_VERSION bump.
+HTS_SYSTEM_PROMPT = """You are an expert in Harmonized Tariff Schedule (HTS) classification for US imports. 
 Analyze this product and provide the most accurate 10-digit HTS code.
 
-PRODUCT INFORMATION:
-Name: {product_info.get('name', 'Unknown')}
-SKU: {product_info.get('sku', 'N/A')}
-Description: {product_info.get('description', 'No description')}
-Categories: {', '.join(product_info.get('categories', []))}
-Attributes: {product_info.get('attributes', 'None')}
-
 IMPORTANT RULES:
 1. Provide the full 10-digit HTS code (format: ####.##.####)
 2. Consider the product's primary function and material composition
@@ -402,31 +460,370 @@ IMPORTANT RULES:
 4. If uncertain between codes, choose the one with higher duty rate (conservative approach)
 
 Respond in this exact JSON format:
-{{
+{
     "hts_code": "####.##.####",
     "hts_description": "Brief description from HTS schedule",
     "confidence": 0.0 to 1.0,
     "reasoning": "Brief explanation of classification logic",
     "material": "primary material if identified",
     "alternative_codes": ["####.##.####"] or null if very confident
-}}
+}
 
 Focus on accuracy - this will be used for actual customs declarations."""
 
+class HTSMatcher:
+    """Claude-powered HTS code matcher"""
+    
+    # Bump whenever the prompt text changes so cached results are not reused
+    PROMPT_VERSION = '3'
+    
+    def __init__(self, api_key: str, rate_share: int = 1):
+        """
+        Args:
+            api_key: Anthropic API key
+            rate_share: Processes sharing this key's limits (worker.py); this one
+                takes an equal part of MAX_CONCURRENCY, REQUESTS_PER_MINUTE and
+                the request rate learned from rate-limit headers
+        """
+        from anthropic import Anthropic
+        self.client = Anthropic(api_key=api_key)
+        self.model = "claude-3-7-sonnet-20250219"  # Using Claude 3.7 Sonnet
+        
+        self.rate_share = max(1, rate_share)
+        self.max_concurrency = max(1, MAX_CONCURRENCY // self.rate_share)
+        self.requests_per_minute = REQUESTS_PER_MINUTE / self.rate_share
+        self.paced_requests_per_minute = PACED_REQUESTS_PER_MINUTE / self.rate_share
+        
+        # Messages calls are retried by create_message, so throttles reach the limiter
+        self.messages_client = self.client.with_options(max_retries=0)
+        self.limiter = AdaptiveLimiter(self.max_concurrency, adaptive=ADAPTIVE_CONCURRENCY)
+        
+        # Token usage for the session (match_product runs on worker threads)
+        self.usage_totals = {'requests': 0, 'input_tokens': 0, 'output_tokens': 0,
+                             'cache_read_tokens': 0, 'cache_write_tokens': 0}
+        self._usage_lock = threading.Lock()
+        
+        # Offline schedule index for candidate codes (None without a USITC export)
+        self.hts_index = None
+        if HTS_CANDIDATES > 0:
+            try:
+                self.hts_index = load_index()
+            except Exception as e:
+                logger.warning(f"HTS schedule index unavailable: {e}")
+        if self.hts_index:
+            # Candidate lists change the prompt, so results are cached per schedule revision
+            self.PROMPT_VERSION = f"{self.PROMPT_VERSION}+hts{self.hts_index.version}"
+            logger.info(f"Loaded HTS schedule index ({len(self.hts_index)} codes)")
+    
+    def build_product_block(self, product_info: Dict) -> str:
+        """Format one product's details (and candidate codes, if indexed) for a prompt"""
+        return f"""Name: {product_info.get('name', 'Unknown')}
+SKU: {product_info.get('sku', 'N/A')}
+Description: {product_info.get('description', 'No description')}
+Categories: {', '.join(product_info.get('categories', []))}
+Attributes: {product_info.get('attributes', 'None')}""" + self.build_candidates(product_info)
+    
+    def build_candidates(self, product_info: Dict) -> str:
+        """Shortlist of schedule lines for a product, as a prompt section"""
+        if not self.hts_index:
+            return ''
+        candidates = self.hts_index.search(product_query(product_info), HTS_CANDIDATES)
+        if not candidates:
+            return ''
+        lines = [f"- {c['hts_code']}: ...{c['description'][-160:]}" if len(c['description']) > 160
+                 else f"- {c['hts_code']}: {c['description']}" for c in candidates]
+        return ("\nCandidate HTS codes from the schedule (pick one if it fits; otherwise give the correct code):\n"
+                + '\n'.join(lines))
+    
+    def build_prompt(self, product_info: Dict) -> str:
+        """Build the per-product part of the prompt (the instructions are in HTS_SYSTEM_PROMPT)"""
+        return f"""PRODUCT INFORMATION:
+{self.build_product_block(product_info)}"""
+    
+    def build_packed_prompt(self, products: List[Dict]) -> str:
+        """Build the user prompt for classifying several products in one call"""
+        blocks = [
+            f"PRODUCT {i} (product_id: {product_info['id']}):\n{self.build_product_block(product_info)}"
+            for i, product_info in enumerate(products, 1)
+        ]
+        return (f"Classify each of the following {len(products)} products independently.\n\n"
+                + "\n\n".join(blocks)
+                + "\n\nRespond with a JSON array containing one object per product, in the same order. "
+                  "Each object uses the JSON format above plus a \"product_id\" field copied from the "
+                  "product's header. Return only the JSON array, with no text before or after it.")
+    
+    def estimate_tokens(self, text: str) -> int:
+        """Token count for packing (see extract.estimate_tokens)"""
+        return estimate_tokens(text) + 1
+    
+    def pack_products(self, products: List[Dict], token_budget: int = None,
+                      max_products: int = None) -> List[List[Dict]]:
+        """Group products into packs whose text and expected answers fit a token budget
+
+        Short listings share a call with many others; a product that alone
+        exceeds the budget still gets a call of its own.
+        """
+        token_budget = token_budget or PACK_TOKEN_BUDGET
+        max_products = max_products or PACK_MAX_PRODUCTS
+        
+        packs = []
+        pack, used = [], 0
+        for product_info in products:
+            cost = self.estimate_tokens(self.build_product_block(product_info)) + PACK_OUTPUT_TOKENS
+            if pack and (used + cost > token_budget or len(pack) >= max_products):
+                packs.append(pack)
+                pack, used = [], 0
+            pack.append(product_info)
+            used += cost
+        if pack:
+            packs.append(pack)
+        return packs
+    
+    def request_params(self, product_info: Dict) -> Dict:
+        """Messages API parameters for classifying one product"""
+        return {
+            'model': self.model,
+            'max_tokens': 500,
+            'temperature': 0.2,  # Low temperature for consistency
+            'system': [{
+                'type': 'text',
+                'text': HTS_SYSTEM_PROMPT,
+                'cache_control': {'type': 'ephemeral'}  # Reused across every product
+            }],
+            'messages': [{
+                "role": "user",
+                "content": self.build_prompt(product_info)
+            }]
+        }
+    
+    def packed_request_params(self, products: List[Dict]) -> Dict:
+        """Messages API parameters for classifying several products at once"""
+        params = self.request_params(products[0])
+        params['max_tokens'] = min(500 * len(products), 8192)
+        params['messages'] = [{
+            "role": "user",
+            "content": self.build_packed_prompt(products)
+        }]
+        return params
+    
+    def record_usage(self, usage, latency: float = None) -> Dict:
+        """Add a response's token usage to the session totals and return it as a dict
+        
+        Args:
+            latency: Seconds the request took (None for Message Batches results)
+        """
+        counts = {
+            'input_tokens': usage.input_tokens or 0,
+            'output_tokens': usage.output_tokens or 0,
+            'cache_read_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+            'cache_write_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        }
+        with self._usage_lock:
+            self.usage_totals['requests'] += 1
+            for key, value in counts.items():
+                self.usage_totals[key] += value
+        counts['latency'] = latency
+        return counts
+    
+    def log_usage(self):
+        """Log session token usage, including prompt cache reads and writes"""
+        totals = self.usage_totals
+        if not totals['requests']:
+            return
+        prompt_tokens = totals['input_tokens'] + totals['cache_read_tokens'] + totals['cache_write_tokens']
+        read_share = totals['cache_read_tokens'] / prompt_tokens if prompt_tokens else 0.0
+        logger.info(f"Claude usage: {totals['requests']} requests, {totals['input_tokens']} input tokens, "
+                    f"{totals['output_tokens']} output tokens, prompt cache {totals['cache_read_tokens']} read / "
+                    f"{totals['cache_write_tokens']} written ({read_share:.0%} of prompt tokens from cache)")
+        if self.limiter.throttles:
+            logger.info(f"Claude throttling: {self.limiter.throttles} calls retried after 429/529/5xx; "
+                        f"{self.limiter.limit:.1f} calls in flight allowed at the end")
+    
+    def quota_headroom(self, headers) -> Tuple[Optional[float], Optional[float]]:
+        """Requests the remaining rate-limit quota still allows, and seconds until it resets
+        
+        Reads the anthropic-ratelimit-{requests,tokens,input-tokens,output-tokens}
+        -remaining/-reset headers. Token quotas are converted to requests using
+        this session's average tokens per request; the tightest quota wins.
+        """
+        totals = self.usage_totals
+        requests_seen = max(totals['requests'], 1)
+        input_tokens = totals['input_tokens'] + totals['cache_write_tokens']
+        costs = {
+            'requests': 1.0,
+            'tokens': (input_tokens + totals['output_tokens']) / requests_seen,
+            'input-tokens': input_tokens / requests_seen,
+            'output-tokens': totals['output_tokens'] / requests_seen
+        }
+        
+        headroom = reset_in = None
+        for kind, cost in costs.items():
+            remaining = headers.get(f'anthropic-ratelimit-{kind}-remaining')
+            if remaining is None or cost <= 0:
+                continue
+            try:
+                room = float(remaining) / cost
+            except ValueError:
+                continue
+            if headroom is None or room < headroom:
+                headroom = room
+                reset_in = self.seconds_until(headers.get(f'anthropic-ratelimit-{kind}-reset'))
+        return headroom, reset_in
+    
+    @staticmethod
+    def seconds_until(value: Optional[str]) -> Optional[float]:
+        """Seconds until an RFC 3339 rate-limit reset time"""
+        if not value:
+            return None
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=500,
-                temperature=0.2,  # Low temperature for consistency
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
-            )
+            reset = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return max(0.0, reset.timestamp() - time.time())
+    
+    @staticmethod
+    def retry_after(headers, attempt: int) -> float:
+        """Seconds to wait from a retry-after header, else exponential backoff with jitter"""
+        try:
+            return max(0.0, float(headers.get('retry-after')))
+        except (TypeError, ValueError):
+            return min(60.0, 2.0 ** attempt) * (0.5 + random.random() / 2)
+    
+    def create_message(self, params: Dict) -> Tuple:
+        """Send a Messages request through the adaptive limiter, retrying throttles
+        
+        429/529 responses, transient 5xx errors and connection failures are
+        retried up to CLAUDE_MAX_RETRIES times after the server's retry-after
+        (or an exponential backoff), so a throttle never becomes a fallback
+        classification. Every response's rate-limit headers feed the limiter.
+        
+        Returns:
+            (message, seconds the successful request took)
+        """
+        from anthropic import APIConnectionError, APIStatusError
+        for attempt in range(CLAUDE_MAX_RETRIES + 1):
+            with metrics.span('sleep'):
+                self.limiter.acquire()
+            try:
+                with metrics.span('api_call'):
+                    start_time = time.monotonic()
+                    raw = self.messages_client.messages.with_raw_response.create(**params)
+                    latency = time.monotonic() - start_time
+            except (APIStatusError, APIConnectionError) as e:
+                status = getattr(e, 'status_code', None)
+                if (status is not None and status not in CLAUDE_RETRY_STATUSES) or attempt == CLAUDE_MAX_RETRIES:
+                    raise
+                retry_after = self.retry_after(e.response.headers if status is not None else {}, attempt)
+                self.limiter.on_throttle(retry_after)
+                logger.warning(f"Claude API {status or 'connection error'}: retrying in {retry_after:.1f}s "
+                               f"(attempt {attempt + 1}/{CLAUDE_MAX_RETRIES}, "
+                               f"{int(self.limiter.limit)} calls in flight allowed)")
+                continue
+            finally:
+                self.limiter.release()
+            
+            if ADAPTIVE_CONCURRENCY:
+                rate_limit = raw.headers.get('anthropic-ratelimit-requests-limit')
+                if rate_limit and rate_limit.isdigit():
+                    self.limiter.set_rate(float(rate_limit) / self.rate_share)
+            self.limiter.on_success(*self.quota_headroom(raw.headers))
+            return raw.parse(), latency
+    
+    def match_product(self, product_info: Dict) -> Dict:
+        """Use Claude to match a product to its HTS code"""
+        start_time = time.monotonic()
+        try:
+            response, latency = self.create_message(self.request_params(product_info))
             
-            # Extract JSON from Claude's response
-            response_text = response.content[0].text
+            # Extract JSON from Claude's response; usage rides along for processing_log
+            with metrics.span('parse'):
+                match = self.parse_response(response.content[0].text, product_info)
+            match['usage'] = self.record_usage(response.usage, latency)
+            return match
+                
+        except Exception as e:
+            logger.error(f"Claude API error: {e}")
+            match = self.fallback_match(product_info)
+            match['usage'] = {'latency': time.monotonic() - start_time}
+            return match
+    
+    def match_products(self, products: List[Dict]) -> Tuple[Dict[int, Dict], Set[int]]:
+        """Classify several products with one Claude call
+
+        Each element of the reply is validated on its own. Products missing
+        from the reply or with an invalid code - or all of them, if the reply
+        can't be parsed - are retried with match_product one at a time.
+
+        Returns:
+            (product ID -> match, IDs that needed a single-product retry)
+        """
+        if len(products) == 1:
+            return {products[0]['id']: self.match_product(products[0])}, set()
+        
+        matches = {}
+        try:
+            response, latency = self.create_message(self.packed_request_params(products))
+            usage = self.record_usage(response.usage, latency)
+            latency = usage.pop('latency')
+            with metrics.span('parse'):
+                matches = self.parse_packed_response(response.content[0].text, products)
             
+            # Spread the call's usage over its products so processing_log still adds up
+            for i, product_id in enumerate(matches):
+                matches[product_id]['usage'] = {
+                    key: value // len(matches) + (value % len(matches) if i == 0 else 0)
+                    for key, value in usage.items()
+                }
+                matches[product_id]['usage']['latency'] = latency / len(matches)
+        except Exception as e:
+            logger.error(f"Claude API error for {len(products)} packed products: {e}")
+        
+        retried = set()
+        for product_info in products:
+            if product_info['id'] not in matches:
+                retried.add(product_info['id'])
+                matches[product_info['id']] = self.match_product(product_info)
+        
+        if retried:
+            logger.warning(f"  Packed call: {len(retried)}/{len(products)} products retried individually")
+        return matches, retried
+    
+    def parse_packed_response(self, response_text: str, products: List[Dict]) -> Dict[int, Dict]:
+        """Parse the JSON array of a packed reply, keeping only valid elements for known products"""
+        expected = {str(product_info['id']): product_info['id'] for product_info in products}
+        
+        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        if not json_match:
+            logger.warning("Could not parse JSON array from packed Claude response")
+            return {}
+        try:
+            items = json.loads(json_match.group())
+        except json.JSONDecodeError as e:
+            logger.warning(f"Invalid JSON from packed Claude response: {e}")
+            return {}
+        if not isinstance(items, list):
+            logger.warning("Packed Claude response is not a JSON array")
+            return {}
+        
+        matches = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            product_id = expected.get(str(item.pop('product_id', '')))
+            if product_id is None or product_id in matches:
+                continue
+            if not self.validate_hts_code(item.get('hts_code', '')):
+                logger.warning(f"Invalid HTS code format from Claude for product {product_id}: {item.get('hts_code')}")
+                continue
+            if not isinstance(item.get('confidence'), (int, float)):
+                logger.warning(f"Missing confidence from Claude for product {product_id}")
+                continue
+            matches[product_id] = self.check_schedule(item)
+        return matches
+    
+    def parse_response(self, response_text: str, product_info: Dict) -> Dict:
+        """Parse and validate the JSON classification in a Claude response"""
+        try:
             # Try to parse JSON from response
             json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
             if json_match:
@@ -434,7 +831,7 @@ Focus on accuracy - this will be used for actual customs declarations."""
                 
                 # Validate the response
                 if self.validate_hts_code(result.get('hts_code', '')):
-                    return result
+                    return self.check_schedule(result)
                 else:
                     logger.warning(f"Invalid HTS code format from Claude: {result.get('hts_code')}")
                     return self.fallback_match(product_info)
@@ -442,16 +839,63 @@ Focus on accuracy - this will be used for actual customs declarations."""
                 logger.warning("Could not parse JSON from Claude response")
                 return self.fallback_match(product_info)
                 
-        except Exception as e:
-            logger.error(f"Claude API error: {e}")
+        except json.JSONDecodeError as e:
+            logger.warning(f"Invalid JSON from Claude: {e}")
             return self.fallback_match(product_info)
     
+    def submit_batch(self, items: Dict[str, Dict]) -> str:
+        """Submit products to the Message Batches API
+        
+        Args:
+            items: Mapping of custom_id -> extracted product features
+            
+        Returns:
+            The Message Batch ID
+        """
+        batch = self.client.messages.batches.create(
+            requests=[
+                {'custom_id': custom_id, 'params': self.request_params(features)}
+                for custom_id, features in items.items()
+            ]
+        )
+        return batch.id
+    
+    def get_batch(self, batch_id: str):
+        """Fetch the current state of a Message Batch"""
+        return self.client.messages.batches.retrieve(batch_id)
+    
+    def iter_batch_results(self, batch_id: str, items: Dict[str, Dict]):
+        """Stream parsed results of a finished Message Batch
+        
+        Yields (custom_id, match) pairs. Errored, canceled or expired requests
+        fall back to the manual-review match, like failed synchronous calls.
+        """
+        for entry in self.client.messages.batches.results(batch_id):
+            product_info = items.get(entry.custom_id, {})
+            
+            if entry.result.type == 'succeeded':
+                match = self.parse_response(entry.result.message.content[0].text, product_info)
+                match['usage'] = self.record_usage(entry.result.message.usage)
+            else:
+                logger.error(f"Batch request {entry.custom_id} {entry.result.type}")
+                match = self.fallback_match(product_info)
+            
+            yield entry.custom_id, match
+    
     def validate_hts_code(self, code: str) -> bool:
         """Validate HTS code format"""
         # HTS codes should be ####.##.#### format
         pattern = r'^\d{4}\.\d{2}\.\d{4}$'
         return bool(re.match(pattern, code))
     
+    def check_schedule(self, match: Dict) -> Dict:
+        """Send well-formed codes that aren't lines of the indexed schedule to manual review"""
+        if self.hts_index and not self.hts_index.contains(match['hts_code']):
+            logger.warning(f"HTS code {match['hts_code']} is not in the local schedule")
+            match['confidence'] = min(float(match.get('confidence') or 0.0), 0.5)
+            match['reasoning'] = f"{match.get('reasoning', '')} [Code not found in the HTS schedule]".strip()
+        return match
+    
     def fallback_match(self, product_info: Dict) -> Dict:
         """Fallback if Claude fails"""
         return {
@@ -464,63 +908,51 @@ Focus on accuracy - this will be used for actual customs declarations."""
         }
 
 class WooCommerceHTSMatcher:
-    def __init__(self, config: WooConfig, hts_db_path: str = 'hts_codes.db'):
+    # sync_state key holding the newest date_modified_gmt seen by fetch_changed_products
+    SYNC_KEY = 'products_modified_gmt'
+    
+    def __init__(self, config: WooConfig, hts_db_path: str = 'hts_codes.db', rate_share: int = 1):
+        """
+        Args:
+            config: Store and API credentials
+            hts_db_path: Local SQLite database
+            rate_share: Processes splitting the Claude limits (see HTSMatcher)
+        """
         self.config = config
-        self.api_url = f"{config.url}/wp-json/wc/v3"
-        
-        # Check if using WordPress Application Password (no 'ck_' prefix)
-        if config.consumer_key.startswith('ck_'):
-            # WooCommerce REST API keys
-            self.auth = HTTPBasicAuth(config.consumer_key, config.consumer_secret)
-        else:
-            # WordPress Application Password - remove spaces
-            self.auth = HTTPBasicAuth(config.consumer_key, config.consumer_secret.replace(' ', ''))
         
-        # Check if local development
-        self.is_local = '.local' in config.url or 'localhost' in config.url
-        self.verify_ssl = not self.is_local
-        
-        self.hts_db = sqlite3.connect(hts_db_path)
-        self.claude_matcher = HTSMatcher(config.anthropic_api_key)
+        # Shared pooled client (auth, SSL and retries are handled there)
+        self.woo = WooClient.from_config(config)
+        self.api_url = self.woo.api_url
+        self.auth = self.woo.auth
+        self.is_local = self.woo.is_local
+        self.verify_ssl = self.woo.verify_ssl
+        
+        # WAL-mode connection; per-product rows go through a write-behind buffer
+        self.hts_db_path = hts_db_path
+        self.hts_db = connect_db(hts_db_path)
+        self.write_buffer = WriteBuffer(self.hts_db)
+        atexit.register(self.flush_writes)
+        self.claude_matcher = HTSMatcher(config.anthropic_api_key, rate_share=rate_share)
         self.create_tables()
         
-    def create_tables(self):
-        """Create local tracking database"""
-        cursor = self.hts_db.cursor()
+        # Classification cache counters for the current session
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Cache entries still in the write buffer (valid until its next flush)
+        self.buffered_cache: Dict[str, str] = {}
+        self.buffered_cache_flushes = 0
         
-        # Enhanced product matching table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS product_matches (
-                product_id INTEGER PRIMARY KEY,
-                sku TEXT,
-                name TEXT,
-                description TEXT,
-                categories TEXT,
-                hts_code TEXT,
-                hts_description TEXT,
-                confidence REAL,
-                reasoning TEXT,
-                material TEXT,
-                alternative_codes TEXT,
-                status TEXT,  -- 'pending', 'approved', 'rejected', 'manual'
-                matched_at TIMESTAMP,
-                updated_at TIMESTAMP,
-                review_notes TEXT
-            )
-        ''')
+        # Nearest-neighbour index over approved matches (loaded on first use)
+        self.knn_index = None
+        self.knn_hits = 0
         
-        # Processing history for rate limiting
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS processing_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                api_calls INTEGER,
-                processing_time REAL,
-                timestamp TIMESTAMP
-            )
-        ''')
+        # Run ID of the process_products call in progress (see start_run)
+        self.active_run = None
         
-        self.hts_db.commit()
+    def create_tables(self):
+        """Create or upgrade the local tracking database (see schema.py)"""
+        version = migrate(self.hts_db)
+        logger.debug(f"Database schema version {version}")
     
     def fetch_all_products(self, limit: Optional[int] = None, skip_processed: bool = False, max_pages: int = None) -> List[Dict]:
         """Fetch all products from WooCommerce
@@ -531,9 +963,9 @@ class WooCommerceHTSMatcher:
             max_pages: Maximum number of pages to scan (useful for checking only recent products)
         """
         products = []
-        page = 1
         per_page = 100
         consecutive_empty_pages = 0
+        fields = product_fields('classify', 'filter')
         
         # Get already processed product IDs if skip_processed is True
         processed_ids = set()
@@ -541,27 +973,26 @@ class WooCommerceHTSMatcher:
             processed_ids = self.get_processed_product_ids()
             logger.info(f"Found {len(processed_ids)} already processed products to skip")
         
-        while True:
-            logger.info(f"Fetching products page {page}...")
-            
-            response = requests.get(
-                f"{self.api_url}/products",
-                auth=self.auth,
-                verify=self.verify_ssl,  # Use SSL setting
-                params={
-                    'page': page,
-                    'per_page': per_page,
-                    'status': 'publish',
-                    'orderby': 'date',  # Order by date to get newest first
-                    'order': 'desc'     # Descending order (newest first)
-                }
-            )
+        # Page 1 tells us the page count; later pages are fetched in parallel
+        # windows but arrive here in order, so the stop rules below still apply
+        for page, response in self.woo.iter_pages(
+            "/products",
+            params={
+                'per_page': per_page,
+                'status': 'publish',
+                'orderby': 'date',  # Order by date to get newest first
+                'order': 'desc',    # Descending order (newest first)
+                '_fields': fields
+            },
+            max_pages=max_pages
+        ):
+            logger.info(f"Fetched products page {page}...")
             
             if response.status_code != 200:
                 logger.error(f"API Error: {response.status_code} - {response.text}")
                 break
-                
-            batch = response.json()
+            
+            batch = [lean_product(p, fields) for p in response.json()]
             
             if not batch:
                 break
@@ -598,14 +1029,6 @@ class WooCommerceHTSMatcher:
             if max_pages and page >= max_pages:
                 logger.info(f"  Reached maximum page limit ({max_pages} pages)")
                 break
-                
-            # Check if there are more pages
-            total_pages = int(response.headers.get('X-WP-TotalPages', 1))
-            if page >= total_pages:
-                break
-                
-            page += 1
-            time.sleep(0.5)  # Be nice to the API
         
         if skip_processed:
             logger.info(f"Fetched {len(products)} unprocessed products")
@@ -613,8 +1036,196 @@ class WooCommerceHTSMatcher:
             logger.info(f"Fetched {len(products)} total products")
         return products
     
+    def iter_catalog_products(self, skip_processed: bool = False) -> Iterator[Dict]:
+        """Lazily yield lean published products, newest first, page by page
+
+        Unlike fetch_all_products this never holds more than a window of
+        pages and has no early-stop heuristics, so it suits full streaming runs.
+        """
+        fields = product_fields('classify', 'filter')
+        # Read processed IDs now: the generator may be consumed on another thread
+        processed_ids = self.get_processed_product_ids() if skip_processed else set()
+        
+        def generate():
+            for page, response in self.woo.iter_pages(
+                "/products",
+                params={
+                    'per_page': 100,
+                    'status': 'publish',
+                    'orderby': 'date',
+                    'order': 'desc',
+                    '_fields': fields
+                }
+            ):
+                if response.status_code != 200:
+                    logger.error(f"API Error: {response.status_code} - {response.text}")
+                    return
+                
+                batch = response.json()
+                if not batch:
+                    return
+                
+                logger.info(f"Fetched products page {page}")
+                for product in batch:
+                    if product['id'] not in processed_ids:
+                        yield lean_product(product, fields)
+        
+        return generate()
+    
+    @instrument_run('process_catalog_streaming')
+    def process_catalog_streaming(self, products: Iterator[Dict] = None, push: bool = False,
+                                  concurrency: int = None) -> Dict:
+        """Classify the catalog while it downloads, optionally pushing as results are saved
+
+        Args:
+            products: Products to stream (defaults to every unprocessed product)
+            push: Push approved codes to WooCommerce in batches as they are saved
+            concurrency: Claude calls in flight (defaults to MAX_CONCURRENCY)
+
+        Returns:
+            Pipeline statistics (see ClassificationPipeline.run)
+        """
+        if products is None:
+            products = self.iter_catalog_products(skip_processed=True)
+        
+        concurrency = concurrency or self.claude_matcher.max_concurrency
+        self.claude_matcher.limiter.set_max_concurrency(concurrency)
+        self.prune_cache()
+        pipeline = ClassificationPipeline(
+            self,
+            concurrency=concurrency,
+            requests_per_minute=self.claude_matcher.paced_requests_per_minute,
+            push=push,
+            knn=KNN_CLASSIFY
+        )
+        stats = pipeline.run(products)
+        self.log_cache_stats()
+        return stats
+    
+    def get_sync_state(self, key: str) -> Optional[str]:
+        """Read a value from the sync_state table"""
+        cursor = self.hts_db.cursor()
+        cursor.execute("SELECT value FROM sync_state WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def set_sync_state(self, key: str, value: str):
+        """Store a value in the sync_state table"""
+        cursor = self.hts_db.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO sync_state (key, value, updated_at)
+            VALUES (?, ?, ?)
+        ''', (key, value, db_timestamp()))
+        self.hts_db.commit()
+    
+    def fetch_changed_products(self, full_scan: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        """Fetch products added or edited since the last sync
+
+        Only products with date_modified_gmt after the stored high-water mark
+        are requested; the first sync (or full_scan=True) walks the whole
+        catalog once. Products whose classification inputs are unchanged
+        since they were last classified are dropped, so price or stock edits
+        don't cost an API call.
+
+        Returns:
+            (products to classify, new high-water mark). Pass the mark to
+            commit_sync() after the products are processed so an interrupted
+            run picks them up again. It is None if the fetch failed.
+        """
+        since = None if full_scan else self.get_sync_state(self.SYNC_KEY)
+        fields = product_fields('classify', 'filter')
+        params = {
+            'per_page': 100,
+            'status': 'publish',
+            'orderby': 'id',  # Stable paging while the store is being edited
+            'order': 'asc',
+            '_fields': fields
+        }
+        
+        if since:
+            # modified_after is exclusive; overlap by a second so edits made in
+            # the same second as the last sync aren't lost (unchanged products
+            # are filtered out below anyway)
+            overlap = datetime.strptime(since, '%Y-%m-%dT%H:%M:%S') - timedelta(seconds=1)
+            params['modified_after'] = overlap.strftime('%Y-%m-%dT%H:%M:%S')
+            params['dates_are_gmt'] = 'true'
+            logger.info(f"Fetching products modified after {since} GMT")
+        else:
+            logger.info("No previous sync recorded - scanning the full catalog once")
+        
+        fetched = []
+        high_water_mark = since
+        for page, response in self.woo.iter_pages("/products", params=params):
+            if response.status_code != 200:
+                logger.error(f"API Error: {response.status_code} - {response.text}")
+                # Classify what was fetched, minus unchanged products, but keep the old mark
+                return self.filter_changed_products(fetched), None
+            
+            batch = [lean_product(p, fields) for p in response.json()]
+            if not batch:
+                break
+            fetched.extend(batch)
+        
+        for product in fetched:
+            modified = product.get('date_modified_gmt')
+            if modified and (high_water_mark is None or modified > high_water_mark):
+                high_water_mark = modified
+        
+        changed = self.filter_changed_products(fetched)
+        logger.info(f"Sync: {len(fetched)} products modified, {len(changed)} new or changed, "
+                    f"{len(fetched) - len(changed)} unchanged")
+        return changed, high_water_mark
+    
+    def filter_changed_products(self, products: List[Dict]) -> List[Dict]:
+        """Keep products that are new, failed last time, or whose classification inputs changed"""
+        # Compare against what was classified last time
+        self.flush_writes()
+        cursor = self.hts_db.cursor()
+        ids = [product['id'] for product in products]
+        stored = {}
+        for start in range(0, len(ids), 500):  # Stay under SQLite's bound-parameter limit
+            chunk = ids[start:start + 500]
+            cursor.execute(f"SELECT product_id, feature_hash, hts_code FROM product_matches "
+                           f"WHERE product_id IN ({','.join('?' * len(chunk))})", chunk)
+            stored.update({product_id: (digest, hts_code) for product_id, digest, hts_code in cursor.fetchall()})
+        
+        changed = []
+        backfill = []
+        for product, features in zip(products, self.extract_features_batch(products)):
+            digest = self.feature_hash(features)
+            previous = stored.get(product['id'])
+            
+            if previous is None or previous[1] == '9999.99.9999':
+                changed.append(product)  # New, or classification failed last time
+            elif previous[0] is None:
+                backfill.append((digest, product['id']))  # Classified before hashes were recorded
+            elif previous[0] != digest:
+                changed.append(product)
+        
+        if backfill:
+            cursor.executemany("UPDATE product_matches SET feature_hash = ? WHERE product_id = ?", backfill)
+            self.hts_db.commit()
+        return changed
+    
+    def commit_sync(self, high_water_mark: Optional[str]):
+        """Record the high-water mark returned by fetch_changed_products"""
+        if high_water_mark:
+            self.set_sync_state(self.SYNC_KEY, high_water_mark)
+            logger.info(f"Sync high-water mark set to {high_water_mark} GMT")
+    
+    def flush_writes(self):
+        """Write buffered product_matches/processing_log/classification_cache rows to the database"""
+        self.write_buffer.flush()
+    
+    def close(self):
+        """Flush buffered rows and close the database connection"""
+        self.write_buffer.close()
+        self.hts_db.close()
+        atexit.unregister(self.flush_writes)
+    
     def get_processed_product_ids(self) -> Set[int]:
         """Get IDs of products that have already been processed and approved"""
+        self.flush_writes()
         cursor = self.hts_db.cursor()
         cursor.execute("""
             SELECT product_id 
@@ -631,18 +1242,225 @@ class WooCommerceHTSMatcher:
     
     def clear_all_matches(self):
         """Clear all HTS matches from the database"""
+        self.flush_writes()
         cursor = self.hts_db.cursor()
         cursor.execute("DELETE FROM product_matches")
         cursor.execute("DELETE FROM processing_log")
+        cursor.execute("DELETE FROM classification_cache")
         self.hts_db.commit()
+        self.knn_index = None
         logger.info("Cleared all HTS matches from database")
     
-    def extract_product_features(self, product: Dict) -> Dict:
-        """Extract and clean product information for Claude"""
+    def cache_key(self, features: Dict) -> str:
+        """Stable hash of a product's classification inputs
+
+        The product ID is left out so identical products share an entry;
+        the model and prompt version are included so changing either one
+        invalidates old results.
+        """
+        payload = {k: v for k, v in features.items() if k != 'id'}
+        payload['_model'] = self.claude_matcher.model
+        payload['_prompt_version'] = self.claude_matcher.PROMPT_VERSION
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+    
+    def feature_hash(self, features: Dict) -> str:
+        """Hash of a product's classification inputs, used to detect edits
+
+        Price is left out: repricing doesn't change a tariff classification.
+        """
+        payload = {k: v for k, v in features.items() if k not in ('id', 'price')}
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+    
+    def get_cached_match(self, features: Dict) -> Optional[Dict]:
+        """Return the cached classification for unchanged product content"""
+        with metrics.span('cache_lookup'):
+            key = self.cache_key(features)
+            cursor = self.hts_db.cursor()
+            cursor.execute("SELECT result FROM classification_cache WHERE cache_key = ?", (key,))
+            row = cursor.fetchone()
+            
+            if row is None:
+                result = self.unflushed_cache().get(key)
+                if result is None:
+                    self.cache_misses += 1
+                    return None
+            else:
+                result = row[0]
+            
+            self.cache_hits += 1
+            # Hit counters are written with the next batch of buffered rows
+            self.write_buffer.add('''
+                UPDATE classification_cache
+                SET last_used_at = ?, hit_count = hit_count + 1
+                WHERE cache_key = ?
+            ''', (db_timestamp(), key))
+            return json.loads(result)
+    
+    def cache_match(self, features: Dict, match: Dict):
+        """Store a successful classification in the cache"""
+        # Never cache fallbacks - those products should be retried next time
+        if match.get('hts_code') == '9999.99.9999':
+            return
+        # Token usage belongs to the original call, not to later cache hits
+        match = {k: v for k, v in match.items() if k != 'usage'}
+        
+        key = self.cache_key(features)
+        result = json.dumps(match)
+        now = db_timestamp()
+        self.write_buffer.add('''
+            INSERT OR REPLACE INTO classification_cache
+            (cache_key, product_id, model, prompt_version, result, created_at, last_used_at, hit_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+        ''', (
+            key,
+            features.get('id'),
+            self.claude_matcher.model,
+            self.claude_matcher.PROMPT_VERSION,
+            result,
+            now,
+            now
+        ))
+        if len(self.write_buffer):
+            self.unflushed_cache()[key] = result
+    
+    def unflushed_cache(self) -> Dict[str, str]:
+        """Cache results written by cache_match that are still in the write buffer"""
+        if self.write_buffer.flushes != self.buffered_cache_flushes:
+            # Everything buffered before the last flush is in the table now
+            self.buffered_cache = {}
+            self.buffered_cache_flushes = self.write_buffer.flushes
+        return self.buffered_cache
+    
+    def invalidate_cache(self, product_id: int) -> int:
+        """Drop cached classifications for one product so it is sent to Claude again"""
+        self.flush_writes()
+        cursor = self.hts_db.cursor()
+        cursor.execute("DELETE FROM classification_cache WHERE product_id = ?", (product_id,))
+        self.hts_db.commit()
+        return cursor.rowcount
+    
+    def prune_cache(self):
+        """Evict stale cache entries
+
+        Removes entries for other models or prompt versions, entries unused
+        for CACHE_TTL_DAYS, and the least recently used entries beyond
+        CACHE_MAX_ENTRIES.
+        """
+        self.flush_writes()
+        cursor = self.hts_db.cursor()
+        cursor.execute('''
+            DELETE FROM classification_cache
+            WHERE model != ? OR prompt_version != ?
+        ''', (self.claude_matcher.model, self.claude_matcher.PROMPT_VERSION))
+        removed = cursor.rowcount
+        
+        cursor.execute('''
+            DELETE FROM classification_cache
+            WHERE last_used_at < ?
+        ''', (db_timestamp(datetime.now() - timedelta(days=CACHE_TTL_DAYS)),))
+        removed += cursor.rowcount
+        
+        cursor.execute('''
+            DELETE FROM classification_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM classification_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (CACHE_MAX_ENTRIES,))
+        removed += cursor.rowcount
+        
+        self.hts_db.commit()
+        if removed:
+            logger.info(f"Evicted {removed} stale classification cache entries")
+    
+    def log_cache_stats(self):
+        """Log classification cache hit/miss counters"""
+        lookups = self.cache_hits + self.cache_misses
+        if lookups:
+            logger.info(f"Classification cache: {self.cache_hits} hits, {self.cache_misses} misses "
+                        f"({self.cache_hits / lookups:.0%} hit rate)")
+        self.claude_matcher.log_usage()
+    
+    def get_knn_index(self) -> NeighbourIndex:
+        """Nearest-neighbour index over approved matches, built from product_matches on first use
+        
+        Matches assigned by the index itself are left out so its answers
+        can't reinforce each other. save_match keeps it current afterwards.
+        """
+        if self.knn_index is None:
+            self.flush_writes()
+            cursor = self.hts_db.cursor()
+            cursor.execute("""
+                SELECT product_id, name, categories, attributes, material,
+                       hts_code, hts_description, confidence
+                FROM product_matches
+                WHERE status = 'approved'
+                AND hts_code IS NOT NULL
+                AND hts_code != '9999.99.9999'
+                AND COALESCE(source, 'claude') != 'knn'
+            """)
+            index = NeighbourIndex()
+            for row in cursor.fetchall():
+                product_id, name, categories, attributes, material, hts_code, hts_description, confidence = row
+                index.add(product_id, name, (categories or '').split(', '), attributes or '', {
+                    'hts_code': hts_code, 'hts_description': hts_description,
+                    'confidence': confidence, 'material': material
+                })
+            self.knn_index = index
+            logger.info(f"Loaded nearest-neighbour index with {len(index)} approved products")
+        return self.knn_index
+    
+    def update_knn_index(self, match: Dict):
+        """Add a saved approved match to the loaded index, or drop a product that no longer qualifies"""
+        if self.knn_index is None:
+            return
+        if (match['status'] == 'approved' and match.get('source') != 'knn'
+                and match['hts_code'] != '9999.99.9999'):
+            self.knn_index.add(
+                match['product_id'], match['name'], match['categories'].split(', '),
+                match.get('attributes') or '',
+                {'hts_code': match['hts_code'], 'hts_description': match['hts_description'],
+                 'confidence': match['confidence'], 'material': match.get('material')}
+            )
+        else:
+            self.knn_index.remove(match['product_id'])
+    
+    def fetch_product(self, product_id: int) -> Optional[Dict]:
+        """Fetch a single product from WooCommerce"""
+        fields = product_fields('classify', 'filter')
+        response = self.woo.get(f"/products/{product_id}", params={'_fields': fields})
+        
+        if response.status_code != 200:
+            logger.error(f"Failed to fetch product {product_id}: {response.status_code}")
+            return None
+        return lean_product(response.json(), fields)
+    
+    def refresh_product(self, product_id: int) -> Optional[Dict]:
+        """Reclassify one product with Claude, ignoring any cached result"""
+        product = self.fetch_product(product_id)
+        if product is None:
+            return None
+        
+        self.invalidate_cache(product_id)
+        results = self.process_products([product], force_refresh={product_id})
+        return results[0] if results else None
+    
+    def extract_product_features(self, product: Dict, descriptions: Tuple[str, str] = None) -> Dict:
+        """Extract and clean product information for Claude
+        
+        Args:
+            descriptions: Precomputed description_texts() result, if any
+        """
         
-        # Clean HTML from descriptions
-        description = self.clean_html(product.get('description', ''))
-        short_desc = self.clean_html(product.get('short_description', ''))
+        # Plain text of the descriptions within EXTRACT_TOKEN_BUDGET, without
+        # markup, boilerplate or sentences repeated between the two
+        if descriptions is None:
+            with metrics.span('extract'):
+                descriptions = description_texts(product)
+        description, short_desc = descriptions
         
         # Get categories and tags
         categories = [cat.get('name', '') for cat in product.get('categories', [])]
@@ -661,8 +1479,8 @@ class WooCommerceHTSMatcher:
             'id': product.get('id'),
             'sku': product.get('sku', ''),
             'name': product.get('name', ''),
-            'description': description[:1000],  # Limit length for API
-            'short_description': short_desc[:500],
+            'description': description,
+            'short_description': short_desc,
             'categories': categories,
             'tags': tags,
             'attributes': ', '.join(attributes),
@@ -671,25 +1489,106 @@ class WooCommerceHTSMatcher:
             'dimensions': product.get('dimensions', {})
         }
     
-    def clean_html(self, text: str) -> str:
-        """Remove HTML tags from text"""
-        clean = re.sub('<.*?>', '', text)
-        clean = re.sub(r'\s+', ' ', clean)
-        return clean.strip()
+    def extract_features_batch(self, products: List[Dict]) -> List[Dict]:
+        """Extract features for a list of products
+        
+        Variants and re-listings often share their description HTML, so each
+        distinct pair of descriptions is only parsed once per batch.
+        """
+        texts = {}
+        features_list = []
+        for product in products:
+            key = (product.get('description') or '', product.get('short_description') or '')
+            if key not in texts:
+                with metrics.span('extract'):
+                    texts[key] = description_texts(product)
+            features_list.append(self.extract_product_features(product, texts[key]))
+        return features_list
     
-    def process_products(self, products: List[Dict], batch_size: int = None):
-        """Process products in batches with Claude"""
+    @instrument_run('process_products')
+    def process_products(self, products: List[Dict], batch_size: int = None, concurrency: int = None,
+                         force_refresh: Optional[Set[int]] = None, dedup: bool = None, pack: bool = None,
+                         knn: bool = None, run_id: str = None, record_run: bool = True):
+        """Process products in batches with Claude
+
+        Each top-level call is recorded as a run (see start_run), so an
+        interrupted call can be finished later with resume_run.
+
+        Args:
+            products: WooCommerce products to classify
+            batch_size: Products per batch (the sequential loop pauses between batches)
+            concurrency: Number of Claude calls in flight; 1 keeps the sequential loop
+            force_refresh: Product IDs to send to Claude even if the cache has a result
+            dedup: Classify one product per duplicate group (defaults to DEDUP_PRODUCTS)
+            pack: Classify several products per Claude call (defaults to PACK_PRODUCTS)
+            knn: Assign codes from agreeing approved neighbours first (defaults to KNN_CLASSIFY)
+            run_id: Continue this recorded run instead of starting a new one
+            record_run: False for callers that track progress themselves (the work queue)
+        """
         
         if batch_size is None:
             batch_size = BATCH_SIZE
-            
+        if concurrency is None:
+            concurrency = self.claude_matcher.max_concurrency
+        
+        if force_refresh is None:
+            force_refresh = set()
+        if dedup is None:
+            dedup = DEDUP_PRODUCTS
+        if pack is None:
+            pack = PACK_PRODUCTS
+        if knn is None:
+            knn = KNN_CLASSIFY
+        
+        if self.active_run is not None or not products or not record_run:
+            # Nested call (duplicate representatives, kNN remainder) inside a recorded run, or unrecorded
+            return self.classify_products(products, batch_size, concurrency, force_refresh, dedup, pack, knn)
+        
+        self.active_run = run_id or self.start_run(products, {
+            'batch_size': batch_size, 'concurrency': concurrency, 'dedup': dedup, 'pack': pack, 'knn': knn,
+            'force_refresh': sorted(force_refresh)
+        })
+        try:
+            return self.classify_products(products, batch_size, concurrency, force_refresh, dedup, pack, knn)
+        finally:
+            self.finish_run()
+    
+    def classify_products(self, products: List[Dict], batch_size: int, concurrency: int,
+                          force_refresh: Set[int], dedup: bool, pack: bool, knn: bool) -> List[Dict]:
+        """Route products to the classification path selected by process_products"""
+        # The run's concurrency, not the MAX_CONCURRENCY default, caps Claude calls in flight
+        self.claude_matcher.limiter.set_max_concurrency(concurrency)
+
+        if dedup and len(products) > 1:
+            return self.process_products_deduplicated(products, batch_size, concurrency, force_refresh,
+                                                      pack=pack, knn=knn)
+        
+        if knn and products:
+            return self.process_products_knn(products, batch_size, concurrency, force_refresh, pack=pack)
+        
+        self.prune_cache()
+        
+        if pack and len(products) > 1:
+            results = self.process_products_packed(products, batch_size, concurrency, force_refresh)
+            self.flush_writes()
+            self.log_cache_stats()
+            return results
+        
+        if concurrency > 1:
+            results = self.process_products_concurrent(products, batch_size, concurrency, force_refresh)
+            self.flush_writes()
+            self.log_cache_stats()
+            return results
+        
         results = []
         total = len(products)
+        progress = Progress(total)
         
         for i in range(0, total, batch_size):
             batch = products[i:i+batch_size]
             batch_num = (i // batch_size) + 1
             total_batches = (total + batch_size - 1) // batch_size
+            api_calls_in_batch = 0
             
             logger.info(f"\nProcessing batch {batch_num}/{total_batches}")
             
@@ -701,62 +1600,566 @@ class WooCommerceHTSMatcher:
                 
                 logger.info(f"  Analyzing: {features['name'][:50]}...")
                 
-                # Get Claude's classification
-                match = self.claude_matcher.match_product(features)
+                # Reuse a cached classification if the product hasn't changed
+                match = None
+                if product['id'] not in force_refresh:
+                    match = self.get_cached_match(features)
                 
-                # Determine auto-approval based on confidence
-                if match['confidence'] >= AUTO_APPROVE_THRESHOLD:
-                    status = 'approved'
-                elif match['confidence'] >= 0.60:
-                    status = 'pending'
+                if match is None:
+                    # Get Claude's classification
+                    self.set_run_state([product['id']], 'in_flight')
+                    match = self.claude_matcher.match_product(features)
+                    self.cache_match(features, match)
+                    api_calls = 1
                 else:
-                    status = 'manual'
+                    api_calls = 0
                 
                 # Store result
-                result = {
-                    'product_id': product['id'],
-                    'sku': features['sku'],
-                    'name': features['name'],
-                    'description': features['description'][:200],
-                    'categories': ', '.join(features['categories']),
-                    'hts_code': match['hts_code'],
-                    'hts_description': match.get('hts_description', ''),
-                    'confidence': match['confidence'],
-                    'reasoning': match.get('reasoning', ''),
-                    'material': match.get('material', ''),
-                    'alternative_codes': json.dumps(match.get('alternative_codes', [])),
-                    'status': status
-                }
-                
+                result = self.build_result(product, features, match)
                 results.append(result)
                 self.save_match(result)
                 
                 # Log processing time
                 processing_time = time.time() - start_time
-                self.log_processing(product['id'], 1, processing_time)
+                self.log_processing(product['id'], api_calls, processing_time, match.get('usage'))
                 
-                logger.info(f"    → HTS: {match['hts_code']} (confidence: {match['confidence']:.0%})")
+                cached_note = " [cached]" if api_calls == 0 else ""
+                logger.info(f"    → HTS: {match['hts_code']} (confidence: {match['confidence']:.0%}){cached_note}")
                 
-                # Rate limiting for Claude API
-                time.sleep(RATE_LIMIT_DELAY)
+                progress.update(len(results))
+                
+                # Rate limiting for Claude API (the adaptive limiter paces calls itself)
+                if api_calls:
+                    api_calls_in_batch += 1
+                    if not ADAPTIVE_CONCURRENCY:
+                        with metrics.span('sleep'):
+                            time.sleep(RATE_LIMIT_DELAY)
             
             # Pause between batches
-            if batch_num < total_batches:
+            if batch_num < total_batches and api_calls_in_batch and not ADAPTIVE_CONCURRENCY:
                 logger.info(f"  Batch complete. Pausing before next batch...")
-                time.sleep(5)
+                with metrics.span('sleep'):
+                    time.sleep(5)
         
+        self.flush_writes()
+        self.log_cache_stats()
         return results
     
-    def save_match(self, match: Dict):
-        """Save match to local database"""
+    def process_products_concurrent(self, products: List[Dict], batch_size: int, concurrency: int,
+                                    force_refresh: Set[int]):
+        """Classify products on a thread pool, saving results in input order
+        
+        Claude calls run on worker threads and are paced by a token bucket
+        (REQUESTS_PER_MINUTE) instead of fixed sleeps. Results are consumed in
+        the original order on this thread, so save_match/log_processing keep
+        using the single SQLite connection.
+        """
+        total = len(products)
+        limiter = TokenBucket(rate=self.claude_matcher.paced_requests_per_minute / 60.0, capacity=concurrency)
+        
+        pacing = ("adaptive" if ADAPTIVE_CONCURRENCY
+                  else f"max {self.claude_matcher.requests_per_minute:g} requests/minute")
+        logger.info(f"Processing {total} products with {concurrency} concurrent requests ({pacing})")
+        
+        def classify(features: Dict):
+            with metrics.span('sleep'):
+                limiter.acquire()
+            start_time = time.time()
+            match = self.claude_matcher.match_product(features)
+            return match, time.time() - start_time
+        
+        results = []
+        progress = Progress(total)
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Cache lookups stay on this thread; only misses are sent to Claude
+            jobs = []
+            for product, features in zip(products, self.extract_features_batch(products)):
+                cached = None if product['id'] in force_refresh else self.get_cached_match(features)
+                future = None
+                if cached is None:
+                    self.set_run_state([product['id']], 'in_flight')
+                    future = executor.submit(classify, features)
+                jobs.append((product, features, cached, future))
+            
+            try:
+                for done, (product, features, cached, future) in enumerate(jobs, 1):
+                    if future is None:
+                        match, processing_time, api_calls = cached, 0.0, 0
+                    else:
+                        match, processing_time = future.result()
+                        self.cache_match(features, match)
+                        api_calls = 1
+                
+                    result = self.build_result(product, features, match)
+                    results.append(result)
+                    self.save_match(result)
+                    self.log_processing(product['id'], api_calls, processing_time, match.get('usage'))
+                
+                    cached_note = " [cached]" if api_calls == 0 else ""
+                    logger.info(f"  [{done}/{total}] {features['name'][:50]}... "
+                                f"→ HTS: {match['hts_code']} (confidence: {match['confidence']:.0%}){cached_note}")
+                    progress.update(done)
+            except BaseException:
+                self.cache_finished_calls(executor, [([features], future) for _, features, _, future in jobs if future])
+                raise
+        
+        return results
+    
+    def cache_finished_calls(self, executor: ThreadPoolExecutor, calls: List[Tuple[List[Dict], object]],
+                             packed: bool = False):
+        """Cancel queued Claude calls and cache the ones that already returned
+        
+        Used when a concurrent run is interrupted: answers that arrived but
+        weren't saved yet would otherwise be paid for again by resume_run.
+        
+        Args:
+            calls: (features of the call's products, future) pairs
+            packed: Futures return {product ID: match} rather than a single match
+        """
+        executor.shutdown(wait=True, cancel_futures=True)
+        for features_list, future in calls:
+            if future.cancelled() or future.exception() is not None:
+                continue
+            matches = future.result()[0]
+            if not packed:
+                matches = {features_list[0]['id']: matches}
+            for features in features_list:
+                if features['id'] in matches:
+                    self.cache_match(features, matches[features['id']])
+    
+    def process_products_packed(self, products: List[Dict], batch_size: int, concurrency: int,
+                                force_refresh: Set[int]) -> List[Dict]:
+        """Classify cache misses several to a Claude call, saving results in input order
+
+        Misses are grouped by HTSMatcher.pack_products to fit PACK_TOKEN_BUDGET
+        and the packs run on a thread pool paced like process_products_concurrent.
+        Each packed call is logged against its first product in processing_log.
+        """
+        total = len(products)
+        concurrency = max(1, concurrency)
+        limiter = TokenBucket(rate=self.claude_matcher.paced_requests_per_minute / 60.0, capacity=concurrency)
+        
+        # Cache lookups stay on this thread; only misses are packed for Claude
+        jobs = []
+        misses = []
+        for product, features in zip(products, self.extract_features_batch(products)):
+            cached = None if product['id'] in force_refresh else self.get_cached_match(features)
+            jobs.append((product, features, cached))
+            if cached is None:
+                misses.append(features)
+        
+        packs = self.claude_matcher.pack_products(misses)
+        if packs:
+            logger.info(f"Processing {total} products: {len(misses)} to classify in {len(packs)} requests "
+                        f"({len(misses) / len(packs):.1f} products/request, {concurrency} in flight)")
+        
+        def classify(pack: List[Dict]):
+            with metrics.span('sleep'):
+                limiter.acquire()
+            start_time = time.time()
+            matches, retried = self.claude_matcher.match_products(pack)
+            return matches, retried, time.time() - start_time
+        
+        results = []
+        progress = Progress(total)
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pack_of = {}
+            calls = []
+            for pack in packs:
+                self.set_run_state([features['id'] for features in pack], 'in_flight')
+                future = executor.submit(classify, pack)
+                calls.append((pack, future))
+                for features in pack:
+                    pack_of[features['id']] = (pack, future)
+            
+            try:
+                for done, (product, features, cached) in enumerate(jobs, 1):
+                    if cached is not None:
+                        match, processing_time, api_calls = cached, 0.0, 0
+                    else:
+                        pack, future = pack_of[product['id']]
+                        matches, retried, pack_time = future.result()
+                        match = matches[product['id']]
+                        self.cache_match(features, match)
+                        processing_time = pack_time / len(pack)
+                        api_calls = int(product['id'] == pack[0]['id']) + int(product['id'] in retried)
+                
+                    result = self.build_result(product, features, match)
+                    results.append(result)
+                    self.save_match(result)
+                    self.log_processing(product['id'], api_calls, processing_time, match.get('usage'))
+                
+                    cached_note = " [cached]" if cached is not None else ""
+                    logger.info(f"  [{done}/{total}] {features['name'][:50]}... "
+                                f"→ HTS: {match['hts_code']} (confidence: {match['confidence']:.0%}){cached_note}")
+                    progress.update(done)
+            except BaseException:
+                self.cache_finished_calls(executor, calls, packed=True)
+                raise
+        
+        return results
+    
+    @instrument_run('process_products_batch')
+    def process_products_batch(self, products: List[Dict], poll_interval: float = None) -> List[Dict]:
+        """Classify products with the Message Batches API
+
+        The whole product set is submitted as one batch job (split only if it
+        exceeds the API limit). Job IDs are stored in batch_jobs before polling
+        starts, so an interrupted run can be picked up with resume_batch().
+        """
+        results = []
+        self.prune_cache()
+        
+        # Unchanged products are answered from the cache without joining the batch
+        uncached = []
+        for product, features in zip(products, self.extract_features_batch(products)):
+            match = self.get_cached_match(features)
+            if match is None:
+                uncached.append((product, features))
+                continue
+            result = self.build_result(product, features, match)
+            results.append(result)
+            self.save_match(result)
+            self.log_processing(product['id'], 0, 0.0)
+        
+        self.flush_writes()
+        self.log_cache_stats()
+        if not uncached:
+            return results
+        
+        for i in range(0, len(uncached), MAX_BATCH_REQUESTS):
+            items = {}
+            for product, features in uncached[i:i + MAX_BATCH_REQUESTS]:
+                items[f"product-{product['id']}"] = {'product_id': product['id'], 'features': features}
+            
+            batch_id = self.claude_matcher.submit_batch(
+                {custom_id: item['features'] for custom_id, item in items.items()}
+            )
+            
+            cursor = self.hts_db.cursor()
+            cursor.execute('''
+                INSERT INTO batch_jobs (batch_id, status, items, submitted_at)
+                VALUES (?, 'submitted', ?, ?)
+            ''', (batch_id, json.dumps(items), db_timestamp()))
+            self.hts_db.commit()
+            
+            logger.info(f"Submitted Message Batch {batch_id} with {len(items)} products")
+            results.extend(self.resume_batch(batch_id, poll_interval))
+        
+        return results
+    
+    def get_unfinished_batches(self) -> List[Dict]:
+        """List batch jobs whose results have not been collected yet"""
         cursor = self.hts_db.cursor()
+        cursor.execute('''
+            SELECT batch_id, items, submitted_at
+            FROM batch_jobs
+            WHERE status != 'collected'
+            ORDER BY submitted_at
+        ''')
+        return [
+            {'batch_id': batch_id, 'num_products': len(json.loads(items)), 'submitted_at': submitted_at}
+            for batch_id, items, submitted_at in cursor.fetchall()
+        ]
+    
+    @instrument_run('resume_batch')
+    def resume_batch(self, batch_id: str, poll_interval: float = None) -> List[Dict]:
+        """Wait for a stored batch job to finish and save its results"""
+        if poll_interval is None:
+            poll_interval = BATCH_POLL_INTERVAL
+        
+        cursor = self.hts_db.cursor()
+        cursor.execute("SELECT items FROM batch_jobs WHERE batch_id = ?", (batch_id,))
+        row = cursor.fetchone()
+        if not row:
+            logger.error(f"Unknown batch job: {batch_id}")
+            return []
+        items = json.loads(row[0])
+        
+        # Poll until the batch has ended
+        start_time = time.time()
+        while True:
+            batch = self.claude_matcher.get_batch(batch_id)
+            counts = batch.request_counts
+            logger.info(f"Batch {batch_id}: {batch.processing_status} "
+                        f"({counts.succeeded} succeeded, {counts.errored} errored, "
+                        f"{counts.processing} processing)")
+            if batch.processing_status == 'ended':
+                break
+            time.sleep(poll_interval)
         
+        # Stream results through the normal parse/validate/save path
+        elapsed = time.time() - start_time
+        results = []
+        features_by_id = {custom_id: item['features'] for custom_id, item in items.items()}
+        
+        for custom_id, match in self.claude_matcher.iter_batch_results(batch_id, features_by_id):
+            item = items.get(custom_id)
+            if item is None:
+                logger.warning(f"Batch result for unknown request {custom_id}")
+                continue
+            
+            self.cache_match(item['features'], match)
+            result = self.build_result({'id': item['product_id']}, item['features'], match)
+            results.append(result)
+            self.save_match(result)
+            self.log_processing(item['product_id'], 1, None, match.get('usage'))
+            
+            logger.info(f"  {item['features']['name'][:50]}... → HTS: {match['hts_code']} "
+                        f"(confidence: {match['confidence']:.0%})")
+        
+        # Results must be on disk before the job is marked collected
+        self.flush_writes()
         cursor.execute('''
+            UPDATE batch_jobs SET status = 'collected', completed_at = ?
+            WHERE batch_id = ?
+        ''', (db_timestamp(), batch_id))
+        self.hts_db.commit()
+        
+        logger.info(f"Collected {len(results)} results from batch {batch_id} "
+                    f"(waited {elapsed / 60:.1f} minutes)")
+        return results
+    
+    def start_run(self, products: List[Dict], options: Dict) -> str:
+        """Record a classification run: its options and the frozen list of target products
+
+        Every product starts 'queued', moves to 'in_flight' when its Claude
+        call is sent and to 'done' (or 'failed' for fallbacks) when its
+        result is saved. State changes ride the write buffer, so they reach
+        the database in the same transaction as the product_matches rows.
+        """
+        run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        now = db_timestamp()
+        with self.hts_db:
+            self.hts_db.execute('''
+                INSERT INTO runs (run_id, status, options, total, started_at)
+                VALUES (?, 'running', ?, ?, ?)
+            ''', (run_id, json.dumps(options), len(products), now))
+            self.hts_db.executemany('''
+                INSERT OR IGNORE INTO run_items (run_id, product_id, position, state, product, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?)
+            ''', ((run_id, product['id'], position, json.dumps(product), now)
+                  for position, product in enumerate(products)))
+        logger.info(f"Run {run_id}: {len(products)} products (resume with: python main.py --resume {run_id})")
+        return run_id
+    
+    def set_run_state(self, product_ids: List[int], state: str):
+        """Queue a state change for products of the active run"""
+        if self.active_run is None:
+            return
+        now = db_timestamp()
+        for product_id in product_ids:
+            self.write_buffer.add(
+                "UPDATE run_items SET state = ?, updated_at = ? WHERE run_id = ? AND product_id = ?",
+                (state, now, self.active_run, product_id)
+            )
+    
+    def finish_run(self):
+        """Flush the active run's progress and mark it completed or interrupted"""
+        run_id, self.active_run = self.active_run, None
+        self.flush_writes()
+        counts = self.get_run_counts(run_id)
+        unfinished = counts.get('queued', 0) + counts.get('in_flight', 0)
+        with self.hts_db:
+            self.hts_db.execute(
+                "UPDATE runs SET status = ?, finished_at = ? WHERE run_id = ?",
+                ('interrupted' if unfinished else 'completed', db_timestamp(), run_id)
+            )
+        if unfinished:
+            logger.warning(f"Run {run_id} stopped with {unfinished} products unfinished "
+                           f"(resume with: python main.py --resume {run_id})")
+        elif counts.get('failed'):
+            logger.info(f"Run {run_id}: {counts['failed']} products failed; "
+                        f"python main.py --resume {run_id} retries them")
+    
+    def get_run_counts(self, run_id: str) -> Dict[str, int]:
+        cursor = self.hts_db.cursor()
+        cursor.execute("SELECT state, COUNT(*) FROM run_items WHERE run_id = ? GROUP BY state", (run_id,))
+        return dict(cursor.fetchall())
+    
+    def get_unfinished_runs(self) -> List[Dict]:
+        """List runs with products that are not done (crashed, interrupted or with failures)"""
+        cursor = self.hts_db.cursor()
+        cursor.execute('''
+            SELECT r.run_id, r.status, r.total, r.started_at, COUNT(i.product_id)
+            FROM runs r
+            JOIN run_items i ON i.run_id = r.run_id AND i.state != 'done'
+            GROUP BY r.run_id
+            ORDER BY r.started_at
+        ''')
+        return [
+            {'run_id': run_id, 'status': status, 'total': total, 'started_at': started_at, 'remaining': remaining}
+            for run_id, status, total, started_at, remaining in cursor.fetchall()
+        ]
+    
+    def resume_run(self, run_id: str) -> List[Dict]:
+        """Finish a recorded run: classify its products that are not done, with the run's options
+
+        No catalog scan is needed - products come from the run's frozen list.
+        Results that reached the classification cache before the interruption
+        are reused rather than requested again.
+        """
+        cursor = self.hts_db.cursor()
+        cursor.execute("SELECT options, started_at FROM runs WHERE run_id = ?", (run_id,))
+        row = cursor.fetchone()
+        if not row:
+            logger.error(f"Unknown run: {run_id}")
+            return []
+        options, started_at = json.loads(row[0]), row[1]
+        
+        cursor.execute('''
+            SELECT product FROM run_items
+            WHERE run_id = ? AND state != 'done'
+            ORDER BY position
+        ''', (run_id,))
+        products = [json.loads(product) for (product,) in cursor.fetchall()]
+        
+        # Forced refreshes that finished before the interruption are already in the cache
+        force_refresh = set(options.pop('force_refresh', []))
+        if force_refresh:
+            cursor.execute('''
+                SELECT DISTINCT c.product_id
+                FROM classification_cache c
+                JOIN run_items i ON i.product_id = c.product_id
+                WHERE i.run_id = ? AND i.state = 'in_flight' AND c.created_at >= ?
+            ''', (run_id, started_at))
+            force_refresh -= {product_id for (product_id,) in cursor.fetchall()}
+        
+        with self.hts_db:
+            self.hts_db.execute("UPDATE runs SET status = 'running', finished_at = NULL WHERE run_id = ?",
+                                (run_id,))
+        if not products:
+            logger.info(f"Run {run_id} has nothing left to do")
+            self.active_run = run_id
+            self.finish_run()
+            return []
+        
+        logger.info(f"Resuming run {run_id}: {len(products)} products left")
+        return self.process_products(products, force_refresh=force_refresh, run_id=run_id, **options)
+    
+    def process_products_deduplicated(self, products: List[Dict], batch_size: int, concurrency: int,
+                                      force_refresh: Set[int], pack: bool = None,
+                                      knn: bool = False) -> List[Dict]:
+        """Classify one representative per duplicate group and fan results out
+
+        Products are grouped by SKU, exact normalized text and MinHash
+        near-duplicate text. Only the first product of each group goes through
+        the normal classification path; the others get its HTS code and
+        confidence, with their own attributes, source 'dedup' and derived_from
+        set to the representative's product ID.
+        """
+        features_list = self.extract_features_batch(products)
+        groups = ProductDeduplicator(threshold=DEDUP_SIMILARITY).group(features_list)
+        
+        representatives = [products[group[0]] for group in groups]
+        logger.info(f"Duplicate detection: {len(products)} products in {len(groups)} groups "
+                    f"({len(products) - len(groups)} API calls saved)")
+        
+        rep_results = self.process_products(representatives, batch_size, concurrency, force_refresh,
+                                            dedup=False, pack=pack, knn=knn)
+        
+        results = [None] * len(products)
+        for group, rep_result in zip(groups, rep_results):
+            results[group[0]] = rep_result
+            
+            # Only the code applies to the whole group; the rest describes the representative
+            match = {
+                'hts_code': rep_result['hts_code'],
+                'hts_description': rep_result['hts_description'],
+                'confidence': rep_result['confidence'],
+                'reasoning': f"Duplicate of product {rep_result['product_id']}",
+                'source': 'dedup'
+            }
+            for member in group[1:]:
+                result = self.build_result(products[member], features_list[member], match)
+                result['derived_from'] = rep_result['product_id']
+                results[member] = result
+                self.save_match(result)
+                self.log_processing(result['product_id'], 0, 0.0)
+        
+        self.flush_writes()
+        return results
+    
+    def process_products_knn(self, products: List[Dict], batch_size: int, concurrency: int,
+                             force_refresh: Set[int], pack: bool = None) -> List[Dict]:
+        """Assign codes from approved neighbours, sending only the rest to Claude
+        
+        Products whose closest approved matches agree on one code (see
+        NeighbourIndex.classify) are saved with source 'knn' and no API call.
+        Products in force_refresh always go to Claude. Results keep input order.
+        """
+        index = self.get_knn_index()
+        candidates = [i for i, p in enumerate(products) if p['id'] not in force_refresh]
+        features = dict(zip(candidates, self.extract_features_batch([products[i] for i in candidates])))
+        local = dict(zip(candidates, index.classify([features[i] for i in candidates]))) if len(index) else {}
+        
+        results = [None] * len(products)
+        for i, match in local.items():
+            if match is None:
+                continue
+            result = self.build_result(products[i], features[i], match)
+            results[i] = result
+            self.save_match(result)
+            self.log_processing(products[i]['id'], 0, 0.0)
+            logger.info(f"  {features[i]['name'][:50]}... → HTS: {match['hts_code']} "
+                        f"(confidence: {match['confidence']:.0%}) [knn]")
+        
+        assigned = len(products) - results.count(None)
+        self.knn_hits += assigned
+        logger.info(f"Nearest neighbours: {assigned} of {len(products)} products assigned locally "
+                    f"({len(index)} approved products indexed)")
+        
+        remaining = [i for i, result in enumerate(results) if result is None]
+        if remaining:
+            claude_results = self.process_products([products[i] for i in remaining], batch_size, concurrency,
+                                                   force_refresh, dedup=False, pack=pack, knn=False)
+            for i, result in zip(remaining, claude_results):
+                results[i] = result
+        
+        self.flush_writes()
+        return results
+    
+    def build_result(self, product: Dict, features: Dict, match: Dict) -> Dict:
+        """Turn a Claude match into a product_matches row"""
+        
+        # Determine auto-approval based on confidence
+        if match['confidence'] >= AUTO_APPROVE_THRESHOLD:
+            status = 'approved'
+        elif match['confidence'] >= 0.60:
+            status = 'pending'
+        else:
+            status = 'manual'
+        
+        return {
+            'product_id': product['id'],
+            'sku': features['sku'],
+            'name': features['name'],
+            'description': features['description'][:200],
+            'categories': ', '.join(features['categories']),
+            'hts_code': match['hts_code'],
+            'hts_description': match.get('hts_description', ''),
+            'confidence': match['confidence'],
+            'reasoning': match.get('reasoning', ''),
+            'material': match.get('material', ''),
+            'alternative_codes': json.dumps(match.get('alternative_codes', [])),
+            'status': status,
+            'feature_hash': self.feature_hash(features),
+            'prompt_version': self.claude_matcher.PROMPT_VERSION,
+            'attributes': features['attributes'],
+            'source': match.get('source', 'claude')
+        }
+    
+    def save_match(self, match: Dict):
+        """Queue a match for the local database (written on the next buffer flush)"""
+        self.write_buffer.add('''
             INSERT OR REPLACE INTO product_matches
             (product_id, sku, name, description, categories, hts_code, 
              hts_description, confidence, reasoning, material, alternative_codes,
-             status, matched_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             status, matched_at, updated_at, derived_from, feature_hash, prompt_version,
+             attributes, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             match['product_id'],
             match['sku'],
@@ -770,23 +2173,47 @@ class WooCommerceHTSMatcher:
             match['material'],
             match['alternative_codes'],
             match['status'],
-            datetime.now(),
-            datetime.now()
+            db_timestamp(),
+            db_timestamp(),
+            match.get('derived_from'),
+            match.get('feature_hash'),
+            match.get('prompt_version'),
+            match.get('attributes'),
+            match.get('source')
         ))
-        
-        self.hts_db.commit()
+        self.update_knn_index(match)
+        # Fallbacks mean the API call failed; a resumed run tries them again
+        self.set_run_state([match['product_id']], 'failed' if match['hts_code'] == '9999.99.9999' else 'done')
     
-    def log_processing(self, product_id: int, api_calls: int, processing_time: float):
-        """Log processing metrics"""
-        cursor = self.hts_db.cursor()
-        cursor.execute('''
-            INSERT INTO processing_log (product_id, api_calls, processing_time, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (product_id, api_calls, processing_time, datetime.now()))
-        self.hts_db.commit()
+    def log_processing(self, product_id: int, api_calls: int, processing_time: Optional[float],
+                       usage: Optional[Dict] = None):
+        """Log processing metrics (processing_time is None for batch results)
+
+        Args:
+            usage: Token counts and request latency from HTSMatcher.record_usage for API calls
+        """
+        usage = usage or {}
+        self.write_buffer.add('''
+            INSERT INTO processing_log
+            (product_id, api_calls, processing_time, timestamp, cache_read_tokens, cache_write_tokens,
+             input_tokens, output_tokens, latency, model)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            product_id,
+            api_calls,
+            processing_time,
+            db_timestamp(),
+            usage.get('cache_read_tokens'),
+            usage.get('cache_write_tokens'),
+            usage.get('input_tokens'),
+            usage.get('output_tokens'),
+            usage.get('latency'),
+            self.claude_matcher.model if api_calls else None
+        ))
     
-    def get_pending_matches(self) -> pd.DataFrame:
+    def get_pending_matches(self) -> 'pd.DataFrame':
         """Get all matches pending review"""
+        import pandas as pd
         query = '''
             SELECT product_id, sku, name, hts_code, hts_description, 
                    confidence, reasoning, alternative_codes, status
@@ -795,49 +2222,14 @@ class WooCommerceHTSMatcher:
             ORDER BY confidence DESC
         '''
         
+        self.flush_writes()
         return pd.read_sql_query(query, self.hts_db)
     
     def get_match_summary(self) -> Dict:
         """Get summary of matching results"""
+        self.flush_writes()
         try:
-            cursor = self.hts_db.cursor()
-            
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total,
-                    COUNT(CASE WHEN status = 'approved' THEN 1 END) as approved,
-                    COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending,
-                    COUNT(CASE WHEN status = 'manual' THEN 1 END) as needs_manual,
-                    COUNT(CASE WHEN status = 'rejected' THEN 1 END) as rejected,
-                    AVG(CASE WHEN confidence > 0 THEN confidence END) as avg_confidence,
-                    COUNT(DISTINCT hts_code) as unique_codes
-                FROM product_matches
-            ''')
-            
-            result = cursor.fetchone()
-            
-            # Get processing stats
-            cursor.execute('''
-                SELECT 
-                    SUM(api_calls) as total_api_calls,
-                    AVG(processing_time) as avg_processing_time
-                FROM processing_log
-                WHERE timestamp > datetime('now', '-24 hours')
-            ''')
-            
-            stats = cursor.fetchone()
-            
-            return {
-                'total': result[0] if result and result[0] else 0,
-                'approved': result[1] if result and result[1] else 0,
-                'pending': result[2] if result and result[2] else 0,
-                'needs_manual': result[3] if result and result[3] else 0,
-                'rejected': result[4] if result and result[4] else 0,
-                'avg_confidence': result[5] if result and result[5] else 0,
-                'unique_codes': result[6] if result and result[6] else 0,
-                'api_calls_24h': stats[0] if stats and stats[0] else 0,
-                'avg_processing_time': stats[1] if stats and stats[1] else 0
-            }
+            return match_summary(self.hts_db)
         except Exception as e:
             logger.error(f"Error getting match summary: {e}")
             # Return safe defaults
@@ -853,35 +2245,19 @@ class WooCommerceHTSMatcher:
                 'avg_processing_time': 0
             }
     
+    @staticmethod
+    def hts_meta_data(hts_code: str, confidence: float = None) -> List[Dict]:
+        """Build the product meta_data entries that carry an HTS code"""
+        return hts_meta_data(hts_code, confidence)
+    
     def update_product_hts(self, product_id: int, hts_code: str, confidence: float = None):
         """Update HTS code in WooCommerce"""
         
-        # Prepare meta data
-        meta_data = [
-            {'key': '_hts_code', 'value': hts_code}
-        ]
-        
-        if confidence is not None:
-            meta_data.append({
-                'key': '_hts_confidence', 
-                'value': f"{confidence:.1%}"
-            })
-            
-        # Add timestamp
-        meta_data.append({
-            'key': '_hts_updated',
-            'value': datetime.now().isoformat()
-        })
-        
         # Update product
-        data = {'meta_data': meta_data}
+        data = {'meta_data': self.hts_meta_data(hts_code, confidence)}
         
-        response = requests.put(
-            f"{self.api_url}/products/{product_id}",
-            auth=self.auth,
-            verify=self.verify_ssl,  # Use SSL setting
-            json=data
-        )
+        with metrics.span('push'):
+            response = self.woo.put(f"/products/{product_id}", json=data)
         
         if response.status_code == 200:
             logger.info(f"Updated product {product_id} with HTS {hts_code}")
@@ -892,6 +2268,7 @@ class WooCommerceHTSMatcher:
     
     def bulk_update_approved(self, dry_run: bool = True):
         """Update all approved matches to WooCommerce"""
+        self.flush_writes()
         cursor = self.hts_db.cursor()
         cursor.execute('''
             SELECT product_id, sku, name, hts_code, confidence
@@ -909,81 +2286,155 @@ class WooCommerceHTSMatcher:
                 print(f"  ... and {len(updates)-10} more")
             return 0
         
-        success_count = 0
-        for product_id, sku, name, hts_code, confidence in updates:
-            if self.update_product_hts(product_id, hts_code, confidence):
-                success_count += 1
-                time.sleep(0.5)  # Rate limit
+        succeeded, failed = self.push_hts_codes(
+            [(product_id, hts_code, confidence) for product_id, sku, name, hts_code, confidence in updates]
+        )
+        
+        logger.info(f"Successfully updated {len(succeeded)}/{len(updates)} products")
+        return len(succeeded)
+    
+    def push_hts_codes(self, codes: List[tuple]) -> tuple:
+        """Push HTS codes to WooCommerce through the batch endpoint
+
+        Args:
+            codes: (product_id, hts_code, confidence) tuples
+
+        Returns:
+            (set of updated product IDs, {product_id: error} for failures)
+        """
+        updates = [
+            {'id': product_id, 'meta_data': self.hts_meta_data(hts_code, confidence)}
+            for product_id, hts_code, confidence in codes
+        ]
+        
+        with metrics.span('push'):
+            succeeded, failed = self.woo.batch_update_products(updates)
         
-        logger.info(f"Successfully updated {success_count}/{len(updates)} products")
-        return success_count
+        for product_id, error in failed.items():
+            logger.error(f"Failed to update product {product_id}: {error}")
+        logger.info(f"Pushed {len(succeeded)}/{len(updates)} HTS codes via batch endpoint")
+        
+        return succeeded, failed
     
     def export_results(self, filename: str = None):
         """Export all matches to CSV for review"""
         if filename is None:
             filename = f"hts_matches_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         
+        self.flush_writes()
+        count = export_matches(self.hts_db, filename)
+        logger.info(f"Exported {count} matches to {filename}")
+        return filename
+    
+    def get_usage_history(self, days: int = None) -> 'pd.DataFrame':
+        """Recent API calls from processing_log with their cost and the product's categories"""
+        import pandas as pd
+        days = days or ESTIMATE_HISTORY_DAYS
         query = '''
-            SELECT 
-                product_id, 
-                sku, 
-                name, 
-                categories,
-                hts_code, 
-                hts_description,
-                confidence,
-                reasoning,
-                material,
-                alternative_codes,
-                status
-            FROM product_matches
-            ORDER BY status, confidence DESC
+            SELECT l.input_tokens, l.output_tokens,
+                   COALESCE(l.cache_read_tokens, 0) AS cache_read_tokens,
+                   COALESCE(l.cache_write_tokens, 0) AS cache_write_tokens,
+                   l.latency, m.categories
+            FROM processing_log l
+            LEFT JOIN product_matches m ON m.product_id = l.product_id
+            WHERE l.api_calls > 0
+            AND l.input_tokens IS NOT NULL
+            AND l.timestamp > ?
         '''
-        
-        df = pd.read_sql_query(query, self.hts_db)
-        
-        # Parse alternative codes for readability
-        df['alternative_codes'] = df['alternative_codes'].apply(
-            lambda x: ', '.join(json.loads(x)) if x and x != 'null' else ''
-        )
-        
-        df.to_csv(filename, index=False)
-        logger.info(f"Exported {len(df)} matches to {filename}")
-        return filename
+        self.flush_writes()
+        history = pd.read_sql_query(query, self.hts_db,
+                                    params=(db_timestamp(datetime.now() - timedelta(days=days)),))
+        history['cost'] = sum(history[column] * price for column, price in MODEL_PRICES.items()) / 1_000_000
+        return history
     
-    def get_processing_cost_estimate(self, num_products: int) -> Dict:
-        """Estimate API costs for processing products"""
-        # Rough estimates for Claude Sonnet pricing (check current rates)
-        cost_per_1k_input_tokens = 0.003  # $3 per million
-        cost_per_1k_output_tokens = 0.015  # $15 per million
-        
-        # Estimate tokens per product
-        avg_input_tokens = 400  # Product info prompt
-        avg_output_tokens = 150  # JSON response
-        
-        total_input_tokens = num_products * avg_input_tokens
-        total_output_tokens = num_products * avg_output_tokens
-        
-        input_cost = (total_input_tokens / 1000) * cost_per_1k_input_tokens
-        output_cost = (total_output_tokens / 1000) * cost_per_1k_output_tokens
-        total_cost = input_cost + output_cost
+    def seconds_per_product(self, latency: float) -> float:
+        """Wall time per product for a request latency under the current concurrency settings"""
+        concurrency = self.claude_matcher.max_concurrency
+        paced = self.claude_matcher.paced_requests_per_minute
+        if concurrency > 1 or PACK_PRODUCTS:
+            pacing = 60.0 / paced if paced > 0 and not PACK_PRODUCTS else 0.0
+            return max(latency / concurrency, pacing)
+        if ADAPTIVE_CONCURRENCY:
+            return latency
+        # Sequential loop: the call, RATE_LIMIT_DELAY, and a 5s pause per batch
+        return latency + RATE_LIMIT_DELAY + 5.0 / BATCH_SIZE
+    
+    def get_processing_cost_estimate(self, num_products: int, category_counts: Dict[str, int] = None) -> Dict:
+        """Estimate API cost and run time from recently logged API calls
+        
+        Totals use the mean per-product cost and latency over the last
+        ESTIMATE_HISTORY_DAYS; ranges run from the median to the 90th
+        percentile. With category_counts (category name -> products), each
+        category with at least ESTIMATE_MIN_SAMPLES logged calls is estimated
+        from its own history. Falls back to fixed per-product assumptions until
+        calls with token usage have been logged.
+        
+        Returns:
+            Expected (mean) totals plus p50-p90 ranges, and a per-category breakdown
+        """
+        import pandas as pd
+        try:
+            history = self.get_usage_history()
+        except Exception as e:
+            logger.warning(f"Could not read usage history: {e}")
+            history = pd.DataFrame()
         
-        # Time estimate
-        processing_time_seconds = num_products * (RATE_LIMIT_DELAY + 0.5)
-        processing_time_minutes = processing_time_seconds / 60
+        if len(history):
+            basis = 'history'
+        else:
+            # No usage logged yet: assume 400 input / 150 output tokens and 1.5s per call
+            basis = 'default'
+            history = pd.DataFrame([{'input_tokens': 400, 'output_tokens': 150, 'cache_read_tokens': 0,
+                                     'cache_write_tokens': 0, 'latency': 1.5, 'categories': None}])
+            history['cost'] = sum(history[column] * price for column, price in MODEL_PRICES.items()) / 1_000_000
+        history['latency'] = history['latency'].fillna(history['latency'].median()).fillna(1.5)
+        
+        def estimate(rows: pd.DataFrame, count: int) -> Dict:
+            seconds = rows['latency'].apply(self.seconds_per_product)
+            return {
+                'num_products': count,
+                'samples': len(rows) if basis == 'history' else 0,
+                'estimated_cost_usd': round(float(count * rows['cost'].mean()), 2),
+                'cost_range_usd': (round(float(count * rows['cost'].quantile(0.5)), 2),
+                                   round(float(count * rows['cost'].quantile(0.9)), 2)),
+                'estimated_time_minutes': round(float(count * seconds.mean() / 60), 1),
+                'time_range_minutes': (round(float(count * seconds.quantile(0.5) / 60), 1),
+                                       round(float(count * seconds.quantile(0.9) / 60), 1)),
+                'input_tokens': int(count * rows['input_tokens'].mean()),
+                'output_tokens': int(count * rows['output_tokens'].mean()),
+                'cache_read_tokens': int(count * rows['cache_read_tokens'].mean()),
+                'cache_write_tokens': int(count * rows['cache_write_tokens'].mean())
+            }
         
-        return {
-            'num_products': num_products,
-            'estimated_cost_usd': round(total_cost, 2),
-            'estimated_time_minutes': round(processing_time_minutes, 1),
-            'input_tokens': total_input_tokens,
-            'output_tokens': total_output_tokens
-        }
-
+        category_counts = category_counts or {}
+        by_category = {}
+        for name, count in category_counts.items():
+            categories = history['categories'].fillna('').str.split(', ')
+            rows = history[categories.apply(lambda names: name in names)]
+            by_category[name] = estimate(rows if len(rows) >= ESTIMATE_MIN_SAMPLES else history, count)
+            by_category[name]['own_history'] = len(rows) >= ESTIMATE_MIN_SAMPLES
+        
+        total = estimate(history, num_products)
+        if by_category and sum(category_counts.values()) == num_products:
+            # Category estimates add up to the whole run
+            for key in ('estimated_cost_usd', 'estimated_time_minutes', 'input_tokens', 'output_tokens',
+                        'cache_read_tokens', 'cache_write_tokens'):
+                total[key] = round(sum(c[key] for c in by_category.values()), 2)
+            for key in ('cost_range_usd', 'time_range_minutes'):
+                total[key] = tuple(round(sum(c[key][i] for c in by_category.values()), 2) for i in (0, 1))
+        
+        total['basis'] = basis
+        total['by_category'] = by_category
+        return total
 
 def main():
     """Main execution function with interactive menu"""
     
+    parser = argparse.ArgumentParser(description='WooCommerce HTS Matcher with Claude AI')
+    parser.add_argument('--resume', metavar='RUN_ID', help='Finish an interrupted classification run and exit')
+    parser.add_argument('--runs', action='store_true', help='List unfinished classification runs and exit')
+    args = parser.parse_args()
+    
     print("=== WooCommerce HTS Matcher with Claude AI ===\n")
     
     # Check if configuration is loaded
@@ -1001,6 +2452,20 @@ def main():
         anthropic_api_key=ANTHROPIC_API_KEY
     )
     
+    if args.resume or args.runs:
+        # Non-interactive: no connection test, no menu
+        matcher = WooCommerceHTSMatcher(config, hts_db_path=DATABASE_PATH)
+        if args.runs:
+            for run in matcher.get_unfinished_runs():
+                print(f"{run['run_id']}  {run['status']:<11}  {run['remaining']}/{run['total']} products left  "
+                      f"(started {from_db_timestamp(run['started_at']):%Y-%m-%d %H:%M})")
+            return
+        results = matcher.resume_run(args.resume)
+        summary = matcher.get_match_summary()
+        print(f"\n✓ Classified {len(results)} products. Approved: {summary['approved']}, "
+              f"Needs review: {summary['pending'] + summary['needs_manual']}")
+        return
+    
     # Test connection first
     print("Testing WooCommerce connection...")
     if not test_woocommerce_connection(config):
@@ -1017,7 +2482,7 @@ def main():
     
     # Initialize matcher and category manager
     matcher = WooCommerceHTSMatcher(config, hts_db_path=DATABASE_PATH)
-    category_manager = CategoryManager(config)
+    category_manager = CategoryManager(config, woo=matcher.woo)
     
     # Try to load saved category selection
     category_manager.load_category_selection()
@@ -1026,11 +2491,23 @@ def main():
     print(f"Database: {DATABASE_PATH}")
     print(f"Auto-approve threshold: {AUTO_APPROVE_THRESHOLD:.0%}")
     print(f"Batch size: {BATCH_SIZE} products")
-    print(f"Rate limit delay: {RATE_LIMIT_DELAY} seconds")
+    if ADAPTIVE_CONCURRENCY:
+        print(f"Concurrency: adaptive, up to {MAX_CONCURRENCY} requests in flight (paced by rate-limit headers)")
+    else:
+        print(f"Rate limit delay: {RATE_LIMIT_DELAY} seconds")
+        if MAX_CONCURRENCY > 1:
+            print(f"Concurrency: {MAX_CONCURRENCY} requests in flight (max {REQUESTS_PER_MINUTE:g}/minute)")
     
     if matcher.is_local:
         print("🔧 Local development mode - SSL verification disabled")
     
+    unfinished = matcher.get_unfinished_batches()
+    if unfinished:
+        print(f"⚠️  {len(unfinished)} Message Batches job(s) not collected yet - use option 15 to resume")
+    unfinished_runs = matcher.get_unfinished_runs()
+    if unfinished_runs:
+        print(f"⚠️  {len(unfinished_runs)} classification run(s) not finished - use option 19 to resume")
+    
     while True:
         print("\n" + "="*60)
         print("HTS CODE MATCHER - MAIN MENU")
@@ -1067,6 +2544,8 @@ def main():
         print("3.  Process first 100 unprocessed products")
         print("4.  Process ALL unprocessed products")
         print("11. Process specific categories (unprocessed only)")
+        print("17. Sync new/changed products since last sync")
+        print("18. Stream ALL unprocessed products (classify while downloading)")
         
         print("\n=== Management Options ===")
         print("5.  [DISABLED] View summary and statistics")
@@ -1074,12 +2553,15 @@ def main():
         print("7.  Export results to CSV")
         print("8.  [DISABLED] Push to WooCommerce (DRY RUN)")
         print("9.  Push to WooCommerce (LIVE - updates store)")
-        print("10. [DISABLED] Estimate processing costs")
+        print("10. Estimate processing costs (from recent usage)")
         
         print("\n=== Reprocessing Options (Override Existing) ===")
         print("12. REPROCESS first 10 products")
         print("13. REPROCESS ALL products (expensive!)")
         print("14. Clear database (remove all matches)")
+        print("15. Resume interrupted Message Batches job")
+        print("16. Reclassify one product (ignore cache)")
+        print("19. Resume interrupted classification run")
         
         print("\n0.  Exit")
         
@@ -1126,10 +2608,15 @@ def main():
                 cost_est = matcher.get_processing_cost_estimate(len(products))
                 print(f"\nFound {len(products)} unprocessed products")
                 print(f"Estimated cost: ${cost_est['estimated_cost_usd']}")
-                print(f"Estimated time: {cost_est['estimated_time_minutes']} minutes")
+                print(f"Estimated time: {cost_est['estimated_time_minutes']} minutes "
+                      f"(up to {cost_est['time_range_minutes'][1]} at the 90th percentile)")
                 confirm = input("Continue? (type 'YES' to confirm): ")
                 if confirm == 'YES':
-                    results = matcher.process_products(products)
+                    use_batch = input("Use Message Batches API? (~50% cheaper, results within 24h) (y/n): ")
+                    if use_batch.lower() == 'y':
+                        results = matcher.process_products_batch(products)
+                    else:
+                        results = matcher.process_products(products)
                     summary = matcher.get_match_summary()
                     print(f"\n✓ Complete! Check summary for results.")
             else:
@@ -1216,13 +2703,12 @@ def main():
                 print(f"✓ Updated {count} products")
             
         elif choice == '10':
-            print("\nThis option is temporarily disabled due to a terminal compatibility issue.")
-            continue
-        elif choice == '10_disabled':
             if category_manager.selected_category_ids:
-                product_count = sum(c.get('count', 0) for c in category_manager.categories if c['id'] in category_manager.selected_category_ids)
+                category_counts = {c['name']: c.get('count', 0) for c in category_manager.categories
+                                   if c['id'] in category_manager.selected_category_ids}
+                product_count = sum(category_counts.values())
                 print(f"\nEstimating for {product_count} products in selected categories...")
-                cost_est = matcher.get_processing_cost_estimate(product_count)
+                cost_est = matcher.get_processing_cost_estimate(product_count, category_counts)
             else:
                 num = input("Number of products to estimate: ")
                 try:
@@ -1232,11 +2718,20 @@ def main():
                     continue
             
             print(f"\n=== Cost Estimate for {cost_est['num_products']} products ===")
-            print(f"Estimated API cost: ${cost_est['estimated_cost_usd']}")
-            print(f"Processing time: ~{cost_est['estimated_time_minutes']} minutes")
-            print(f"Input tokens: {cost_est['input_tokens']:,}")
+            print(f"Estimated API cost: ${cost_est['estimated_cost_usd']} "
+                  f"(median ${cost_est['cost_range_usd'][0]}, 90th percentile ${cost_est['cost_range_usd'][1]})")
+            print(f"Processing time: ~{cost_est['estimated_time_minutes']} minutes "
+                  f"(median {cost_est['time_range_minutes'][0]}, 90th percentile {cost_est['time_range_minutes'][1]})")
+            print(f"Input tokens: {cost_est['input_tokens']:,} (+{cost_est['cache_read_tokens']:,} from prompt cache)")
             print(f"Output tokens: {cost_est['output_tokens']:,}")
-            print("\nNote: Actual costs may vary based on product description length")
+            for name, est in sorted(cost_est['by_category'].items(), key=lambda item: -item[1]['estimated_cost_usd']):
+                basis = f"{est['samples']} logged calls" if est['own_history'] else "store average"
+                print(f"  {name[:30]:30s} {est['num_products']:6d} products  ${est['estimated_cost_usd']:8.2f}  "
+                      f"~{est['estimated_time_minutes']:.1f} min  ({basis})")
+            if cost_est['basis'] == 'history':
+                print(f"\nBased on {cost_est['samples']} API calls from the last {ESTIMATE_HISTORY_DAYS} days")
+            else:
+                print("\nNo usage logged yet - using default assumptions (400 input / 150 output tokens per product)")
             
         elif choice == '11':
             if not category_manager.selected_category_ids:
@@ -1293,7 +2788,11 @@ def main():
                     print(f"Estimated time: {cost_est['estimated_time_minutes']} minutes")
                     final_confirm = input("Continue with reprocessing? (type 'YES' to confirm): ")
                     if final_confirm == 'YES':
-                        results = matcher.process_products(products)
+                        use_batch = input("Use Message Batches API? (~50% cheaper, results within 24h) (y/n): ")
+                        if use_batch.lower() == 'y':
+                            results = matcher.process_products_batch(products)
+                        else:
+                            results = matcher.process_products(products)
                         summary = matcher.get_match_summary()
                         print(f"\n✓ Complete! All products reprocessed.")
             else:
@@ -1309,7 +2808,94 @@ def main():
             else:
                 print("Cancelled.")
         
+        elif choice == '15':
+            unfinished = matcher.get_unfinished_batches()
+            if not unfinished:
+                print("\nNo unfinished Message Batches jobs.")
+                continue
+            
+            print("\nUnfinished batch jobs:")
+            for i, job in enumerate(unfinished, 1):
+                print(f"  {i}. {job['batch_id']} - {job['num_products']} products (submitted {from_db_timestamp(job['submitted_at']):%Y-%m-%d %H:%M})")
+            
+            pick = input("\nResume which job? (number): ").strip()
+            try:
+                job = unfinished[int(pick) - 1]
+            except (ValueError, IndexError):
+                print("Invalid choice")
+                continue
+            
+            results = matcher.resume_batch(job['batch_id'])
+            print(f"\n✓ Saved {len(results)} classifications from batch {job['batch_id']}")
+        
+        elif choice == '16':
+            pid = input("\nProduct ID to reclassify: ").strip()
+            try:
+                result = matcher.refresh_product(int(pid))
+            except ValueError:
+                print("Invalid product ID")
+                continue
+            
+            if result:
+                print(f"✓ {result['name'][:50]} → {result['hts_code']} ({result['confidence']:.0%} confidence, {result['status']})")
+            else:
+                print("Could not reclassify product - check the ID")
+        
+        elif choice == '17':
+            print("\nChecking WooCommerce for new or edited products...")
+            products, high_water_mark = matcher.fetch_changed_products()
+            
+            if products:
+                confirm = input(f"Classify {len(products)} new/changed products? (y/n): ")
+                if confirm.lower() != 'y':
+                    print("Cancelled.")
+                    continue
+                results = matcher.process_products(products)
+                summary = matcher.get_match_summary()
+                print(f"\nComplete! Approved: {summary['approved']}, Needs review: {summary['pending'] + summary['needs_manual']}")
+            else:
+                print("No new or changed products since the last sync.")
+            
+            matcher.commit_sync(high_water_mark)
+        
+        elif choice == '18':
+            print("\n⚠️  This classifies every unprocessed product, starting while the catalog downloads.")
+            confirm = input("Continue? (type 'YES' to confirm): ")
+            if confirm != 'YES':
+                print("Cancelled.")
+                continue
+            push = input("Push approved codes to WooCommerce as they are saved? (y/n): ").lower() == 'y'
+            
+            stats = matcher.process_catalog_streaming(push=push)
+            print(f"\n✓ Classified {stats['products']} products in {stats['elapsed_seconds'] / 60:.1f} minutes "
+                  f"({stats['approved']} approved, {stats['needs_review']} need review)")
+            if push:
+                print(f"✓ Pushed {stats['pushed']} codes to WooCommerce ({stats['push_failed']} failed)")
+        
+        elif choice == '19':
+            unfinished = matcher.get_unfinished_runs()
+            if not unfinished:
+                print("\nNo unfinished classification runs.")
+                continue
+            
+            print("\nUnfinished runs:")
+            for i, run in enumerate(unfinished, 1):
+                print(f"  {i}. {run['run_id']} - {run['remaining']}/{run['total']} products left "
+                      f"(started {from_db_timestamp(run['started_at']):%Y-%m-%d %H:%M})")
+            
+            pick = input("\nResume which run? (number): ").strip()
+            try:
+                run = unfinished[int(pick) - 1]
+            except (ValueError, IndexError):
+                print("Invalid choice")
+                continue
+            
+            results = matcher.resume_run(run['run_id'])
+            print(f"\n✓ Classified {len(results)} remaining products from run {run['run_id']}")
+        
         elif choice == '0':
+            logger.info("WooCommerce API usage this session:")
+            matcher.woo.log_stats()
             print("\nGoodbye!")
             break
         
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Read-only queries over saved matches (summary, CSV export, codes ready to push)
+Needs only the standard library, so commands that just read the local
+database don't pay for importing main.py, pandas or the Anthropic SDK
+"""
+
+import csv
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from schema import db_timestamp
+
+EXPORT_COLUMNS = ('product_id', 'sku', 'name', 'categories', 'hts_code', 'hts_description', 'confidence',
+                  'reasoning', 'material', 'alternative_codes', 'status', 'derived_from', 'prompt_version', 'source')
+
+
+def match_summary(conn: sqlite3.Connection) -> Dict:
+    """Counts by status, average confidence and the last 24 hours of processing"""
+    result = conn.execute('''
+        SELECT
+            COUNT(*) as total,
+            COUNT(CASE WHEN status = 'approved' THEN 1 END) as approved,
+            COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending,
+            COUNT(CASE WHEN status = 'manual' THEN 1 END) as needs_manual,
+            COUNT(CASE WHEN status = 'rejected' THEN 1 END) as rejected,
+            AVG(CASE WHEN confidence > 0 THEN confidence END) as avg_confidence,
+            COUNT(DISTINCT hts_code) as unique_codes
+        FROM product_matches
+    ''').fetchone()
+
+    stats = conn.execute('''
+        SELECT
+            SUM(api_calls) as total_api_calls,
+            AVG(processing_time) as avg_processing_time
+        FROM processing_log
+        WHERE timestamp > datetime('now', '-24 hours')
+    ''').fetchone()
+
+    return {
+        'total': result[0] if result and result[0] else 0,
+        'approved': result[1] if result and result[1] else 0,
+        'pending': result[2] if result and result[2] else 0,
+        'needs_manual': result[3] if result and result[3] else 0,
+        'rejected': result[4] if result and result[4] else 0,
+        'avg_confidence': result[5] if result and result[5] else 0,
+        'unique_codes': result[6] if result and result[6] else 0,
+        'api_calls_24h': stats[0] if stats and stats[0] else 0,
+        'avg_processing_time': stats[1] if stats and stats[1] else 0
+    }
+
+
+def approved_matches(conn: sqlite3.Connection, since: Optional[datetime] = None) -> List[Tuple]:
+    """Approved (product_id, name, hts_code, confidence, matched_at) rows, newest first
+
+    Args:
+        since: Only matches saved after this time (None = all approved matches)
+    """
+    query = '''
+        SELECT product_id, name, hts_code, confidence, matched_at
+        FROM product_matches
+        WHERE status = 'approved'
+    '''
+    params = ()
+    if since is not None:
+        query += ' AND matched_at > ?'
+        params = (db_timestamp(since),)
+    return conn.execute(query + ' ORDER BY matched_at DESC', params).fetchall()
+
+
+def export_matches(conn: sqlite3.Connection, filename: str) -> int:
+    """Write every match to a CSV file for review; returns the number of rows"""
+    cursor = conn.execute(f'''
+        SELECT {', '.join(EXPORT_COLUMNS)}
+        FROM product_matches
+        ORDER BY status, confidence DESC
+    ''')
+    alternatives = EXPORT_COLUMNS.index('alternative_codes')
+
+    count = 0
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in cursor:
+            row = list(row)
+            # Parse alternative codes for readability
+            value = row[alternatives]
+            row[alternatives] = ', '.join(json.loads(value)) if value and value != 'null' else ''
+            writer.writerow(row)
+            count += 1
+    return count
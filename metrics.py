@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing for classification runs
+Every stage of a run (fetch page, extract, API call, parse, DB write, push,
+sleep) is timed into an in-memory histogram; runs log a live products/sec
+and ETA readout and finish with a JSON and Prometheus textfile summary
+
+Usage:
+    with metrics.span('api_call'):
+        response = client.messages.create(...)
+
+    @instrument_run('process_products')
+    def process_products(...): ...
+
+Setting PROFILE=cprofile or PROFILE=tracemalloc also profiles the first run
+of the process and writes the result next to the summary. For worker.py and
+webhook.py that run is the whole service loop.
+"""
+
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Metrics settings
+METRICS_DIR = os.getenv('METRICS_DIR', 'metrics')                  # Run summaries are written here ('' = off)
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 30))      # Seconds between products/sec + ETA lines
+PROFILE = os.getenv('PROFILE', '').lower()                         # 'cprofile' or 'tracemalloc' for the first run
+
+# Upper bounds (seconds) of the histogram buckets; the last bucket is +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_FILE = 'hts_matcher.prom'
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus-compatible buckets)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                # Observed min/max narrow the first and last occupied buckets
+                lower = max(BUCKETS[i - 1] if i else 0.0, self.min)
+                upper = min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_seconds': round(self.total, 3),
+            'mean_ms': round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 2),
+            'p95_ms': round(self.quantile(0.95) * 1000, 2),
+            'max_ms': round(self.max * 1000, 2)
+        }
+
+
+class Metrics:
+    """Thread-safe stage histograms and run progress for this process"""
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {}
+        self.progress: Dict[str, float] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time the enclosed block into the stage's histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def set_progress(self, **values: float):
+        with self._lock:
+            self.progress.update(values)
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.progress = {}
+            self.started = time.time()
+
+    def summary(self) -> Dict:
+        with self._lock:
+            stages = {stage: h.summary() for stage, h in sorted(self.stages.items())}
+            progress = dict(self.progress)
+        return {
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'elapsed_seconds': round(time.time() - self.started, 2),
+            'progress': progress,
+            'stages': stages
+        }
+
+    def log_summary(self):
+        """Log one line per stage, largest total time first"""
+        stages = self.summary()['stages']
+        if not stages:
+            return
+        wall = time.time() - self.started
+        logger.info("Time by stage (stages on worker threads overlap, so shares can exceed 100%):")
+        for stage, s in sorted(stages.items(), key=lambda item: -item[1]['total_seconds']):
+            share = s['total_seconds'] / wall if wall > 0 else 0.0
+            logger.info(f"  {stage}: {s['count']} × mean {s['mean_ms']:.1f}ms (p50 {s['p50_ms']:.1f}ms, "
+                        f"p95 {s['p95_ms']:.1f}ms) = {s['total_seconds']:.1f}s ({share:.0%} of wall time)")
+
+    def prometheus(self) -> str:
+        """Stage histograms and run progress in the Prometheus text format"""
+        with self._lock:
+            stages = {stage: (list(h.counts), h.count, h.total) for stage, h in sorted(self.stages.items())}
+            progress = dict(self.progress)
+
+        lines = ['# HELP hts_stage_seconds Time spent in each classification stage',
+                 '# TYPE hts_stage_seconds histogram']
+        for stage, (counts, count, total) in stages.items():
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'hts_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'hts_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'hts_stage_seconds_count{{stage="{stage}"}} {count}')
+        for name, value in sorted(progress.items()):
+            lines.append(f'# TYPE hts_run_{name} gauge')
+            lines.append(f'hts_run_{name} {value}')
+        lines.append('# TYPE hts_run_last_finished_timestamp_seconds gauge')
+        lines.append(f'hts_run_last_finished_timestamp_seconds {time.time():.0f}')
+        return '\n'.join(lines) + '\n'
+
+    def write_summary(self, name: str, directory: str = None) -> Optional[str]:
+        """Write <name>_<timestamp>.json and refresh the Prometheus textfile
+
+        Returns the JSON path, or None when METRICS_DIR is empty.
+        """
+        directory = METRICS_DIR if directory is None else directory
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+
+        # The PID keeps summaries of parallel worker processes apart
+        path = os.path.join(directory, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.json")
+        with open(path, 'w') as f:
+            json.dump({'run': name, **self.summary()}, f, indent=2)
+
+        # Textfile collectors may read at any moment, so replace the file atomically
+        prom_path = os.path.join(directory, PROMETHEUS_FILE)
+        tmp_path = f"{prom_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, prom_path)
+        return path
+
+
+metrics = Metrics()
+
+
+class Progress:
+    """Live products/sec and ETA for a run of known size
+
+    update() is cheap to call per product; a line is logged at most every
+    PROGRESS_INTERVAL seconds and when the run completes.
+    """
+
+    def __init__(self, total: int, interval: float = None):
+        self.total = total
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.start = time.monotonic()
+        self._last_log = self.start
+
+    def update(self, done: int):
+        now = time.monotonic()
+        elapsed = now - self.start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 else None
+        metrics.set_progress(
+            products_done=done,
+            products_total=self.total,
+            products_per_second=round(rate, 3),
+            eta_seconds=round(eta, 1) if eta is not None else -1
+        )
+
+        if done >= self.total or now - self._last_log >= self.interval:
+            self._last_log = now
+            eta_note = f", ETA {format_duration(eta)}" if eta is not None and done < self.total else ""
+            logger.info(f"  Progress: {done}/{self.total} products in {format_duration(elapsed)} "
+                        f"({rate:.2f} products/sec{eta_note})")
+
+
+def format_duration(seconds: float) -> str:
+    """'1:02:03' / '4:05' style duration"""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+@contextmanager
+def profile(name: str, mode: str = None):
+    """Profile the enclosed block with cProfile or tracemalloc (mode '' does nothing)
+
+    cProfile stats are saved as <name>_<timestamp>.prof in METRICS_DIR (open
+    with `python -m pstats` or snakeviz) and the top functions are logged;
+    tracemalloc logs the top allocation sites and peak memory.
+    """
+    mode = PROFILE if mode is None else mode
+    if mode not in ('cprofile', 'tracemalloc'):
+        yield
+        return
+
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            stats = pstats.Stats(profiler).sort_stats('cumulative')
+            if METRICS_DIR:
+                os.makedirs(METRICS_DIR, exist_ok=True)
+                path = os.path.join(METRICS_DIR, f"{name}_{stamp}.prof")
+                stats.dump_stats(path)
+                logger.info(f"cProfile stats written to {path}")
+            rows: List[str] = []
+            for (filename, line, function), (_, calls, _, cumulative, _) in list(
+                    sorted(stats.stats.items(), key=lambda item: -item[1][3]))[:15]:
+                rows.append(f"  {cumulative:8.2f}s {calls:>8} calls  {function} ({os.path.basename(filename)}:{line})")
+            logger.info("cProfile top functions by cumulative time:\n" + '\n'.join(rows))
+    else:
+        tracemalloc.start(10)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top = snapshot.statistics('lineno')[:15]
+            logger.info(f"tracemalloc peak {peak / 1024 / 1024:.1f} MB; top allocation sites:\n" +
+                        '\n'.join(f"  {stat}" for stat in top))
+
+
+_run_depth = threading.local()
+_profile_pending = PROFILE  # Cleared once a run has been profiled
+_profile_lock = threading.Lock()
+
+
+def take_profile_mode() -> str:
+    """PROFILE for the first instrumented run of the process, '' for later ones"""
+    global _profile_pending
+    with _profile_lock:
+        mode, _profile_pending = _profile_pending, ''
+    return mode
+
+
+def instrument_run(name: str):
+    """Decorator for run entry points: summarize the outermost call (and profile it if it's the first)
+
+    Nested instrumented calls (e.g. process_products calling itself for the
+    Claude share of a kNN run) are timed as part of the outer run.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            depth = getattr(_run_depth, 'value', 0)
+            if depth:
+                return func(*args, **kwargs)
+
+            _run_depth.value = 1
+            metrics.reset()
+            try:
+                with profile(name, take_profile_mode()):
+                    return func(*args, **kwargs)
+            finally:
+                _run_depth.value = 0
+                metrics.log_summary()
+                path = metrics.write_summary(name)
+                if path:
+                    logger.info(f"Run metrics written to {path}")
+        return wrapper
+    return decorator
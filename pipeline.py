@@ -0,0 +1,286 @@
+"""
+Streaming fetch → classify → persist → push pipeline
+
+Stages run concurrently and are connected by bounded queues:
+
+    fetch thread ──(PIPELINE_BUFFER products)──> classify + persist ──(approved codes)──> push thread
+
+Classification runs on the calling thread, which owns the SQLite connection;
+Claude calls go to a thread pool with at most 2 x concurrency requests in
+flight. Approved codes reach the push thread only after their product_matches
+rows are flushed, so WooCommerce never has a code the database lacks. A full queue blocks the stage feeding it, so memory stays flat no
+matter how large the catalog is.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
+
+from metrics import metrics
+from rate_limiter import TokenBucket
+from woo_client import WOO_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Pipeline settings
+PIPELINE_BUFFER = int(os.getenv('PIPELINE_BUFFER', 200))                 # Products fetched ahead of classification
+PIPELINE_PUSH_INTERVAL = float(os.getenv('PIPELINE_PUSH_INTERVAL', 10))  # Seconds before a partial push batch is sent
+
+# End-of-stream marker passed through the queues
+_DONE = object()
+
+
+class _FetchError:
+    """Carries an exception from the fetch thread to the classify stage"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class ClassificationPipeline:
+    """Classify products while the rest of the catalog is still downloading"""
+
+    def __init__(self, matcher, concurrency: int = 1, requests_per_minute: float = 50,
+                 buffer_size: int = None, push: bool = False, knn: bool = False):
+        """
+        Args:
+            matcher: WooCommerceHTSMatcher providing features, cache, persistence and push
+            concurrency: Claude calls in flight at once
+            requests_per_minute: Token bucket rate for Claude calls
+            buffer_size: Products buffered between fetch and classify
+            push: Push approved codes to WooCommerce as soon as they are saved
+            knn: Assign codes from agreeing approved neighbours before calling Claude
+        """
+        self.matcher = matcher
+        self.concurrency = max(1, concurrency)
+        self.limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=self.concurrency)
+        self.buffer_size = buffer_size or PIPELINE_BUFFER
+        self.push = push
+        self.knn = knn
+
+        self.stats = {}
+        self._held_pushes = []  # Approved codes whose rows may still be in the write buffer
+        self._stop = threading.Event()
+        self._start_time = None
+
+    def run(self, products: Iterable[Dict]) -> Dict:
+        """Stream products through classification (and optional push)
+
+        Args:
+            products: Any iterable of WooCommerce products; it is consumed on
+                a background thread, so generators that page through the API
+                keep downloading while earlier products are classified
+
+        Returns:
+            Run statistics (counts, time to first result, wall time)
+        """
+        self.stats = {
+            'products': 0, 'api_calls': 0, 'cached': 0, 'knn': 0, 'approved': 0, 'needs_review': 0,
+            'pushed': 0, 'push_failed': 0, 'first_result_seconds': None, 'elapsed_seconds': 0.0
+        }
+        self._stop.clear()
+        self._held_pushes = []
+        self._start_time = time.time()
+
+        fetched = queue.Queue(maxsize=self.buffer_size)
+        fetcher = threading.Thread(target=self._fetch, args=(products, fetched), daemon=True)
+        fetcher.start()
+
+        pushes = None
+        pusher = None
+        if self.push:
+            pushes = queue.Queue(maxsize=self.buffer_size)
+            pusher = threading.Thread(target=self._push_worker, args=(pushes,), daemon=True)
+            pusher.start()
+
+        try:
+            self._classify_stream(fetched, pushes)
+        finally:
+            self._stop.set()
+            self.matcher.flush_writes()
+            if pusher:
+                for code in self._held_pushes:
+                    pushes.put(code)
+                self._held_pushes = []
+                pushes.put(_DONE)
+                pusher.join()
+
+        self.stats['elapsed_seconds'] = time.time() - self._start_time
+        self.log_stats()
+        return self.stats
+
+    def _fetch(self, products: Iterable[Dict], fetched: queue.Queue):
+        """Fetch stage: feed products into the bounded queue"""
+        try:
+            for product in products:
+                if not self._put(fetched, product):
+                    return
+        except Exception as e:
+            self._put(fetched, _FetchError(e))
+            return
+        self._put(fetched, _DONE)
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up once the pipeline is stopping"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _classify(self, features: Dict):
+        """Worker-thread Claude call"""
+        with metrics.span('sleep'):
+            self.limiter.acquire()
+        start_time = time.time()
+        match = self.matcher.claude_matcher.match_product(features)
+        return match, time.time() - start_time
+
+    def _classify_stream(self, fetched: queue.Queue, pushes: queue.Queue):
+        """Classify and persist stage (runs on the thread that owns SQLite)"""
+        matcher = self.matcher
+        window = self.concurrency * 2
+        in_flight = deque()
+        knn_index = matcher.get_knn_index() if self.knn else None
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                try:
+                    item = fetched.get(timeout=0.2)
+                except queue.Empty:
+                    # Nothing new yet - save whatever has finished meanwhile
+                    self._drain(in_flight, pushes, block=False, window=window)
+                    self._release_pushes(pushes, flush=True)
+                    continue
+
+                if item is _DONE:
+                    break
+                if isinstance(item, _FetchError):
+                    raise item.error
+
+                features = matcher.extract_product_features(item)
+                match = matcher.get_cached_match(features)
+                if match is None and knn_index is not None and len(knn_index):
+                    match = knn_index.classify([features])[0]
+                if match is not None:
+                    self._persist(item, features, match, 0, 0.0, pushes)
+                else:
+                    in_flight.append((item, features, executor.submit(self._classify, features)))
+
+                self._drain(in_flight, pushes, block=False, window=window)
+
+            self._drain(in_flight, pushes, block=True, window=0)
+
+    def _drain(self, in_flight: deque, pushes: queue.Queue, block: bool, window: int):
+        """Persist finished Claude calls in submission order
+
+        Waits on the oldest call while more than `window` are in flight (or
+        for all of them when block=True), which is what throttles fetching.
+        """
+        while in_flight and (block or len(in_flight) >= window or in_flight[0][2].done()):
+            product, features, future = in_flight.popleft()
+            match, processing_time = future.result()
+            self.matcher.cache_match(features, match)
+            self._persist(product, features, match, 1, processing_time, pushes)
+
+    def _persist(self, product: Dict, features: Dict, match: Dict, api_calls: int,
+                 processing_time: float, pushes: queue.Queue):
+        """Save one result and hand approved codes to the push stage"""
+        result = self.matcher.build_result(product, features, match)
+        self.matcher.save_match(result)
+        self.matcher.log_processing(product['id'], api_calls, processing_time, match.get('usage'))
+
+        stats = self.stats
+        stats['products'] += 1
+        stats['api_calls'] += api_calls
+        if match.get('source') == 'knn':
+            stats['knn'] += 1
+        else:
+            stats['cached'] += 1 - api_calls
+        if stats['first_result_seconds'] is None:
+            stats['first_result_seconds'] = time.time() - self._start_time
+
+        if result['status'] == 'approved':
+            stats['approved'] += 1
+            if pushes is not None:
+                self._held_pushes.append((result['product_id'], result['hts_code'], result['confidence']))
+                # Pushed once saved: right away if the buffer just flushed, else every push batch
+                self._release_pushes(pushes, flush=len(self._held_pushes) >= WOO_BATCH_SIZE)
+        else:
+            stats['needs_review'] += 1
+
+        cached_note = " [knn]" if match.get('source') == 'knn' else " [cached]" if api_calls == 0 else ""
+        logger.info(f"  [{stats['products']}] {features['name'][:50]}... "
+                    f"→ HTS: {match['hts_code']} (confidence: {match['confidence']:.0%}){cached_note}")
+
+    def _release_pushes(self, pushes: queue.Queue, flush: bool = False):
+        """Hand held codes to the push stage once their rows are in the database
+
+        Args:
+            flush: Flush the write buffer first; otherwise codes are only
+                released when the buffer happens to be empty
+        """
+        if pushes is None or not self._held_pushes:
+            return
+        if flush:
+            self.matcher.flush_writes()
+        elif len(self.matcher.write_buffer):
+            return
+        for code in self._held_pushes:
+            self._put(pushes, code)
+        self._held_pushes = []
+
+    def _push_worker(self, pushes: queue.Queue):
+        """Push stage: send approved codes in batches of WOO_BATCH_SIZE"""
+        pending = []
+        oldest = None
+
+        while True:
+            try:
+                item = pushes.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+
+            if item is _DONE:
+                self._push(pending)
+                return
+            if item is not None:
+                pending.append(item)
+                oldest = oldest or time.time()
+
+            if pending and (len(pending) >= WOO_BATCH_SIZE or time.time() - oldest >= PIPELINE_PUSH_INTERVAL):
+                self._push(pending)
+                pending = []
+                oldest = None
+
+    def _push(self, codes):
+        if not codes:
+            return
+        try:
+            succeeded, failed = self.matcher.push_hts_codes(codes)
+        except Exception as e:
+            logger.error(f"Push of {len(codes)} HTS codes failed: {e}")
+            self.stats['push_failed'] += len(codes)
+            return
+        self.stats['pushed'] += len(succeeded)
+        self.stats['push_failed'] += len(failed)
+
+    def log_stats(self):
+        """Log a summary of the last run"""
+        stats = self.stats
+        elapsed = stats['elapsed_seconds']
+        rate = stats['products'] / elapsed if elapsed > 0 else 0.0
+        first = stats['first_result_seconds']
+        logger.info(f"Pipeline: {stats['products']} products in {elapsed:.1f}s ({rate:.2f} products/sec), "
+                    f"first result after {first if first is not None else 0:.1f}s")
+        logger.info(f"  {stats['api_calls']} API calls, {stats['cached']} cached, {stats['knn']} from neighbours, "
+                    f"{stats['approved']} approved, {stats['needs_review']} need review")
+        if self.push:
+            logger.info(f"  Pushed {stats['pushed']} codes to WooCommerce ({stats['push_failed']} failed)")
@@ -4,7 +4,7 @@ Push only recently classified products to WooCommerce
 Useful when you've already run classification but didn't push
 """
 
-from main import WooCommerceHTSMatcher, WooConfig
+from schema import migrate, db_timestamp, from_db_timestamp
 from datetime import datetime, timedelta
 import sqlite3
 import sys
@@ -43,8 +43,9 @@ def main():
             print("Example: python push_recent_only.py 2  # Push products from last 2 hours")
             return
     
-    # Connect to database
+    # Connect to database (upgrading older schemas so timestamps compare correctly)
     db = sqlite3.connect(DATABASE_PATH)
+    migrate(db)
     cursor = db.cursor()
     
     # Get products classified in the specified time period
@@ -57,7 +58,7 @@ def main():
         WHERE status = 'approved' 
         AND matched_at > ?
         ORDER BY matched_at DESC
-    """, (cutoff_time.isoformat(),))
+    """, (db_timestamp(cutoff_time),))
     
     recent_products = cursor.fetchall()
     
@@ -73,7 +74,7 @@ def main():
     # Group by time for better display
     current_date = None
     for product_id, name, hts_code, confidence, matched_at in recent_products:
-        match_datetime = datetime.fromisoformat(matched_at)
+        match_datetime = from_db_timestamp(matched_at)
         match_date = match_datetime.date()
         
         # Show date header when it changes
@@ -102,7 +103,8 @@ def main():
         print("Cancelled.")
         return
     
-    # Initialize WooCommerce connection
+    # Initialize WooCommerce connection (main.py is only loaded once there is something to push)
+    from main import WooCommerceHTSMatcher, WooConfig
     config = WooConfig(
         url=SITE_URL,
         consumer_key=WOO_CONSUMER_KEY,
@@ -112,22 +114,22 @@ def main():
     
     matcher = WooCommerceHTSMatcher(config, hts_db_path=DATABASE_PATH)
     
-    # Push each product
+    # Push in batches of up to 100 products per request
     print("\nPushing to WooCommerce...")
+    succeeded, failed = matcher.push_hts_codes(
+        [(product_id, hts_code, confidence) for product_id, _, hts_code, confidence, _ in recent_products]
+    )
+    
     success_count = 0
     failed_products = []
     
     for product_id, name, hts_code, confidence, _ in recent_products:
-        try:
-            if matcher.update_product_hts(product_id, hts_code, confidence):
-                success_count += 1
-                print(f"  ✓ {name[:40]}...")
-            else:
-                failed_products.append((product_id, name))
-                print(f"  ✗ Failed: {name[:40]}...")
-        except Exception as e:
+        if product_id in succeeded:
+            success_count += 1
+            print(f"  ✓ {name[:40]}...")
+        else:
             failed_products.append((product_id, name))
-            print(f"  ✗ Error updating {name[:40]}: {str(e)}")
+            print(f"  ✗ Failed: {name[:40]}... ({failed.get(product_id, 'unknown error')})")
     
     # Final summary
     print(f"\n{'='*60}")
@@ -3,7 +3,7 @@
 Push only TODAY's classified products to WooCommerce
 """
 
-from main import WooCommerceHTSMatcher, WooConfig
+from schema import migrate, db_timestamp, from_db_timestamp
 from datetime import datetime, timedelta
 import sqlite3
 
@@ -30,8 +30,9 @@ except ImportError:
 def main():
     print("=== Push Today's Classifications Only ===\n")
     
-    # Connect to database
+    # Connect to database (upgrading older schemas so timestamps compare correctly)
     db = sqlite3.connect(DATABASE_PATH)
+    migrate(db)
     cursor = db.cursor()
     
     # Get products classified in the last 24 hours
@@ -43,7 +44,7 @@ def main():
         WHERE status = 'approved' 
         AND matched_at > ?
         ORDER BY matched_at DESC
-    """, (yesterday.isoformat(),))
+    """, (db_timestamp(yesterday),))
     
     recent_products = cursor.fetchall()
     
@@ -54,7 +55,7 @@ def main():
     print(f"Found {len(recent_products)} products classified in the last 24 hours:\n")
     
     for product_id, name, hts_code, confidence, matched_at in recent_products:
-        time_str = datetime.fromisoformat(matched_at).strftime("%H:%M")
+        time_str = from_db_timestamp(matched_at).strftime("%H:%M")
         print(f"  • {name[:50]}...")
         print(f"    HTS: {hts_code} | Confidence: {confidence:.0%} | Time: {time_str}")
     
@@ -64,7 +65,8 @@ def main():
         print("Cancelled.")
         return
     
-    # Initialize WooCommerce connection
+    # Initialize WooCommerce connection (main.py is only loaded once there is something to push)
+    from main import WooCommerceHTSMatcher, WooConfig
     config = WooConfig(
         url=SITE_URL,
         consumer_key=WOO_CONSUMER_KEY,
@@ -74,14 +76,18 @@ def main():
     
     matcher = WooCommerceHTSMatcher(config, hts_db_path=DATABASE_PATH)
     
-    # Push each product
+    # Push in batches of up to 100 products per request
+    succeeded, failed = matcher.push_hts_codes(
+        [(product_id, hts_code, confidence) for product_id, _, hts_code, confidence, _ in recent_products]
+    )
+    
     success_count = 0
     for product_id, name, hts_code, confidence, _ in recent_products:
-        if matcher.update_product_hts(product_id, hts_code, confidence):
+        if product_id in succeeded:
             success_count += 1
             print(f"  ✓ Updated {name[:40]}...")
         else:
-            print(f"  ✗ Failed to update product {product_id}")
+            print(f"  ✗ Failed to update product {product_id}: {failed.get(product_id, 'unknown error')}")
     
     print(f"\n✓ Successfully pushed {success_count} of {len(recent_products)} products")
 
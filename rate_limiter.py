@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Rate limiting helpers shared by the Claude and WooCommerce clients
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """Thread-safe token bucket for smoothing request rates
+
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    Each acquire() takes one token, sleeping until one is available, so
+    short bursts up to `capacity` go out immediately while the long-run
+    rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then consume them"""
+        if self.rate <= 0:
+            return  # Unlimited
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._last_refill
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                self._last_refill = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """AIMD controller for requests in flight, steered by rate-limit feedback
+
+    Each success raises the in-flight limit (by one per success while in
+    slow start, by one per full window afterwards) up to `max_concurrency`;
+    each throttle halves it and pauses new requests for the server's
+    retry-after. Callers also report their remaining quota headroom so
+    sending pauses until the quota resets instead of running into a 429.
+    With adaptive=False the limit stays at max_concurrency and only the
+    pauses apply.
+
+    Usage:
+        with limiter.slot():
+            response = send()
+        limiter.on_success(headroom, reset_in)   # or limiter.on_throttle(retry_after)
+    """
+
+    def __init__(self, max_concurrency: int, adaptive: bool = True, decrease: float = 0.5):
+        self.max_concurrency = max(1, max_concurrency)
+        self.adaptive = adaptive
+        self.decrease = decrease
+        self.limit = 1.0 if adaptive else float(self.max_concurrency)
+        self.slow_start = adaptive
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.pacer = TokenBucket(rate=0)  # Send rate, learned from the quota (unlimited until known)
+        self.throttles = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a slot is free and no pause is in effect"""
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+        self.pacer.acquire()
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def set_max_concurrency(self, max_concurrency: int):
+        """Change the ceiling, e.g. to the concurrency a run was started with
+
+        A fixed limiter moves straight to the new ceiling; an adaptive one keeps
+        what it has learned, capped at the new ceiling.
+        """
+        with self._cond:
+            self.max_concurrency = max(1, max_concurrency)
+            if self.adaptive:
+                self.limit = min(self.limit, float(self.max_concurrency))
+            else:
+                self.limit = float(self.max_concurrency)
+            if self.pacer.rate:
+                self.pacer.capacity = max(1.0, float(self.max_concurrency))
+            self._cond.notify_all()
+
+    def set_rate(self, requests_per_minute: float):
+        """Pace sends to the quota's request rate"""
+        self.pacer.rate = requests_per_minute / 60.0
+        self.pacer.capacity = max(1.0, float(self.max_concurrency))
+
+    def on_success(self, headroom: float = None, reset_in: float = None):
+        """Record a completed request
+
+        Args:
+            headroom: Requests the remaining quota still allows (None if unknown)
+            reset_in: Seconds until that quota refills
+        """
+        with self._cond:
+            if headroom is not None and headroom < 1 and reset_in:
+                # Quota used up: hold new requests until it refills rather than collect 429s
+                self.paused_until = max(self.paused_until, time.monotonic() + reset_in)
+            elif self.adaptive and (headroom is None or headroom > self.in_flight):
+                step = 1.0 if self.slow_start else 1.0 / self.limit
+                self.limit = min(float(self.max_concurrency), self.limit + step)
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after: float):
+        """Record a 429/529: back off multiplicatively and pause for retry_after seconds"""
+        with self._cond:
+            self.throttles += 1
+            if self.adaptive:
+                self.limit = max(1.0, self.limit * self.decrease)
+                self.slow_start = False
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
@@ -0,0 +1,272 @@
+"""
+Versioned schema migrations and timestamp helpers for the local HTS database
+
+The database's PRAGMA user_version records the last migration applied.
+migrate() runs every newer migration in order, each in its own transaction,
+so databases created by any earlier release upgrade in place. To change the
+schema, append a migration - never edit one that has shipped.
+"""
+
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# All timestamps are stored as UTC text in this format, which sorts correctly
+# and matches SQLite's own datetime('now', ...) output
+DB_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def db_timestamp(value: datetime = None) -> str:
+    """Format a datetime (naive values are local time) as a UTC database timestamp"""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    return value.astimezone(timezone.utc).strftime(DB_TIME_FORMAT)
+
+
+def from_db_timestamp(value: str) -> datetime:
+    """Parse a database timestamp into an aware datetime in local time"""
+    return datetime.strptime(value[:19], DB_TIME_FORMAT).replace(tzinfo=timezone.utc).astimezone()
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    """Add a column unless it already exists (older releases added some ad hoc)"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in existing:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _add_derived_from(conn: sqlite3.Connection):
+    add_column(conn, 'product_matches', 'derived_from', 'INTEGER')
+
+
+def _add_sync_tracking(conn: sqlite3.Connection):
+    # Key/value state such as the date_modified_gmt high-water mark
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP
+        )
+    ''')
+    # Hash of the classification inputs, to skip products whose edits don't matter
+    add_column(conn, 'product_matches', 'feature_hash', 'TEXT')
+
+
+def _add_prompt_tracking(conn: sqlite3.Connection):
+    add_column(conn, 'processing_log', 'cache_read_tokens', 'INTEGER')
+    add_column(conn, 'processing_log', 'cache_write_tokens', 'INTEGER')
+    add_column(conn, 'product_matches', 'prompt_version', 'TEXT')
+
+
+def _add_match_source(conn: sqlite3.Connection):
+    # How a match was made ('claude', 'knn') and the attributes it was made from
+    add_column(conn, 'product_matches', 'source', 'TEXT')
+    add_column(conn, 'product_matches', 'attributes', 'TEXT')
+
+
+def _add_usage_tracking(conn: sqlite3.Connection):
+    # Actual token usage and request latency of each API call, for cost/time estimates
+    add_column(conn, 'processing_log', 'input_tokens', 'INTEGER')
+    add_column(conn, 'processing_log', 'output_tokens', 'INTEGER')
+    add_column(conn, 'processing_log', 'latency', 'REAL')
+    add_column(conn, 'processing_log', 'model', 'TEXT')
+
+
+def _add_requeue(conn: sqlite3.Connection):
+    # Product data that arrived while a worker held the product's lease
+    add_column(conn, 'work_queue', 'requeued_product', 'TEXT')
+
+
+def _normalize_timestamps(conn: sqlite3.Connection):
+    # Earlier releases stored naive local datetimes ('2024-05-01 14:03:22.123456')
+    columns = {
+        'product_matches': ['matched_at', 'updated_at'],
+        'processing_log': ['timestamp'],
+        'batch_jobs': ['submitted_at', 'completed_at'],
+        'classification_cache': ['created_at', 'last_used_at'],
+    }
+    for table, names in columns.items():
+        for name in names:
+            conn.execute(f'''
+                UPDATE {table}
+                SET {name} = strftime('%Y-%m-%d %H:%M:%S', {name}, 'utc')
+                WHERE {name} IS NOT NULL
+                AND strftime('%Y-%m-%d %H:%M:%S', {name}, 'utc') IS NOT NULL
+            ''')
+
+
+Step = Union[List[str], Callable[[sqlite3.Connection], None]]
+
+MIGRATIONS: List[Tuple[int, str, Step]] = [
+    (1, "Create tracking tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS product_matches (
+            product_id INTEGER PRIMARY KEY,
+            sku TEXT,
+            name TEXT,
+            description TEXT,
+            categories TEXT,
+            hts_code TEXT,
+            hts_description TEXT,
+            confidence REAL,
+            reasoning TEXT,
+            material TEXT,
+            alternative_codes TEXT,
+            status TEXT,  -- 'pending', 'approved', 'rejected', 'manual'
+            matched_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            review_notes TEXT
+        )
+        ''',
+        # Processing history for rate limiting
+        '''
+        CREATE TABLE IF NOT EXISTS processing_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            api_calls INTEGER,
+            processing_time REAL,
+            timestamp TIMESTAMP
+        )
+        ''',
+        # Message Batches jobs, so interrupted bulk runs can be resumed
+        '''
+        CREATE TABLE IF NOT EXISTS batch_jobs (
+            batch_id TEXT PRIMARY KEY,
+            status TEXT,  -- 'submitted', 'collected'
+            items TEXT,  -- JSON: custom_id -> {product_id, features}
+            submitted_at TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+        ''',
+        # Classification cache keyed by product content + model + prompt version
+        '''
+        CREATE TABLE IF NOT EXISTS classification_cache (
+            cache_key TEXT PRIMARY KEY,
+            product_id INTEGER,
+            model TEXT,
+            prompt_version TEXT,
+            result TEXT,  -- JSON match from Claude
+            created_at TIMESTAMP,
+            last_used_at TIMESTAMP,
+            hit_count INTEGER DEFAULT 0
+        )
+        ''',
+    ]),
+    (2, "Track the representative product of duplicate groups", _add_derived_from),
+    (3, "Store timestamps as UTC 'YYYY-MM-DD HH:MM:SS'", _normalize_timestamps),
+    (4, "Add covering indexes for status, time-window and cache queries", [
+        # Summary counts, processed-ID lookups and the pending review list
+        '''
+        CREATE INDEX IF NOT EXISTS idx_product_matches_status_confidence
+        ON product_matches (status, confidence, hts_code)
+        ''',
+        # "Approved since <time>" push queries
+        '''
+        CREATE INDEX IF NOT EXISTS idx_product_matches_status_matched_at
+        ON product_matches (status, matched_at, hts_code, confidence, name)
+        ''',
+        # 24-hour processing stats
+        '''
+        CREATE INDEX IF NOT EXISTS idx_processing_log_timestamp
+        ON processing_log (timestamp, api_calls, processing_time)
+        ''',
+        # Cache TTL/LRU eviction and per-product invalidation
+        '''
+        CREATE INDEX IF NOT EXISTS idx_classification_cache_last_used_at
+        ON classification_cache (last_used_at)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_classification_cache_product_id
+        ON classification_cache (product_id)
+        ''',
+    ]),
+    (5, "Track incremental catalog sync", _add_sync_tracking),
+    (6, "Record prompt cache usage and the prompt revision of each match", _add_prompt_tracking),
+    (7, "Record the source and attributes of each match", _add_match_source),
+    (8, "Record token usage and latency of each API call", _add_usage_tracking),
+    (9, "Checkpoint classification runs so they can be resumed", [
+        # One row per process_products invocation
+        '''
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id TEXT PRIMARY KEY,
+            status TEXT,  -- 'running', 'interrupted', 'completed'
+            options TEXT,  -- JSON: process_products arguments
+            total INTEGER,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''',
+        # The frozen target list of a run and how far each product got
+        '''
+        CREATE TABLE IF NOT EXISTS run_items (
+            run_id TEXT,
+            product_id INTEGER,
+            position INTEGER,
+            state TEXT,  -- 'queued', 'in_flight', 'done', 'failed'
+            product TEXT,  -- JSON: the WooCommerce product as fetched
+            updated_at TIMESTAMP,
+            PRIMARY KEY (run_id, product_id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_run_items_state
+        ON run_items (run_id, state, position)
+        ''',
+    ]),
+    (10, "Add a work queue shared by worker processes", [
+        # Products waiting for (or leased to) a worker process, see work_queue.py
+        '''
+        CREATE TABLE IF NOT EXISTS work_queue (
+            product_id INTEGER PRIMARY KEY,
+            product TEXT,  -- JSON: the WooCommerce product as fetched
+            state TEXT,  -- 'pending', 'claimed', 'done', 'failed'
+            claimed_by TEXT,
+            lease_expires TIMESTAMP,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            enqueued_at TIMESTAMP,
+            updated_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_work_queue_state
+        ON work_queue (state, lease_expires, enqueued_at)
+        ''',
+    ]),
+    (11, "Keep product updates that arrive while a worker holds the lease", _add_requeue),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Return the last migration applied to this database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations and return the resulting schema version"""
+    current = schema_version(conn)
+
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+
+        conn.execute("BEGIN")
+        try:
+            if callable(step):
+                step(conn)
+            else:
+                for sql in step:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        logger.info(f"Database migrated to schema version {version}: {description}")
+        current = version
+
+    return current
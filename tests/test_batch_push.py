@@ -0,0 +1,75 @@
+"""Batch pushes report each item on its own and resend only the items that failed"""
+
+import threading
+
+import pytest
+import requests
+
+import fake_woocommerce
+import woo_client
+from woo_client import WooClient
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    monkeypatch.setattr(woo_client, 'WOO_BACKOFF', 0.0)
+    server = fake_woocommerce.make_server(0, 5)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server) -> WooClient:
+    return WooClient(f"http://127.0.0.1:{server.server_address[1]}", 'ck_test', 'cs_test')
+
+
+def update(product_id: int) -> dict:
+    return {'id': product_id, 'meta_data': [{'key': 'hts_code', 'value': '6912.00.4810'}]}
+
+
+def test_item_errors_and_failed_requests_are_retried_per_item(woo, monkeypatch):
+    client = make_client(woo)
+    sent = []
+    post = client.post
+
+    def flaky_post(path, **kwargs):
+        sent.append([item['id'] for item in kwargs['json']['update']])
+        if len(sent) == 1:
+            raise requests.exceptions.ConnectionError('connection reset')
+        return post(path, **kwargs)
+
+    monkeypatch.setattr(client, 'post', flaky_post)
+    succeeded, failed = client.batch_update_products([update(i) for i in (1, 2, 999, 3)], batch_size=2, attempts=3)
+
+    assert succeeded == {1, 2, 3}
+    assert failed == {999: 'Invalid ID.'}
+    # Second and third passes resend only what failed before
+    assert sent == [[1, 2], [999, 3], [1, 2], [999], [999]]
+    assert set(woo.state.updates) == {1, 2, 3}
+
+
+def test_items_missing_from_the_response_count_as_failed(woo, monkeypatch):
+    client = make_client(woo)
+    post = client.post
+
+    def truncated_post(path, **kwargs):
+        response = post(path, **kwargs)
+        results = response.json()['update'][:-1]
+        response.json = lambda: {'update': results}
+        return response
+
+    monkeypatch.setattr(client, 'post', truncated_post)
+    succeeded, failed = client.batch_update_products([update(1), update(2)], attempts=1)
+
+    assert succeeded == {1}
+    assert failed == {2: 'missing from batch response'}
+
+
+def test_http_error_fails_the_whole_chunk(woo):
+    client = make_client(woo)
+    succeeded, failed = client.batch_update_products([update(i) for i in range(1, 103)], batch_size=101, attempts=1)
+
+    assert succeeded == set()
+    assert len(failed) == 102
+    assert failed[1].startswith('HTTP 413')
@@ -0,0 +1,49 @@
+"""Message Batches runs extract each product once, including the cache check"""
+
+import threading
+
+import pytest
+
+import fake_anthropic
+import fake_woocommerce
+
+
+@pytest.fixture
+def matcher(tmp_path, monkeypatch):
+    claude = fake_anthropic.make_server(0, 0)
+    woo = fake_woocommerce.make_server(0, 6)
+    for server in (claude, woo):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('ANTHROPIC_BASE_URL', f"http://127.0.0.1:{claude.server_address[1]}")
+    monkeypatch.setenv('METRICS_DIR', '')
+    import main
+
+    config = main.WooConfig(f"http://127.0.0.1:{woo.server_address[1]}", 'ck_test', 'cs_test', 'sk-test')
+    matcher = main.WooCommerceHTSMatcher(config, str(tmp_path / 'test.db'))
+    yield matcher
+    matcher.close()
+    for server in (claude, woo):
+        server.shutdown()
+        server.server_close()
+
+
+def test_batch_run_extracts_each_product_once(matcher, monkeypatch):
+    products = matcher.fetch_all_products()
+    extracted = []
+    extract_features_batch = matcher.extract_features_batch
+
+    def counting_extract(batch):
+        extracted.extend(product['id'] for product in batch)
+        return extract_features_batch(batch)
+
+    monkeypatch.setattr(matcher, 'extract_features_batch', counting_extract)
+    results = matcher.process_products_batch(products, poll_interval=0.05)
+
+    assert sorted(r['product_id'] for r in results) == sorted(p['id'] for p in products)
+    assert sorted(extracted) == sorted(p['id'] for p in products)
+
+    # A second run is answered from the cache without submitting a batch
+    extracted.clear()
+    monkeypatch.setattr(matcher.claude_matcher, 'submit_batch', lambda items: pytest.fail('batch submitted'))
+    assert len(matcher.process_products_batch(products, poll_interval=0.05)) == len(products)
+    assert len(extracted) == len(products)
@@ -0,0 +1,29 @@
+"""Classification cache writes go through the write buffer"""
+
+import sqlite3
+
+
+def test_buffered_cache_entries_are_visible_and_hits_are_batched(tmp_path, monkeypatch):
+    monkeypatch.setenv('METRICS_DIR', '')
+    import main
+
+    config = main.WooConfig('http://127.0.0.1:9', 'ck_test', 'cs_test', 'sk-test')
+    db_path = str(tmp_path / 'test.db')
+    matcher = main.WooCommerceHTSMatcher(config, db_path)
+    features = {'id': 1, 'name': 'Steel mug', 'categories': ['Kitchen'], 'description': 'A mug'}
+    match = {'hts_code': '7323.93.0045', 'confidence': 0.9}
+
+    matcher.cache_match(features, match)
+    assert matcher.get_cached_match(features) == match  # Still in the write buffer
+    assert matcher.get_cached_match(features) == match
+    assert len(matcher.write_buffer) == 3
+
+    with sqlite3.connect(db_path) as db:
+        assert db.execute("SELECT COUNT(*) FROM classification_cache").fetchone()[0] == 0
+
+    matcher.flush_writes()
+    assert matcher.get_cached_match(features) == match
+    matcher.flush_writes()
+    with sqlite3.connect(db_path) as db:
+        assert db.execute("SELECT hit_count FROM classification_cache").fetchone()[0] == 3
+    matcher.hts_db.close()
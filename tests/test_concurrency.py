@@ -0,0 +1,77 @@
+"""A run's concurrency, not the MAX_CONCURRENCY default, sets how many Claude calls are in flight"""
+
+import os
+import threading
+
+import pytest
+
+import fake_anthropic
+import fake_woocommerce
+
+
+@pytest.fixture
+def servers():
+    claude = fake_anthropic.make_server(0, 0, latency=0.2)
+    woo = fake_woocommerce.make_server(0, 16)
+    for server in (claude, woo):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield claude, woo
+    for server in (claude, woo):
+        server.shutdown()
+        server.server_close()
+
+
+def test_run_concurrency_raises_limiter_ceiling(servers, tmp_path, monkeypatch):
+    claude, woo = servers
+    monkeypatch.setenv('ANTHROPIC_BASE_URL', f"http://127.0.0.1:{claude.server_address[1]}")
+    monkeypatch.setenv('METRICS_DIR', '')
+    import main
+    monkeypatch.setattr(main, 'MAX_CONCURRENCY', 1)
+    monkeypatch.setattr(main, 'ADAPTIVE_CONCURRENCY', False)
+    monkeypatch.setattr(main, 'PACED_REQUESTS_PER_MINUTE', 100000)
+
+    config = main.WooConfig(f"http://127.0.0.1:{woo.server_address[1]}", 'ck_test', 'cs_test', 'sk-test')
+    matcher = main.WooCommerceHTSMatcher(config, str(tmp_path / 'test.db'))
+    limiter = matcher.claude_matcher.limiter
+    assert limiter.max_concurrency == 1
+
+    peak = 0
+    acquire = limiter.acquire
+
+    def track():
+        nonlocal peak
+        acquire()
+        peak = max(peak, limiter.in_flight)
+
+    monkeypatch.setattr(limiter, 'acquire', track)
+    products = matcher.fetch_all_products()
+    results = matcher.process_products(products, concurrency=8, dedup=False, pack=False, knn=False,
+                                       record_run=False)
+    matcher.flush_writes()
+    matcher.hts_db.close()
+
+    assert len(results) == len(products)
+    assert peak > 1
+
+
+def test_rate_share_splits_limits_without_changing_settings(tmp_path, monkeypatch):
+    monkeypatch.setenv('METRICS_DIR', '')
+    import main
+    monkeypatch.setattr(main, 'MAX_CONCURRENCY', 8)
+    monkeypatch.setattr(main, 'REQUESTS_PER_MINUTE', 100.0)
+    monkeypatch.setattr(main, 'PACED_REQUESTS_PER_MINUTE', 100.0)
+
+    config = main.WooConfig('http://127.0.0.1:9', 'ck_test', 'cs_test', 'sk-test')
+    matcher = main.WooCommerceHTSMatcher(config, str(tmp_path / 'test.db'), rate_share=3)
+    claude = matcher.claude_matcher
+    assert (claude.max_concurrency, claude.paced_requests_per_minute) == (2, 100.0 / 3)
+    assert claude.limiter.max_concurrency == 2
+    assert (main.MAX_CONCURRENCY, main.REQUESTS_PER_MINUTE) == (8, 100.0)
+
+    # Defaults for this process's runs come from its share
+    captured = {}
+    monkeypatch.setattr(matcher, 'classify_products', lambda products, batch_size, concurrency, *args:
+                        captured.setdefault('concurrency', concurrency) and [])
+    matcher.process_products([{'id': 1}], record_run=False)
+    assert captured['concurrency'] == 2
+    matcher.close()
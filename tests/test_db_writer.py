@@ -0,0 +1,33 @@
+"""Buffered rows are written in the order they were added"""
+
+import sqlite3
+
+from db_writer import WriteBuffer
+
+INSERT = "INSERT OR REPLACE INTO cache (key, hits) VALUES (?, 0)"
+UPDATE = "UPDATE cache SET hits = hits + 1 WHERE key = ?"
+
+
+def make_buffer() -> WriteBuffer:
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, hits INTEGER)")
+    return WriteBuffer(conn, max_rows=100, max_seconds=3600)
+
+
+def test_update_after_insert_of_same_key_is_applied():
+    buffer = make_buffer()
+    buffer.add(UPDATE, ('a',))  # Statement order seen first: UPDATE, then INSERT
+    buffer.add(INSERT, ('b',))
+    buffer.add(UPDATE, ('b',))
+    buffer.add(UPDATE, ('b',))
+    assert buffer.flush() == 4
+    assert buffer.conn.execute("SELECT key, hits FROM cache").fetchall() == [('b', 2)]
+
+
+def test_replace_after_update_wins():
+    buffer = make_buffer()
+    buffer.add(INSERT, ('a',))
+    buffer.add(UPDATE, ('a',))
+    buffer.add(INSERT, ('a',))
+    buffer.flush()
+    assert buffer.conn.execute("SELECT hits FROM cache").fetchone() == (0,)
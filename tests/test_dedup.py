@@ -0,0 +1,45 @@
+"""Products are grouped by SKU, identical text, or MinHash similarity at the threshold"""
+
+from dedup import ProductDeduplicator
+
+WORDS = ("stainless steel insulated travel mug with leak proof bamboo lid keeps drinks hot for six hours and cold "
+         "for twelve hours double wall vacuum construction fits most car cup holders powder coated finish resists "
+         "chips and scratches wide mouth opening makes cleaning easy holds sixteen ounces of coffee tea or water "
+         "bpa free lid gasket removable for washing available in five colours").split()
+
+
+def mug(changed=(), **fields):
+    words = ['changed' if i in changed else word for i, word in enumerate(WORDS)]
+    return {'name': 'Travel Mug', 'description': ' '.join(words), **fields}
+
+
+def test_one_word_edit_is_a_duplicate_at_the_default_threshold():
+    assert ProductDeduplicator().group([mug(), mug(changed={40})]) == [[0, 1]]
+
+
+def test_threshold_decides_moderately_similar_products():
+    # About three quarters of the shingles are shared
+    products = [mug(), mug(changed={15, 30, 45})]
+    assert ProductDeduplicator(threshold=0.9).group(products) == [[0], [1]]
+    assert ProductDeduplicator(threshold=0.6).group(products) == [[0, 1]]
+
+
+def test_unrelated_products_stay_apart_at_a_low_threshold():
+    kettle = {'name': 'Electric Kettle', 'description': '1.7 litre cordless kettle with rapid boil and auto shut off',
+              'categories': ['Kitchen Appliances']}
+    assert ProductDeduplicator(threshold=0.5).group([mug(), kettle]) == [[0], [1]]
+
+
+def test_sku_and_identical_text_group_with_first_as_representative():
+    products = [
+        {'name': 'Bamboo Tray', 'sku': 'TR-1'},
+        mug(),
+        {'name': 'Serving tray, bamboo', 'sku': 'TR-1'},
+        mug(description='Travel mug.  STAINLESS  steel, bamboo lid'),
+        mug(description='travel mug stainless steel bamboo lid'),
+    ]
+    assert ProductDeduplicator().group(products) == [[0, 2], [1], [3, 4]]
+
+
+def test_products_without_text_or_sku_are_not_grouped():
+    assert ProductDeduplicator().group([{'name': ''}, {'name': ''}]) == [[0], [1]]
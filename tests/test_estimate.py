@@ -0,0 +1,34 @@
+"""Cost and time estimates both use the mean per product for their totals"""
+
+import pandas as pd
+import pytest
+
+import main
+
+
+@pytest.fixture
+def matcher(tmp_path, monkeypatch):
+    monkeypatch.setenv('METRICS_DIR', '')
+    monkeypatch.setattr(main, 'MAX_CONCURRENCY', 1)
+    monkeypatch.setattr(main, 'PACK_PRODUCTS', False)
+    monkeypatch.setattr(main, 'ADAPTIVE_CONCURRENCY', True)
+    config = main.WooConfig('http://127.0.0.1:9', 'ck_test', 'cs_test', 'sk-test')
+    matcher = main.WooCommerceHTSMatcher(config, str(tmp_path / 'test.db'))
+    yield matcher
+    matcher.close()
+
+
+def test_skewed_history_totals_use_the_mean(matcher, monkeypatch):
+    # Most calls are quick and cheap; a few slow, expensive ones pull the mean up
+    latencies = [1.0] * 8 + [10.0, 22.0]
+    costs = [0.001] * 8 + [0.010, 0.022]
+    history = pd.DataFrame({'input_tokens': 400, 'output_tokens': 150, 'cache_read_tokens': 0,
+                            'cache_write_tokens': 0, 'latency': latencies, 'categories': None, 'cost': costs})
+    monkeypatch.setattr(matcher, 'get_usage_history', lambda: history)
+
+    estimate = matcher.get_processing_cost_estimate(600)
+
+    assert estimate['estimated_cost_usd'] == pytest.approx(600 * 0.004)
+    assert estimate['estimated_time_minutes'] == pytest.approx(600 * 4.0 / 60)
+    assert estimate['time_range_minutes'][0] == pytest.approx(600 * 1.0 / 60)
+    assert estimate['estimated_time_minutes'] > estimate['time_range_minutes'][0]
@@ -0,0 +1,21 @@
+"""Store boilerplate is dropped without losing product facts that mention it"""
+
+from extract import budget_text
+
+
+def clean(html: str) -> str:
+    return budget_text(html, 300, set())[0]
+
+
+def test_boilerplate_sentences_are_dropped():
+    html = ('<p>Stainless steel travel mug with a bamboo lid. Free shipping on orders over $50! '
+            '30-day money-back guarantee. Colors may vary due to monitor settings.</p>'
+            '<p>Follow us on Instagram. Add to cart today.</p>')
+    assert clean(html) == 'Stainless steel travel mug with a bamboo lid.'
+
+
+def test_sentences_mentioning_shipping_or_returns_are_kept():
+    html = ('<p>Shipping weight: 1.2 kg, ships in 2 cartons. The lid returns to its closed position '
+            'when released. Please note the handle is not dishwasher safe.</p>')
+    assert clean(html) == ('Shipping weight: 1.2 kg, ships in 2 cartons. The lid returns to its closed position '
+                           'when released. Please note the handle is not dishwasher safe.')
@@ -0,0 +1,63 @@
+"""The schedule index shortlists lines by their full description and knows which codes exist"""
+
+import csv
+
+import pytest
+
+from hts_index import format_code, load_index, schedule_documents
+
+ROWS = [
+    (0, '6912', 'Ceramic tableware, kitchenware, other household articles:'),
+    (1, '6912.00.10', 'Tableware and kitchenware:'),
+    (2, '6912.00.4810', 'Mugs and other steins'),
+    (2, '6912.00.5000', 'Other'),
+    (0, '7323', 'Table, kitchen or other household articles, of iron or steel:'),
+    (1, '7323.93.00', 'Of stainless steel:'),
+    (2, '7323.93.0080', 'Other'),
+    (0, '8516', 'Electric instantaneous water heaters:'),
+    (1, '8516.71.0000', 'Coffee or tea makers'),
+    (1, '8516.79.0000', 'Other electrothermic appliances'),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    schedule = tmp_path / 'hts_schedule.csv'
+    with open(schedule, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['HTS Number', 'Indent', 'Description'])
+        for indent, number, description in ROWS:
+            writer.writerow([number, indent, description])
+    return load_index(str(tmp_path / 'index'), str(schedule))
+
+
+def test_lines_carry_their_parents_descriptions():
+    documents = dict(schedule_documents(ROWS))
+    assert list(documents) == ['6912.00.4810', '6912.00.5000', '7323.93.0080', '8516.71.0000', '8516.79.0000']
+    assert documents['7323.93.0080'] == ('Table, kitchen or other household articles, of iron or steel '
+                                         '> Of stainless steel > Other')
+
+
+def test_search_ranks_by_inherited_text(index):
+    results = index.search('stainless steel travel mug', k=3)
+    assert results[0]['hts_code'] == '7323.93.0080'
+    assert '6912.00.4810' in [r['hts_code'] for r in results]
+    assert [r['score'] for r in results] == sorted((r['score'] for r in results), reverse=True)
+    assert index.search('bicycle') == []
+
+
+def test_contains_accepts_any_punctuation(index):
+    assert index.contains('6912.00.4810')
+    assert index.contains('6912004810')
+    assert not index.contains('6912.00.4899')
+    assert not index.contains('6912.00')
+    assert format_code('8516.71.00.00') == '8516.71.0000'
+
+
+def test_index_is_rebuilt_when_the_schedule_changes(index, tmp_path):
+    schedule = tmp_path / 'hts_schedule.csv'
+    with open(schedule, 'a', newline='') as f:
+        csv.writer(f).writerow(['9503.00.0073', 0, 'Toys, dolls'])
+    rebuilt = load_index(str(tmp_path / 'index'), str(schedule))
+    assert len(rebuilt) == len(index) + 1
+    assert rebuilt.contains('9503.00.0073')
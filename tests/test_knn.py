@@ -0,0 +1,44 @@
+"""Nearest-neighbour index: indexed products and queries are vectorized alike"""
+
+from knn import NeighbourIndex, features_vector
+
+
+def features(product_id: int, name: str, attributes: str = '') -> dict:
+    return {'id': product_id, 'name': name, 'categories': ['Kitchen', 'Drinkware'], 'attributes': attributes}
+
+
+def add(index: NeighbourIndex, f: dict, hts_code: str = '7323.93.0045'):
+    # Claude's material answer is stored with the match but must not change the vector
+    index.add(f['id'], f['name'], f['categories'], f['attributes'],
+              {'hts_code': hts_code, 'hts_description': 'Steel tableware', 'confidence': 0.95,
+               'material': 'stainless steel'})
+
+
+def test_indexed_product_matches_itself_exactly():
+    index = NeighbourIndex()
+    mug = features(1, 'Insulated Travel Mug 16oz', 'Color: Black, Capacity: 16oz')
+    add(index, mug)
+
+    (neighbours,) = index.query([features_vector(mug)], k=1)
+    assert neighbours[0][0] == 0
+    assert abs(neighbours[0][1] - 1.0) < 1e-5
+
+
+def test_exact_duplicates_are_classified_at_the_strictest_threshold():
+    index = NeighbourIndex()
+    add(index, features(1, 'Insulated Travel Mug 16oz', 'Color: Black'))
+    add(index, features(2, 'Insulated Travel Mug 16oz', 'Color: Black'))
+
+    (match,) = index.classify([features(3, 'Insulated Travel Mug 16oz', 'Color: Black')],
+                              similarity=0.9999, min_neighbours=2)
+    assert match['hts_code'] == '7323.93.0045'
+    assert match['source'] == 'knn'
+
+
+def test_material_attribute_counts_on_both_sides():
+    index = NeighbourIndex()
+    add(index, features(1, 'Tote Bag', 'Material: Cotton'))
+    (same,) = index.query([features_vector(features(2, 'Tote Bag', 'Material: Cotton'))], k=1)
+    (other,) = index.query([features_vector(features(3, 'Tote Bag', 'Material: Polyester'))], k=1)
+    assert abs(same[0][1] - 1.0) < 1e-5
+    assert other[0][1] < same[0][1]
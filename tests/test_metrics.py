@@ -0,0 +1,24 @@
+"""PROFILE applies to the first instrumented run only"""
+
+import metrics
+
+
+def test_profile_is_used_once(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', '')
+    monkeypatch.setattr(metrics, '_profile_pending', 'tracemalloc')
+    modes = []
+    profile = metrics.profile
+
+    def spy(name, mode=None):
+        modes.append(mode)
+        return profile(name, mode)
+
+    monkeypatch.setattr(metrics, 'profile', spy)
+
+    @metrics.instrument_run('test')
+    def run():
+        return 1
+
+    run()
+    run()
+    assert modes == ['tracemalloc', '']
@@ -0,0 +1,61 @@
+"""Packed replies are matched to products by ID, never by position"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+PRODUCTS = [{'id': 11, 'name': 'Mug'}, {'id': 12, 'name': 'Kettle'}, {'id': 13, 'name': 'Tray'}]
+
+
+@pytest.fixture
+def matcher(monkeypatch):
+    monkeypatch.setattr(main, 'HTS_CANDIDATES', 0)
+    return main.HTSMatcher('sk-test')
+
+
+def element(product_id, hts_code='6912.00.4810', confidence=0.9):
+    return {'product_id': product_id, 'hts_code': hts_code, 'hts_description': 'Ceramic tableware',
+            'confidence': confidence, 'reasoning': 'Ceramic', 'material': 'ceramic', 'alternative_codes': []}
+
+
+def test_misordered_elements_go_to_their_own_products(matcher):
+    reply = json.dumps([element(13, '7323.93.0080'), element(11), element(12, '8516.79.0000')])
+    matches = matcher.parse_packed_response(reply, PRODUCTS)
+    assert {product_id: match['hts_code'] for product_id, match in matches.items()} == {
+        11: '6912.00.4810', 12: '8516.79.0000', 13: '7323.93.0080'}
+
+
+def test_missing_unknown_and_repeated_ids_are_dropped(matcher):
+    reply = 'Here you go:\n' + json.dumps([
+        element(12), element(99, '7323.93.0080'), element(12, '8516.79.0000'), {'hts_code': '6912.00.4810'},
+    ])
+    matches = matcher.parse_packed_response(reply, PRODUCTS)
+    assert list(matches) == [12]
+    assert matches[12]['hts_code'] == '6912.00.4810'
+
+
+def test_invalid_elements_are_dropped_individually(matcher):
+    reply = json.dumps([element(11, '6912.00'), element(12, confidence=None), element('13')])
+    assert list(matcher.parse_packed_response(reply, PRODUCTS)) == [13]
+
+
+def test_unparseable_reply_matches_nothing(matcher):
+    assert matcher.parse_packed_response('Sorry, I cannot help with that.', PRODUCTS) == {}
+    assert matcher.parse_packed_response('[{"product_id": 11,', PRODUCTS) == {}
+
+
+def test_products_missing_from_reply_are_retried_alone(matcher, monkeypatch):
+    reply = json.dumps([element(13), element(11)])
+    response = SimpleNamespace(content=[SimpleNamespace(text=reply)], usage=None)
+    monkeypatch.setattr(matcher, 'create_message', lambda params: (response, 0.5))
+    monkeypatch.setattr(matcher, 'record_usage', lambda usage, latency: {'input_tokens': 100, 'latency': latency})
+    monkeypatch.setattr(matcher, 'match_product', lambda product_info: element(product_info['id'], '9999.99.9999'))
+
+    matches, retried = matcher.match_products(PRODUCTS)
+    assert retried == {12}
+    assert matches[12]['hts_code'] == '9999.99.9999'
+    assert matches[11]['hts_code'] == matches[13]['hts_code'] == '6912.00.4810'
+    assert sum(matches[product_id]['usage']['input_tokens'] for product_id in (11, 13)) == 100
@@ -0,0 +1,56 @@
+"""Streaming pipeline: codes are pushed only after their rows are saved"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import fake_anthropic
+import fake_woocommerce
+
+
+@pytest.fixture
+def servers():
+    claude = fake_anthropic.make_server(0, 0, latency=0.01)
+    woo = fake_woocommerce.make_server(0, 120)
+    for server in (claude, woo):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield claude, woo
+    for server in (claude, woo):
+        server.shutdown()
+        server.server_close()
+
+
+def test_pushed_codes_are_already_in_the_database(servers, tmp_path, monkeypatch):
+    claude, woo = servers
+    monkeypatch.setenv('ANTHROPIC_BASE_URL', f"http://127.0.0.1:{claude.server_address[1]}")
+    monkeypatch.setenv('METRICS_DIR', '')
+    import main
+    import pipeline
+    monkeypatch.setattr(main, 'KNN_CLASSIFY', False)
+    monkeypatch.setattr(pipeline, 'WOO_BATCH_SIZE', 5)  # Push early and often
+    monkeypatch.setattr(pipeline, 'PIPELINE_PUSH_INTERVAL', 0)
+    monkeypatch.setattr(main, 'PACED_REQUESTS_PER_MINUTE', 100000)
+
+    db_path = str(tmp_path / 'test.db')
+    config = main.WooConfig(f"http://127.0.0.1:{woo.server_address[1]}", 'ck_test', 'cs_test', 'sk-test')
+    matcher = main.WooCommerceHTSMatcher(config, db_path)
+    matcher.write_buffer.max_rows = 10_000  # Only explicit flushes write rows
+    matcher.write_buffer.max_seconds = 3600
+
+    unsaved = []
+    push_hts_codes = matcher.push_hts_codes
+
+    def checked_push(codes):
+        with sqlite3.connect(db_path) as db:
+            saved = {row[0] for row in db.execute("SELECT product_id FROM product_matches")}
+        unsaved.extend(product_id for product_id, _, _ in codes if product_id not in saved)
+        return push_hts_codes(codes)
+
+    monkeypatch.setattr(matcher, 'push_hts_codes', checked_push)
+    stats = matcher.process_catalog_streaming(matcher.fetch_all_products(), push=True, concurrency=4)
+    matcher.close()
+
+    assert stats['approved'] > 0
+    assert stats['pushed'] == stats['approved']
+    assert unsaved == []
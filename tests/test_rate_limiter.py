@@ -0,0 +1,98 @@
+"""The adaptive limiter grows on success, halves on throttles and pauses for the quota"""
+
+import threading
+import time
+
+from rate_limiter import AdaptiveLimiter
+
+
+def succeed(limiter: AdaptiveLimiter, times: int, headroom: float = None):
+    for _ in range(times):
+        with limiter.slot():
+            pass
+        limiter.on_success(headroom)
+
+
+def test_slow_start_then_halving_then_additive_increase():
+    limiter = AdaptiveLimiter(16)
+    succeed(limiter, 7)
+    assert limiter.limit == 8
+
+    limiter.on_throttle(0)
+    assert limiter.limit == 4
+    assert limiter.throttles == 1
+
+    # One step per full window of successes after a throttle
+    succeed(limiter, 4)
+    assert 4.9 < limiter.limit < 5
+
+
+def test_limit_stays_within_bounds():
+    limiter = AdaptiveLimiter(4)
+    succeed(limiter, 20)
+    assert limiter.limit == 4
+    for _ in range(5):
+        limiter.on_throttle(0)
+    assert limiter.limit == 1
+
+
+def test_no_growth_without_headroom_for_more_requests():
+    limiter = AdaptiveLimiter(8)
+    succeed(limiter, 1)
+    limiter.acquire()
+    limiter.acquire()
+    # The quota allows only the two requests already in flight
+    limiter.on_success(headroom=2)
+    assert limiter.limit == 2
+    limiter.release()
+    limiter.release()
+
+
+def test_throttle_and_spent_quota_pause_new_requests():
+    limiter = AdaptiveLimiter(4, adaptive=False)
+    limiter.on_throttle(0.2)
+    start = time.monotonic()
+    with limiter.slot():
+        pass
+    assert time.monotonic() - start >= 0.18
+    assert limiter.limit == 4
+
+    limiter.on_success(headroom=0, reset_in=0.2)
+    start = time.monotonic()
+    with limiter.slot():
+        pass
+    assert time.monotonic() - start >= 0.18
+
+
+def test_in_flight_never_exceeds_the_limit():
+    limiter = AdaptiveLimiter(3, adaptive=False)
+    peak = 0
+    lock = threading.Lock()
+
+    def call():
+        nonlocal peak
+        with limiter.slot():
+            with lock:
+                peak = max(peak, limiter.in_flight)
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=call) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 3
+
+
+def test_set_max_concurrency_keeps_what_was_learned():
+    limiter = AdaptiveLimiter(2)
+    succeed(limiter, 5)
+    assert limiter.limit == 2
+    limiter.set_max_concurrency(8)
+    assert limiter.limit == 2
+    succeed(limiter, 1)
+    assert limiter.limit == 3
+
+    fixed = AdaptiveLimiter(2, adaptive=False)
+    fixed.set_max_concurrency(8)
+    assert fixed.limit == 8
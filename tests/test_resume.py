@@ -0,0 +1,70 @@
+"""Resuming an interrupted run classifies only the products it had not finished"""
+
+import threading
+
+import pytest
+
+import fake_anthropic
+import fake_woocommerce
+
+
+@pytest.fixture
+def matcher(tmp_path, monkeypatch):
+    claude = fake_anthropic.make_server(0, 0)
+    woo = fake_woocommerce.make_server(0, 6)
+    for server in (claude, woo):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('ANTHROPIC_BASE_URL', f"http://127.0.0.1:{claude.server_address[1]}")
+    monkeypatch.setenv('METRICS_DIR', '')
+    import main
+    monkeypatch.setattr(main, 'PACED_REQUESTS_PER_MINUTE', 0)
+    monkeypatch.setattr(main, 'RATE_LIMIT_DELAY', 0)
+
+    config = main.WooConfig(f"http://127.0.0.1:{woo.server_address[1]}", 'ck_test', 'cs_test', 'sk-test')
+    matcher = main.WooCommerceHTSMatcher(config, str(tmp_path / 'test.db'))
+    yield matcher
+    matcher.close()
+    for server in (claude, woo):
+        server.shutdown()
+        server.server_close()
+
+
+def test_resume_skips_completed_products(matcher, monkeypatch):
+    products = matcher.fetch_all_products()
+    sent = []
+    match_product = matcher.claude_matcher.match_product
+
+    def interrupted_match(product_info):
+        if len(sent) == 3:
+            raise KeyboardInterrupt
+        sent.append(product_info['id'])
+        return match_product(product_info)
+
+    monkeypatch.setattr(matcher.claude_matcher, 'match_product', interrupted_match)
+    with pytest.raises(KeyboardInterrupt):
+        matcher.process_products(products, batch_size=10, concurrency=1, dedup=False, pack=False, knn=False)
+
+    [run] = matcher.get_unfinished_runs()
+    assert run['status'] == 'interrupted'
+    assert run['remaining'] == 3
+    first = list(sent)
+
+    sent.clear()
+    monkeypatch.setattr(matcher.claude_matcher, 'match_product',
+                        lambda product_info: sent.append(product_info['id']) or match_product(product_info))
+    results = matcher.resume_run(run['run_id'])
+
+    assert sorted(first + sent) == sorted(p['id'] for p in products)
+    assert sorted(r['product_id'] for r in results) == sorted(sent)
+    assert matcher.get_run_counts(run['run_id']) == {'done': 6}
+    assert matcher.get_unfinished_runs() == []
+
+
+def test_resuming_a_finished_run_sends_nothing(matcher, monkeypatch):
+    products = matcher.fetch_all_products()
+    matcher.process_products(products, batch_size=10, concurrency=1, dedup=False, pack=False, knn=False)
+    run_id = matcher.hts_db.execute("SELECT run_id FROM runs").fetchone()[0]
+
+    monkeypatch.setattr(matcher.claude_matcher, 'match_product', lambda product_info: pytest.fail('sent to Claude'))
+    assert matcher.resume_run(run_id) == []
+    assert matcher.hts_db.execute("SELECT status FROM runs").fetchone()[0] == 'completed'
@@ -0,0 +1,96 @@
+"""Databases from earlier releases upgrade in place to the current schema"""
+
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import schema
+from schema import MIGRATIONS, db_timestamp, migrate, schema_version
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def baseline_db() -> sqlite3.Connection:
+    """The two tables the original release created, without a user_version"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE product_matches (
+            product_id INTEGER PRIMARY KEY, sku TEXT, name TEXT, description TEXT, categories TEXT,
+            hts_code TEXT, hts_description TEXT, confidence REAL, reasoning TEXT, material TEXT,
+            alternative_codes TEXT, status TEXT, matched_at TIMESTAMP, updated_at TIMESTAMP, review_notes TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE processing_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, api_calls INTEGER,
+            processing_time REAL, timestamp TIMESTAMP
+        )
+    ''')
+    # Naive local datetimes, as the original release stored them
+    conn.execute("INSERT INTO product_matches (product_id, name, hts_code, status, matched_at, updated_at) "
+                 "VALUES (1, 'Mug', '6912.00.4810', 'approved', '2024-05-01 14:03:22.123456', "
+                 "'2024-05-01 14:03:22.123456')")
+    conn.execute("INSERT INTO processing_log (product_id, api_calls, processing_time, timestamp) "
+                 "VALUES (1, 1, 2.5, '2024-05-01 14:03:20.000001')")
+    conn.commit()
+    return conn
+
+
+def test_baseline_database_upgrades_to_latest():
+    conn = baseline_db()
+    assert schema_version(conn) == 0
+
+    assert migrate(conn) == LATEST
+    assert schema_version(conn) == LATEST
+
+    assert {'derived_from', 'feature_hash', 'prompt_version', 'source', 'attributes'} <= columns(conn, 'product_matches')
+    assert {'cache_read_tokens', 'input_tokens', 'latency', 'model'} <= columns(conn, 'processing_log')
+    assert 'requeued_product' in columns(conn, 'work_queue')
+    for table in ('batch_jobs', 'classification_cache', 'sync_state', 'runs', 'run_items'):
+        assert columns(conn, table)
+
+    row = conn.execute("SELECT name, hts_code, status, matched_at FROM product_matches").fetchone()
+    assert row == ('Mug', '6912.00.4810', 'approved', db_timestamp(datetime(2024, 5, 1, 14, 3, 22)))
+    assert conn.execute("SELECT timestamp FROM processing_log").fetchone()[0] == \
+        db_timestamp(datetime(2024, 5, 1, 14, 3, 20))
+
+
+def test_ad_hoc_columns_from_older_releases_are_kept():
+    conn = baseline_db()
+    conn.execute("ALTER TABLE product_matches ADD COLUMN derived_from INTEGER")
+    conn.execute("UPDATE product_matches SET derived_from = 7")
+    conn.commit()
+
+    assert migrate(conn) == LATEST
+    assert conn.execute("SELECT derived_from FROM product_matches").fetchone()[0] == 7
+
+
+def test_migrate_is_idempotent_and_only_runs_newer_steps():
+    conn = baseline_db()
+    migrate(conn)
+    matched_at = conn.execute("SELECT matched_at FROM product_matches").fetchone()[0]
+
+    assert migrate(conn) == LATEST
+    # The timestamp migration did not run a second time
+    assert conn.execute("SELECT matched_at FROM product_matches").fetchone()[0] == matched_at
+
+
+def test_failed_migration_rolls_back_and_keeps_the_version(monkeypatch):
+    conn = baseline_db()
+    migrate(conn)
+
+    def broken(conn):
+        conn.execute("ALTER TABLE product_matches ADD COLUMN reviewed_by TEXT")
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(schema, 'MIGRATIONS', MIGRATIONS + [(LATEST + 1, "Broken step", broken)])
+    with pytest.raises(sqlite3.OperationalError):
+        schema.migrate(conn)
+
+    assert schema_version(conn) == LATEST
+    assert 'reviewed_by' not in columns(conn, 'product_matches')
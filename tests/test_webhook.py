@@ -0,0 +1,78 @@
+"""Only deliveries signed with the webhook secret are queued"""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+import webhook
+from db_writer import connect
+from schema import migrate
+from webhook import WebhookService, sign, verify_signature
+from work_queue import WorkQueue
+
+SECRET = 'whsec-test'
+BODY = json.dumps({'id': 42, 'name': 'Travel Mug', 'status': 'publish'}).encode()
+
+
+def test_signature_matches_woocommerce():
+    # base64(HMAC-SHA256(secret, body)), as sent in X-WC-Webhook-Signature
+    assert sign(b'{"id": 1}', 'secret') == 'HmaC4Bw8oKa+/A6Wm3oTLEyqJmv+tDIzcqPNO7NS3Do='
+    assert verify_signature(BODY, sign(BODY, SECRET), SECRET)
+    assert verify_signature(BODY, sign(BODY, SECRET) + '\n', SECRET)
+
+
+@pytest.mark.parametrize('signature, body', [
+    (None, BODY),
+    ('', BODY),
+    (sign(BODY, 'other-secret'), BODY),
+    (sign(BODY, SECRET), BODY.replace(b'42', b'43')),
+    ('not base64 at all', BODY),
+])
+def test_bad_signatures_are_rejected(signature, body):
+    assert not verify_signature(body, signature, SECRET)
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    db_path = str(tmp_path / 'test.db')
+    conn = connect(db_path)
+    migrate(conn)
+    service = WebhookService(SimpleNamespace(hts_db_path=db_path, hts_db=conn), SECRET)
+    server = webhook.make_server(service, '127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/webhook", service
+    server.shutdown()
+    server.server_close()
+    conn.close()
+
+
+def deliver(url: str, body: bytes, signature: str = None) -> int:
+    headers = {'Content-Type': 'application/json', 'X-WC-Webhook-Topic': 'product.updated'}
+    if signature is not None:
+        headers['X-WC-Webhook-Signature'] = signature
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers), timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_receiver_queues_only_signed_deliveries(receiver):
+    url, service = receiver
+
+    assert deliver(url, BODY) == 401
+    assert deliver(url, BODY.replace(b'Travel', b'Coffee'), sign(BODY, SECRET)) == 401
+    assert WorkQueue(service.queue.conn).counts() == {}
+
+    assert deliver(url, BODY, sign(BODY, SECRET)) == 202
+    assert WorkQueue(service.queue.conn).counts() == {'pending': 1}
+
+
+def test_unsigned_ping_is_answered(receiver):
+    url, service = receiver
+    assert deliver(url, b'webhook_id=7') == 200
+    assert WorkQueue(service.queue.conn).counts() == {}
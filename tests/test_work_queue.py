@@ -0,0 +1,76 @@
+"""Updates that arrive while a product is claimed are kept in the database"""
+
+import sqlite3
+
+from schema import migrate
+from work_queue import WorkQueue
+
+
+def make_queue() -> WorkQueue:
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    return WorkQueue(conn)
+
+
+def test_update_during_lease_is_requeued_on_complete():
+    queue = make_queue()
+    queue.enqueue([{'id': 1, 'name': 'Mug'}])
+    assert queue.claim('worker-1', 10) == [{'id': 1, 'name': 'Mug'}]
+
+    assert queue.enqueue([{'id': 1, 'name': 'Steel mug'}]) == 1
+    queue.complete('worker-1', [1])
+
+    assert queue.counts() == {'pending': 1}
+    assert queue.claim('worker-2', 10) == [{'id': 1, 'name': 'Steel mug'}]
+
+
+def test_same_data_during_lease_is_not_requeued():
+    queue = make_queue()
+    queue.enqueue([{'id': 1, 'name': 'Mug'}])
+    queue.claim('worker-1', 10)
+
+    assert queue.enqueue([{'id': 1, 'name': 'Mug'}]) == 0
+    queue.complete('worker-1', [1])
+    assert queue.counts() == {'done': 1}
+
+
+def test_release_hands_out_the_newer_data():
+    queue = make_queue()
+    queue.enqueue([{'id': 1, 'name': 'Mug'}])
+    queue.claim('worker-1', 10)
+    queue.enqueue([{'id': 1, 'name': 'Steel mug'}])
+
+    queue.release('worker-1', [1], error='API error')
+    assert queue.claim('worker-1', 10) == [{'id': 1, 'name': 'Steel mug'}]
+
+
+def test_heartbeat_keeps_a_slow_batch_leased(tmp_path):
+    import time
+
+    from db_writer import connect
+    from work_queue import lease_heartbeat
+
+    db_path = str(tmp_path / 'queue.db')
+    conn = connect(db_path)
+    migrate(conn)
+    queue = WorkQueue(conn, lease_seconds=1)
+    queue.enqueue([{'id': 1, 'name': 'Mug'}])
+    queue.claim('worker-1', 10)
+
+    with lease_heartbeat(db_path, 'worker-1', [1], lease_seconds=1):
+        time.sleep(1.5)  # Longer than the lease
+        assert queue.claim('worker-2', 10) == []
+
+    assert queue.complete('worker-1', [1]) == 1
+
+
+def test_expired_lease_cannot_be_completed_by_its_old_owner():
+    queue = make_queue()
+    queue.lease_seconds = -1  # Leases expire immediately
+    queue.enqueue([{'id': 1, 'name': 'Mug'}])
+    queue.claim('worker-1', 10)
+    assert queue.claim('worker-2', 10) == [{'id': 1, 'name': 'Mug'}]
+
+    assert queue.complete('worker-1', [1]) == 0
+    assert queue.renew('worker-1', [1]) == 0
+    assert queue.complete('worker-2', [1]) == 1
@@ -4,11 +4,9 @@ Upload HTS codes from existing database to a second WooCommerce site
 Perfect for sites with identical product catalogs
 """
 
-import requests
 import sqlite3
-import time
-from requests.auth import HTTPBasicAuth
 import logging
+from woo_client import WooClient
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,8 +23,9 @@ DATABASE_PATH = 'hts_codes.db'
 class SecondSiteUploader:
     def __init__(self, site_url, consumer_key, consumer_secret, db_path):
         self.site_url = site_url
-        self.api_url = f"{site_url}/wp-json/wc/v3"
-        self.auth = HTTPBasicAuth(consumer_key, consumer_secret)
+        self.woo = WooClient(site_url, consumer_key, consumer_secret, timeout=10)
+        self.api_url = self.woo.api_url
+        self.auth = self.woo.auth
         self.db = sqlite3.connect(db_path)
         
     def get_approved_matches(self):
@@ -42,8 +41,8 @@ class SecondSiteUploader:
         """)
         return cursor.fetchall()
     
-    def update_product(self, product_id, hts_code, confidence=None):
-        """Update a single product with HTS code"""
+    def product_meta_data(self, hts_code, confidence=None):
+        """Build the meta_data entries written to each product"""
         meta_data = [
             {'key': '_hts_code', 'value': hts_code},
             {'key': '_country_of_origin', 'value': 'CA'}  # Default to Canada
@@ -51,19 +50,18 @@ class SecondSiteUploader:
         
         if confidence:
             meta_data.append({
-                'key': '_hts_confidence', 
+                'key': '_hts_confidence',
                 'value': f"{confidence:.1%}" if isinstance(confidence, float) else str(confidence)
             })
         
-        data = {'meta_data': meta_data}
+        return meta_data
+    
+    def update_product(self, product_id, hts_code, confidence=None):
+        """Update a single product with HTS code"""
+        data = {'meta_data': self.product_meta_data(hts_code, confidence)}
         
         try:
-            response = requests.put(
-                f"{self.api_url}/products/{product_id}",
-                auth=self.auth,
-                json=data,
-                timeout=10
-            )
+            response = self.woo.put(f"/products/{product_id}", json=data)
             
             if response.status_code == 200:
                 logger.info(f"✓ Updated product {product_id} with HTS {hts_code}")
@@ -107,27 +105,28 @@ class SecondSiteUploader:
         success_count = 0
         error_count = 0
         
+        # Send up to 100 updates per POST /products/batch; failed items are retried
+        updates = [
+            {'id': product_id, 'meta_data': self.product_meta_data(hts_code, confidence)}
+            for product_id, hts_code, confidence in matches
+        ]
+        succeeded, failed = self.woo.batch_update_products(updates)
+        
         for i, (product_id, hts_code, confidence) in enumerate(matches, 1):
-            print(f"[{i}/{len(matches)}] Updating product {product_id}...", end=' ')
-            
-            if self.update_product(product_id, hts_code, confidence):
+            if product_id in succeeded:
                 success_count += 1
-                print("✓")
+                print(f"[{i}/{len(matches)}] Product {product_id} → {hts_code} ✓")
             else:
                 error_count += 1
-                print("✗")
-            
-            # Rate limiting
-            time.sleep(0.5)
-            
-            # Progress update every 10 products
-            if i % 10 == 0:
-                print(f"Progress: {i}/{len(matches)} ({success_count} successful, {error_count} errors)")
+                print(f"[{i}/{len(matches)}] Product {product_id} ✗ {failed.get(product_id, 'unknown error')}")
         
         print(f"\n=== COMPLETE ===")
         print(f"Successfully updated: {success_count} products")
         print(f"Errors: {error_count} products")
         
+        logger.info("WooCommerce API usage:")
+        self.woo.log_stats()
+        
         return success_count
 
 def main():
@@ -155,11 +154,7 @@ def main():
     # Test connection
     print("\nTesting connection to second site...")
     try:
-        response = requests.get(
-            f"{uploader.api_url}/products",
-            auth=uploader.auth,
-            params={'per_page': 1}
-        )
+        response = uploader.woo.get("/products", params={'per_page': 1})
         if response.status_code == 200:
             print("✓ Connection successful!")
         else:
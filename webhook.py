@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+WooCommerce webhook receiver for near-real-time classification
+Accepts product.created / product.updated deliveries, verifies their HMAC
+signature and queues the product in the work_queue table; a worker loop
+classifies queued products in small batches and can push approved codes
+straight back to WooCommerce
+
+In WooCommerce → Settings → Advanced → Webhooks, add one webhook per topic
+(Product created, Product updated) with the delivery URL
+http://<this host>:8780/webhook and the same secret as WEBHOOK_SECRET.
+
+Usage:
+    python webhook.py                            # serve on WEBHOOK_HOST:WEBHOOK_PORT
+    python webhook.py --push --record payloads/  # push approved codes, keep verified payloads
+    python webhook.py --replay payloads/product.created_123_20250301_142233.json
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from db_writer import connect as connect_db
+from metrics import instrument_run
+from work_queue import WorkQueue, lease_heartbeat
+from worker import exit_on_sigterm
+
+logger = logging.getLogger(__name__)
+
+# Webhook settings
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')                       # Secret entered for the webhooks in WooCommerce
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')                  # Interface to listen on (0.0.0.0 = all)
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8780))
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 10))          # Products classified together
+WEBHOOK_BATCH_WAIT = float(os.getenv('WEBHOOK_BATCH_WAIT', 2.0))       # Seconds to gather a burst before classifying
+WEBHOOK_PUSH = os.getenv('WEBHOOK_PUSH', 'false').lower() in ('1', 'true', 'yes')  # Push approved codes right away
+
+TOPICS = ('product.created', 'product.updated')
+MAX_BODY_BYTES = 5 * 1024 * 1024  # Larger deliveries are refused
+POLL_SECONDS = 10  # Re-check the queue this often without deliveries (expired leases, other producers)
+
+
+def sign(body: bytes, secret: str) -> str:
+    """WooCommerce's X-WC-Webhook-Signature: base64 HMAC-SHA256 of the raw body"""
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: str) -> bool:
+    return bool(signature) and hmac.compare_digest(sign(body, secret), signature.strip())
+
+
+def make_matcher():
+    from main import (WooCommerceHTSMatcher, WooConfig, SITE_URL, WOO_CONSUMER_KEY, WOO_CONSUMER_SECRET,
+                      ANTHROPIC_API_KEY, DATABASE_PATH)
+    config = WooConfig(SITE_URL, WOO_CONSUMER_KEY, WOO_CONSUMER_SECRET, ANTHROPIC_API_KEY)
+    return WooCommerceHTSMatcher(config, hts_db_path=DATABASE_PATH)
+
+
+class WebhookService:
+    """Queues verified product deliveries and classifies them in micro-batches
+
+    Deliveries are written to the work_queue table before they are
+    acknowledged, so nothing is lost if the service stops, and worker.py
+    processes can help drain the same queue. Updates that leave a product's
+    classification inputs unchanged (including the meta_data update from our
+    own push) are marked done without a Claude call.
+    """
+
+    def __init__(self, matcher, secret: str, push: bool = None, batch_size: int = None, batch_wait: float = None,
+                 record_dir: str = None):
+        from main import lean_product, product_fields
+
+        self.matcher = matcher
+        self.db_path = matcher.hts_db_path
+        self.secret = secret
+        self.push = WEBHOOK_PUSH if push is None else push
+        self.batch_size = batch_size or WEBHOOK_BATCH_SIZE
+        self.batch_wait = WEBHOOK_BATCH_WAIT if batch_wait is None else batch_wait
+        self.record_dir = record_dir
+        self.worker_id = f"webhook-{socket.gethostname()}-{os.getpid()}"
+        self.queue = WorkQueue(matcher.hts_db)
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+
+        self._fields = product_fields('classify', 'filter')
+        self._lean_product = lean_product
+
+    def receive(self, topic: str, body: bytes) -> tuple:
+        """Handle one verified delivery (on a server thread)
+
+        Returns:
+            (HTTP status, response payload)
+        """
+        if topic not in TOPICS:
+            return 200, {'ignored': f"topic {topic or 'missing'}"}
+        try:
+            product = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'body is not JSON'}
+        if not isinstance(product, dict) or not isinstance(product.get('id'), int):
+            return 400, {'error': 'no product id'}
+
+        if self.record_dir:
+            self.record(topic, product['id'], body)
+
+        # Only published products are classified (like catalog scans)
+        if product.get('status', 'publish') != 'publish':
+            return 200, {'ignored': f"status {product.get('status')}"}
+
+        # Server threads can't share the worker's connection
+        lean = self._lean_product(product, self._fields)
+        conn = connect_db(self.db_path)
+        try:
+            queued = WorkQueue(conn).enqueue([lean])
+        finally:
+            conn.close()
+        # A product being classified right now is queued again when its batch is settled
+        self.wake.set()
+        logger.info(f"{topic}: product {product['id']} {'queued' if queued else 'already being classified with this data'}")
+        return 202, {'queued': product['id']}
+
+    def record(self, topic: str, product_id: int, body: bytes):
+        """Keep a verified payload so it can be replayed with --replay"""
+        os.makedirs(self.record_dir, exist_ok=True)
+        path = os.path.join(self.record_dir, f"{topic}_{product_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'wb') as f:
+            f.write(body)
+
+    @instrument_run('webhook')
+    def run(self):
+        """Classify queued products until stop is set (runs on the thread that owns the matcher)"""
+        while not self.stop.is_set():
+            products = self.queue.claim(self.worker_id, self.batch_size)
+            if products:
+                self.classify_batch(products)
+                continue
+
+            if not self.wake.wait(POLL_SECONDS):
+                # Idle: write out anything still buffered
+                self.matcher.flush_writes()
+                continue
+            self.wake.clear()
+            # A burst of deliveries (bulk edits, imports) is classified together
+            self.stop.wait(self.batch_wait)
+
+    def classify_batch(self, products: List[Dict]):
+        """Classify a claimed batch, settle it in the queue and optionally push approved codes"""
+        ids = [p['id'] for p in products]
+        start_time = time.monotonic()
+        try:
+            changed = self.matcher.filter_changed_products(products)
+            changed_ids = {p['id'] for p in changed}
+            unchanged = [i for i in ids if i not in changed_ids]
+            if unchanged:
+                self.queue.complete(self.worker_id, unchanged)
+                logger.info(f"Skipped {len(unchanged)} products with unchanged classification inputs")
+            if changed:
+                # Keep the lease while Claude backoff or retries slow the batch down
+                with lease_heartbeat(self.db_path, self.worker_id, [p['id'] for p in changed]):
+                    results = self.matcher.process_products(changed, record_run=False)
+            else:
+                results = []
+            self.matcher.flush_writes()
+        except Exception as e:
+            logger.exception(f"Batch of {len(products)} webhook products failed")
+            self.matcher.flush_writes()
+            self.queue.release(self.worker_id, ids, error=str(e)[:500])
+            return
+
+        failed = {r['product_id'] for r in results if r['hts_code'] == '9999.99.9999'}
+        self.queue.complete(self.worker_id, [r['product_id'] for r in results if r['product_id'] not in failed])
+        if failed:
+            self.queue.release(self.worker_id, failed, error='Claude API error (fallback result)')
+        if results:
+            logger.info(f"Classified {len(results)} products in {time.monotonic() - start_time:.1f}s "
+                        f"({len(failed)} failed)")
+
+        approved = [r for r in results if r['status'] == 'approved']
+        if self.push and approved:
+            # Codes that fail to push stay approved locally for `cli.py push`
+            self.matcher.push_hts_codes([(r['product_id'], r['hts_code'], r['confidence']) for r in approved])
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    service: WebhookService = None
+
+    def log_message(self, format, *args):
+        pass  # Deliveries are logged by the service
+
+    def send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Health check
+        conn = connect_db(self.service.db_path)
+        try:
+            counts = WorkQueue(conn).counts()
+        finally:
+            conn.close()
+        self.send_json(200, {'status': 'ok', 'queue': counts})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {'error': 'payload too large'})
+            return
+        body = self.rfile.read(length)
+        signature = self.headers.get('X-WC-Webhook-Signature')
+
+        # WooCommerce pings a new webhook with an unsigned 'webhook_id=<id>' form post
+        if not signature and body.startswith(b'webhook_id='):
+            self.send_json(200, {'pong': body.decode(errors='replace')})
+            return
+        if not verify_signature(body, signature, self.service.secret):
+            logger.warning(f"Rejected delivery with a missing or invalid signature from {self.client_address[0]}")
+            self.send_json(401, {'error': 'invalid signature'})
+            return
+
+        try:
+            status, payload = self.service.receive(self.headers.get('X-WC-Webhook-Topic', ''), body)
+        except Exception as e:
+            logger.exception("Could not queue webhook delivery")
+            status, payload = 500, {'error': str(e)[:200]}  # WooCommerce retries failed deliveries
+        self.send_json(status, payload)
+
+
+def make_server(service: WebhookService, host: str = None, port: int = None) -> ThreadingHTTPServer:
+    """Create (but don't start) the HTTP server for a service"""
+    handler = type('Handler', (WebhookHandler,), {'service': service})
+    return ThreadingHTTPServer((host or WEBHOOK_HOST, WEBHOOK_PORT if port is None else port), handler)
+
+
+def replay(paths: List[str], url: str, secret: str, topic: str = None) -> int:
+    """Post recorded payloads to a running receiver, signed like WooCommerce would; returns failures"""
+    failures = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            body = f.read()
+        # Recorded files are named <topic>_<product id>_<timestamp>.json
+        name = os.path.basename(path)
+        delivery_topic = topic or (name.split('_')[0] if name.split('_')[0] in TOPICS else 'product.updated')
+        request = urllib.request.Request(url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-WC-Webhook-Topic': delivery_topic,
+            'X-WC-Webhook-Signature': sign(body, secret),
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                print(f"{path}: {response.status} {response.read().decode()}")
+        except urllib.error.HTTPError as e:
+            failures += 1
+            print(f"{path}: {e.code} {e.read().decode()}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify products from WooCommerce webhooks')
+    parser.add_argument('--host', default=WEBHOOK_HOST, help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT, help='Port to listen on')
+    parser.add_argument('--push', action='store_true', default=WEBHOOK_PUSH, help='Push approved codes right away')
+    parser.add_argument('--record', metavar='DIR', help='Save verified payloads here for --replay')
+    parser.add_argument('--replay', nargs='+', metavar='FILE', help='Post recorded payloads to a running receiver')
+    parser.add_argument('--topic', choices=TOPICS, help='Topic for replayed payloads (default: from the file name)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not WEBHOOK_SECRET:
+        parser.error("set WEBHOOK_SECRET to the secret configured for the webhooks in WooCommerce")
+
+    if args.replay:
+        url = f"http://{'127.0.0.1' if args.host == '0.0.0.0' else args.host}:{args.port}/webhook"
+        raise SystemExit(1 if replay(args.replay, url, WEBHOOK_SECRET, args.topic) else 0)
+
+    exit_on_sigterm()
+    service = WebhookService(make_matcher(), WEBHOOK_SECRET, push=args.push, record_dir=args.record)
+    server = make_server(service, args.host, args.port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Listening for WooCommerce webhooks on http://{args.host}:{args.port}/webhook "
+          f"(push {'on' if service.push else 'off'})")
+
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.shutdown()
+        service.matcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Shared WooCommerce REST client
+One pooled keep-alive session per site with timeouts, retries on 429/5xx
+(honoring Retry-After), per-host concurrency limits and per-endpoint stats
+"""
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from metrics import metrics
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Client settings (environment variables, with defaults)
+WOO_TIMEOUT = float(os.getenv('WOO_TIMEOUT', 30))                # Seconds per request
+WOO_MAX_RETRIES = int(os.getenv('WOO_MAX_RETRIES', 4))           # Retries on 429/5xx/connection errors
+WOO_BACKOFF = float(os.getenv('WOO_BACKOFF', 1.0))               # Base delay for exponential backoff
+WOO_MAX_CONNECTIONS = int(os.getenv('WOO_MAX_CONNECTIONS', 4))   # Concurrent requests per host
+WOO_REQUESTS_PER_SECOND = float(os.getenv('WOO_REQUESTS_PER_SECOND', 5))  # Per-host rate limit (0 = unlimited)
+WOO_FETCH_WORKERS = int(os.getenv('WOO_FETCH_WORKERS', 4))       # Pages fetched in parallel by iter_pages
+WOO_BATCH_SIZE = int(os.getenv('WOO_BATCH_SIZE', 100))           # Updates per POST /products/batch (WooCommerce max 100)
+WOO_BATCH_ATTEMPTS = int(os.getenv('WOO_BATCH_ATTEMPTS', 3))     # Passes over failed batch items
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def hts_meta_data(hts_code: str, confidence: float = None) -> List[Dict]:
+    """Build the product meta_data entries that carry an HTS code"""
+    meta_data = [
+        {'key': '_hts_code', 'value': hts_code}
+    ]
+
+    if confidence is not None:
+        meta_data.append({
+            'key': '_hts_confidence',
+            'value': f"{confidence:.1%}"
+        })
+
+    # Add timestamp
+    meta_data.append({
+        'key': '_hts_updated',
+        'value': datetime.now().isoformat()
+    })
+
+    return meta_data
+
+
+class WooClient:
+    """Pooled, retrying HTTP client for the WooCommerce v3 REST API"""
+
+    # Per-host semaphores and rate limiters are shared by every client talking to the same store
+    _host_limits = {}
+    _host_rate_limiters = {}
+    _host_limits_lock = threading.Lock()
+
+    def __init__(self, url: str, consumer_key: str, consumer_secret: str,
+                 timeout: float = None, max_retries: int = None, max_connections: int = None):
+        self.site_url = url.rstrip('/')
+        self.api_url = f"{self.site_url}/wp-json/wc/v3"
+        self.timeout = WOO_TIMEOUT if timeout is None else timeout
+        self.max_retries = WOO_MAX_RETRIES if max_retries is None else max_retries
+        max_connections = max_connections or WOO_MAX_CONNECTIONS
+
+        # WooCommerce REST API keys start with 'ck_'; anything else is a
+        # WordPress Application Password, which may be pasted with spaces
+        if consumer_key.startswith('ck_'):
+            self.auth = HTTPBasicAuth(consumer_key, consumer_secret)
+        else:
+            self.auth = HTTPBasicAuth(consumer_key, consumer_secret.replace(' ', ''))
+
+        # Check if local development
+        self.is_local = '.local' in url or 'localhost' in url
+        self.verify_ssl = not self.is_local
+
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.verify = self.verify_ssl
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        host = urlparse(self.site_url).netloc
+        with WooClient._host_limits_lock:
+            if host not in WooClient._host_limits:
+                WooClient._host_limits[host] = threading.BoundedSemaphore(max_connections)
+                WooClient._host_rate_limiters[host] = TokenBucket(WOO_REQUESTS_PER_SECOND, capacity=max_connections)
+            self._host_limit = WooClient._host_limits[host]
+            self._rate_limiter = WooClient._host_rate_limiters[host]
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, **kwargs) -> 'WooClient':
+        """Build a client from a WooConfig"""
+        return cls(config.url, config.consumer_key, config.consumer_secret, **kwargs)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request('PUT', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to an API path (e.g. '/products'), retrying transient failures
+
+        Returns the final response, whatever its status code, so callers can
+        keep checking status_code. Connection errors are re-raised once
+        retries are exhausted.
+        """
+        url = f"{self.api_url}/{path.lstrip('/')}"
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = f"{method} /" + re.sub(r'/\d+', '/{id}', path.strip('/'))
+
+        attempt = 0
+        while True:
+            self._rate_limiter.acquire()
+            start_time = time.time()
+            try:
+                with self._host_limit:
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(endpoint, time.time() - start_time, error=True)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{endpoint} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            else:
+                failed = response.status_code >= 400
+                self._record(endpoint, time.time() - start_time, error=failed)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                logger.warning(f"{endpoint} returned {response.status_code}, retrying in {delay:.1f}s")
+
+            time.sleep(delay)
+            attempt += 1
+
+    def iter_pages(self, path: str, params: Dict = None, max_pages: int = None,
+                   workers: int = None) -> Iterator[Tuple[int, requests.Response]]:
+        """Yield (page, response) for every page of a paginated listing, in page order
+
+        Page 1 is fetched first to read X-WP-TotalPages; the remaining pages
+        are fetched concurrently in windows of `workers` pages. A consumer that
+        stops early (limits, skip heuristics) wastes at most one window.
+        Iteration stops after the first non-200 response.
+        """
+        params = dict(params or {})
+        workers = workers or WOO_FETCH_WORKERS
+
+        def fetch(page: int) -> requests.Response:
+            with metrics.span('fetch_page'):
+                return self.get(path, params={**params, 'page': page})
+
+        response = fetch(1)
+        yield 1, response
+        if response.status_code != 200:
+            return
+
+        total_pages = int(response.headers.get('X-WP-TotalPages', 1))
+        if max_pages:
+            total_pages = min(total_pages, max_pages)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for start in range(2, total_pages + 1, workers):
+                window = range(start, min(start + workers, total_pages + 1))
+                for page, response in zip(window, executor.map(fetch, window)):
+                    yield page, response
+                    if response.status_code != 200:
+                        return
+
+    def batch_update_products(self, updates: List[Dict], batch_size: int = None,
+                              attempts: int = None) -> Tuple[Set[int], Dict[int, str]]:
+        """Apply product updates through POST /products/batch
+
+        Args:
+            updates: Update payloads, each with an 'id' plus the fields to change
+            batch_size: Updates per request (WooCommerce accepts up to 100)
+            attempts: Passes to make; later passes resend only failed items
+
+        Returns:
+            (IDs updated successfully, {ID: error message} for items that still failed)
+        """
+        batch_size = batch_size or WOO_BATCH_SIZE
+        attempts = attempts or WOO_BATCH_ATTEMPTS
+
+        succeeded = set()
+        failed = {}
+        pending = list(updates)
+
+        for attempt in range(1, attempts + 1):
+            failed = {}
+            for start in range(0, len(pending), batch_size):
+                chunk = pending[start:start + batch_size]
+                ok, errors = self._send_batch(chunk)
+                succeeded.update(ok)
+                failed.update(errors)
+
+            if not failed:
+                break
+
+            logger.warning(f"Batch update pass {attempt}/{attempts}: {len(failed)} items failed")
+            pending = [u for u in pending if u['id'] in failed]
+            if attempt < attempts:
+                time.sleep(self._backoff(attempt - 1))
+
+        return succeeded, failed
+
+    def _send_batch(self, chunk: List[Dict]) -> Tuple[Set[int], Dict[int, str]]:
+        """Send one batch request and split the response into per-item results"""
+        try:
+            response = self.post("/products/batch", json={'update': chunk})
+        except requests.exceptions.RequestException as e:
+            return set(), {u['id']: str(e) for u in chunk}
+
+        if response.status_code != 200:
+            message = f"HTTP {response.status_code}: {response.text[:200]}"
+            return set(), {u['id']: message for u in chunk}
+
+        succeeded = set()
+        failed = {}
+        results = response.json().get('update', [])
+
+        for update, result in zip(chunk, results):
+            if 'error' in result:
+                failed[update['id']] = result['error'].get('message', 'unknown error')
+            else:
+                succeeded.add(update['id'])
+
+        # Items missing from the response are treated as failed
+        for update in chunk[len(results):]:
+            failed[update['id']] = 'missing from batch response'
+
+        return succeeded, failed
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter"""
+        return WOO_BACKOFF * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _record(self, endpoint: str, latency: float, error: bool):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {'requests': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0})
+            stats['requests'] += 1
+            stats['errors'] += int(error)
+            stats['total_time'] += latency
+            stats['max_time'] = max(stats['max_time'], latency)
+
+    def endpoint_stats(self) -> Dict[str, Dict]:
+        """Per-endpoint request counts, error rates and latencies"""
+        with self._stats_lock:
+            return {
+                endpoint: {
+                    'requests': s['requests'],
+                    'errors': s['errors'],
+                    'error_rate': s['errors'] / s['requests'],
+                    'avg_latency': s['total_time'] / s['requests'],
+                    'max_latency': s['max_time']
+                }
+                for endpoint, s in self._stats.items()
+            }
+
+    def log_stats(self):
+        """Log a one-line summary per endpoint"""
+        for endpoint, s in sorted(self.endpoint_stats().items()):
+            logger.info(f"  {endpoint}: {s['requests']} requests, {s['error_rate']:.1%} errors, "
+                        f"avg {s['avg_latency'] * 1000:.0f}ms, max {s['max_latency'] * 1000:.0f}ms")
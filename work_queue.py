@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Durable work queue in the local SQLite database
+Lets several worker processes (and overlapping cron jobs) classify one
+catalog without doing any product twice
+
+Products are enqueued once (the product ID is the key) and claimed in
+batches under a time-limited lease. While a batch is being classified,
+lease_heartbeat() renews the lease, so slow batches (Claude backoff, retries)
+keep their products. A worker that dies stops renewing: once its lease
+expires the products become claimable again. complete() and release() only
+touch products the worker still holds.
+Products that keep failing are parked as 'failed' after QUEUE_MAX_ATTEMPTS.
+
+Usage:
+    queue = WorkQueue(conn)
+    queue.enqueue(products)
+    batch = queue.claim('worker-1', limit=10)
+    with lease_heartbeat(db_path, 'worker-1', [p['id'] for p in batch]):
+        ...
+    queue.complete('worker-1', done_ids)
+    queue.release('worker-1', failed_ids, error='API error')
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List
+
+from db_writer import connect
+from schema import db_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Queue settings
+QUEUE_LEASE_SECONDS = int(os.getenv('QUEUE_LEASE_SECONDS', 600))  # Time a worker has to finish a claimed batch
+QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', 3))      # Claims before a product is parked as failed
+
+
+class WorkQueue:
+    """Lease-based product queue backed by the work_queue table (schema versions 10-11)"""
+
+    def __init__(self, conn: sqlite3.Connection, lease_seconds: int = None, max_attempts: int = None):
+        self.conn = conn
+        self.lease_seconds = lease_seconds or QUEUE_LEASE_SECONDS
+        self.max_attempts = max_attempts or QUEUE_MAX_ATTEMPTS
+
+    def enqueue(self, products: Iterable[Dict]) -> int:
+        """Add products, or new data for products already in the queue
+
+        Products that finished earlier (done or failed) are queued again with
+        the new product data; pending ones just get the new data and keep
+        their place. New data for a product a worker has claimed is kept with
+        the claim and queued once that worker settles it. Returns the number
+        of products queued, refreshed or held for requeueing.
+        """
+        now = db_timestamp()
+        rows = [(product['id'], json.dumps(product)) for product in products]
+        with self.conn:
+            held = self.conn.executemany('''
+                UPDATE work_queue
+                SET requeued_product = CASE WHEN product = ? THEN NULL ELSE ? END, updated_at = ?
+                WHERE product_id = ? AND state = 'claimed' AND (product != ? OR requeued_product IS NOT NULL)
+            ''', ((product, product, now, product_id, product) for product_id, product in rows)).rowcount
+            cursor = self.conn.executemany('''
+                INSERT INTO work_queue (product_id, product, state, attempts, enqueued_at, updated_at)
+                VALUES (?, ?, 'pending', 0, ?, ?)
+                ON CONFLICT (product_id) DO UPDATE SET
+                    product = excluded.product, state = 'pending', claimed_by = NULL, lease_expires = NULL,
+                    requeued_product = NULL,
+                    attempts = CASE WHEN work_queue.state = 'pending' THEN work_queue.attempts ELSE 0 END,
+                    last_error = CASE WHEN work_queue.state = 'pending' THEN work_queue.last_error END,
+                    enqueued_at = CASE WHEN work_queue.state = 'pending' THEN work_queue.enqueued_at
+                                       ELSE excluded.enqueued_at END,
+                    updated_at = excluded.updated_at
+                WHERE work_queue.state IN ('pending', 'done', 'failed')
+            ''', ((product_id, product, now, now) for product_id, product in rows))
+        return held + cursor.rowcount
+
+    def claim(self, worker_id: str, limit: int) -> List[Dict]:
+        """Lease up to `limit` pending (or expired) products to a worker, oldest first
+
+        Runs as one IMMEDIATE transaction, so two workers can never claim the
+        same product. Expired leases that already used up their attempts are
+        parked as failed instead of being handed out again, unless new product
+        data arrived during the lease. Reclaimed leases get that newer data.
+        """
+        now = datetime.now(timezone.utc)
+        expires = db_timestamp(now + timedelta(seconds=self.lease_seconds))
+        now = db_timestamp(now)
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            parked = self.conn.execute('''
+                UPDATE work_queue
+                SET state = 'failed', last_error = 'lease expired too many times', updated_at = ?
+                WHERE state = 'claimed' AND lease_expires < ? AND attempts >= ? AND requeued_product IS NULL
+            ''', (now, now, self.max_attempts)).rowcount
+            rows = self.conn.execute('''
+                UPDATE work_queue
+                SET state = 'claimed', claimed_by = ?, lease_expires = ?, updated_at = ?,
+                    attempts = CASE WHEN requeued_product IS NULL THEN attempts + 1 ELSE 1 END,
+                    product = COALESCE(requeued_product, product), requeued_product = NULL
+                WHERE product_id IN (
+                    SELECT product_id FROM work_queue
+                    WHERE state = 'pending' OR (state = 'claimed' AND lease_expires < ?)
+                    ORDER BY enqueued_at, product_id
+                    LIMIT ?
+                )
+                RETURNING product_id, product, enqueued_at
+            ''', (worker_id, expires, now, now, limit)).fetchall()
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+        if parked:
+            logger.warning(f"Work queue: {parked} products parked as failed after {self.max_attempts} expired leases")
+        rows.sort(key=lambda row: (row[2], row[0]))
+        return [json.loads(product) for _, product, _ in rows]
+
+    def renew(self, worker_id: str, product_ids: Iterable[int]) -> int:
+        """Extend this worker's lease on products it still holds; returns how many it holds"""
+        now = datetime.now(timezone.utc)
+        expires = db_timestamp(now + timedelta(seconds=self.lease_seconds))
+        with self.conn:
+            cursor = self.conn.executemany('''
+                UPDATE work_queue
+                SET lease_expires = ?, updated_at = ?
+                WHERE product_id = ? AND state = 'claimed' AND claimed_by = ?
+            ''', ((expires, db_timestamp(now), product_id, worker_id) for product_id in product_ids))
+        return cursor.rowcount
+
+    def complete(self, worker_id: str, product_ids: Iterable[int]) -> int:
+        """Mark products done (only while this worker still holds their lease)
+
+        Products that received new data during the lease go back to pending
+        with that data instead.
+        """
+        now = db_timestamp()
+        with self.conn:
+            cursor = self.conn.executemany('''
+                UPDATE work_queue
+                SET state = CASE WHEN requeued_product IS NULL THEN 'done' ELSE 'pending' END,
+                    product = COALESCE(requeued_product, product), requeued_product = NULL,
+                    attempts = CASE WHEN requeued_product IS NULL THEN attempts ELSE 0 END,
+                    enqueued_at = CASE WHEN requeued_product IS NULL THEN enqueued_at ELSE ? END,
+                    claimed_by = NULL, lease_expires = NULL, last_error = NULL, updated_at = ?
+                WHERE product_id = ? AND state = 'claimed' AND claimed_by = ?
+            ''', ((now, now, product_id, worker_id) for product_id in product_ids))
+        return cursor.rowcount
+
+    def release(self, worker_id: str, product_ids: Iterable[int], error: str = None) -> int:
+        """Give products back for another attempt, or park them once attempts run out
+
+        New data that arrived during the lease replaces the product and starts
+        its attempts over.
+        """
+        now = db_timestamp()
+        with self.conn:
+            cursor = self.conn.executemany('''
+                UPDATE work_queue
+                SET state = CASE WHEN requeued_product IS NULL AND attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    product = COALESCE(requeued_product, product), requeued_product = NULL,
+                    attempts = CASE WHEN requeued_product IS NULL THEN attempts ELSE 0 END,
+                    claimed_by = NULL, lease_expires = NULL, last_error = ?, updated_at = ?
+                WHERE product_id = ? AND state = 'claimed' AND claimed_by = ?
+            ''', ((self.max_attempts, error, now, product_id, worker_id) for product_id in product_ids))
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Products per state; leases past their expiry are counted as 'expired'"""
+        cursor = self.conn.execute('''
+            SELECT CASE WHEN state = 'claimed' AND lease_expires < ? THEN 'expired' ELSE state END, COUNT(*)
+            FROM work_queue
+            GROUP BY 1
+        ''', (db_timestamp(),))
+        return dict(cursor.fetchall())
+
+    def has_work(self) -> bool:
+        """True while products are pending or leased (a lease may still expire and need reclaiming)"""
+        row = self.conn.execute(
+            "SELECT 1 FROM work_queue WHERE state IN ('pending', 'claimed') LIMIT 1"
+        ).fetchone()
+        return row is not None
+
+
+@contextmanager
+def lease_heartbeat(db_path: str, worker_id: str, product_ids: List[int], lease_seconds: int = None):
+    """Renew a claimed batch's lease every third of the lease while the block runs
+
+    Runs on its own thread and connection, so it keeps going while the
+    worker's thread waits on Claude. Products the worker no longer holds
+    (lease taken over after all) are logged.
+    """
+    lease_seconds = lease_seconds or QUEUE_LEASE_SECONDS
+    stop = threading.Event()
+
+    def renew():
+        conn = connect(db_path)
+        try:
+            queue = WorkQueue(conn, lease_seconds=lease_seconds)
+            while not stop.wait(lease_seconds / 3):
+                held = queue.renew(worker_id, product_ids)
+                if held < len(product_ids):
+                    logger.warning(f"{worker_id}: lost the lease on {len(product_ids) - held} "
+                                   f"of {len(product_ids)} products")
+        except sqlite3.Error as e:
+            logger.error(f"{worker_id}: lease renewal failed: {e}")
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=renew, name=f"lease-{worker_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
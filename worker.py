@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Classify queued products with several worker processes sharing one database
+Safe to run from overlapping cron jobs: products are claimed under leases
+in the work_queue table, so no product is classified twice
+
+Each worker process gets an equal share of REQUESTS_PER_MINUTE and
+MAX_CONCURRENCY, so adding workers doesn't multiply the Claude request rate.
+
+Usage:
+    python worker.py --enqueue --workers 4     # queue unprocessed products, then classify them
+    python worker.py --workers 4               # work through whatever is queued
+    python worker.py --forever                 # keep polling for newly queued products
+    python worker.py --status                  # show queue counts
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+from metrics import instrument_run
+from work_queue import WorkQueue, lease_heartbeat
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 10  # Wait between claims when the queue is empty or fully leased
+
+
+def make_matcher(rate_share: int = 1):
+    from main import (WooCommerceHTSMatcher, WooConfig, SITE_URL, WOO_CONSUMER_KEY, WOO_CONSUMER_SECRET,
+                      ANTHROPIC_API_KEY, DATABASE_PATH)
+    config = WooConfig(SITE_URL, WOO_CONSUMER_KEY, WOO_CONSUMER_SECRET, ANTHROPIC_API_KEY)
+    return WooCommerceHTSMatcher(config, hts_db_path=DATABASE_PATH, rate_share=rate_share)
+
+
+@instrument_run('worker')
+def run_worker(worker_id: str, batch_size: int, forever: bool = False, rate_share: int = 1) -> int:
+    """Claim and classify batches until the queue is drained; returns products completed
+
+    A batch is marked done only after its results are flushed to SQLite, and
+    its lease is renewed while it is classified.
+    Fallback results (API errors) and batches that raise are released for
+    another attempt. Without `forever`, the worker keeps polling while other
+    workers hold leases, so it can take over if one of them dies. The worker
+    uses 1/rate_share of the Claude limits.
+    """
+    matcher = make_matcher(rate_share)
+    queue = WorkQueue(matcher.hts_db)
+    completed = 0
+
+    try:
+        while True:
+            products = queue.claim(worker_id, batch_size)
+            if not products:
+                if not forever and not queue.has_work():
+                    break
+                # Nothing to do for a while: don't leave rows sitting in the write buffer
+                matcher.flush_writes()
+                time.sleep(POLL_SECONDS)
+                continue
+
+            ids = [p['id'] for p in products]
+            try:
+                # Keep the lease while Claude backoff or retries slow the batch down
+                with lease_heartbeat(matcher.hts_db_path, worker_id, ids):
+                    results = matcher.process_products(products, record_run=False)
+                    matcher.flush_writes()
+            except Exception as e:
+                logger.exception(f"{worker_id}: batch of {len(products)} products failed")
+                matcher.flush_writes()
+                queue.release(worker_id, ids, error=str(e)[:500])
+                continue
+
+            failed = {r['product_id'] for r in results if r['hts_code'] == '9999.99.9999'}
+            completed += queue.complete(worker_id, [i for i in ids if i not in failed])
+            if failed:
+                queue.release(worker_id, failed, error='Claude API error (fallback result)')
+            logger.info(f"{worker_id}: {completed} products done ({queue.counts()})")
+    finally:
+        matcher.close()
+
+    logger.info(f"{worker_id}: queue drained after {completed} products")
+    return completed
+
+
+def exit_on_sigterm():
+    """Turn SIGTERM (kill, systemd stop) into SystemExit so finally blocks flush buffered rows"""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+
+def worker_main(index: int, workers: int, batch_size: int, forever: bool):
+    """Process entry point: every worker opens its own database connection"""
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - worker {index} - %(levelname)s - %(message)s',
+                        force=True)
+    exit_on_sigterm()
+    # All workers share one API key, so each takes its part of the rate limits
+    run_worker(f"{socket.gethostname()}-{os.getpid()}", batch_size, forever, rate_share=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify queued products with worker processes')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Worker processes to start; they split the Claude rate limits (default 2)')
+    parser.add_argument('--batch', type=int, default=10, help='Products claimed per lease')
+    parser.add_argument('--enqueue', action='store_true', help='Queue all unprocessed products first')
+    parser.add_argument('--forever', action='store_true', help='Keep polling for new products')
+    parser.add_argument('--status', action='store_true', help='Show queue counts and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    matcher = make_matcher()
+    queue = WorkQueue(matcher.hts_db)
+
+    if args.enqueue:
+        products = matcher.get_products_without_hts()
+        queued = queue.enqueue(products)
+        print(f"Queued {queued} of {len(products)} unprocessed products (others are being classified)")
+
+    print(f"Queue: {queue.counts()}")
+    if args.status:
+        matcher.close()
+        return
+
+    # The parent's connection must not be shared with forked children
+    matcher.close()
+
+    processes = [
+        multiprocessing.Process(target=worker_main, args=(i, args.workers, args.batch, args.forever))
+        for i in range(1, args.workers + 1)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    matcher = make_matcher()
+    print(f"Queue: {WorkQueue(matcher.hts_db).counts()}")
+    matcher.close()
+
+
+if __name__ == "__main__":
+    main()